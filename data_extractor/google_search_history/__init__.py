@@ -1,11 +1,21 @@
 """ Script to extract info from Google Browser History """
+# The web application runs this file on its own, so the extractor is kept in one module
+# pylint: disable=too-many-lines
 
 __version__ = '0.1.0'
 
+import codecs
+import contextlib
+import functools
+import html
+import itertools
 import json
 import re
+import urllib.parse
 import zipfile
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 import pytz
 
@@ -26,117 +36,1185 @@ For each period, we counted how many times you visited a news \
 website versus any another type of website (i.e., news/other). \
 While counting, we also took the time of day \
 (i.e., morning/afternoon/evening/night) into account.
+Finally, we listed the websites you visited most often in each period, \
+and divided your browsing into sessions: visits without a break of more \
+than half an hour. For your searches, we listed the words you searched for \
+most often in each period.
+If your export contains your search activity (My Activity), we counted \
+your searches and the search results you clicked on in the same way.
 """
-NEWSSITES = 'news.google.com|nieuws.nl|nos.nl|www.rtlnieuws.nl|nu.nl|\
-    at5.nl|ad.nl|bd.nl|telegraaf.nl|volkskrant.nl|parool.nl|\
-    metronieuws.nl|nd.nl|nrc.nl|rd.nl|trouw.nl'
+# Websites on these domains, or their subdomains, are news websites
+NEWS_DOMAINS = frozenset((
+    "news.google.com", "nieuws.nl", "nos.nl", "rtlnieuws.nl", "nu.nl",
+    "at5.nl", "ad.nl", "bd.nl", "telegraaf.nl", "volkskrant.nl", "parool.nl",
+    "metronieuws.nl", "nd.nl", "nrc.nl", "rd.nl", "trouw.nl"))
+# Part of a network location after the host
+NETLOC_END_RE = re.compile(r'[?#]')
+# Maximum number of distinct hosts whose classification is remembered
+HOST_CACHE_SIZE = 1 << 16
+# Maximum number of domains counted per period, which bounds the memory of the top domains
+DOMAIN_CAPACITY = 1000
+# Maximum number of search terms counted per period, which bounds the memory of the top terms
+TERM_CAPACITY = 1000
+# Search terms: words of at least two letters or digits that are not only digits
+TERM_RE = re.compile(r'(?!\d+\b)[^\W_]{2,}')
+# Common English and Dutch words that are not counted as search terms
+STOPWORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "who",
+    "why", "with", "aan", "als", "bij", "dat", "de", "die", "dit", "een", "en", "er", "het",
+    "hoe", "in", "is", "je", "met", "na", "naar", "niet", "of", "om", "op", "te", "tot",
+    "uit", "van", "voor", "waar", "wat", "wie", "zijn"))
+# Study configuration of the curfew research. Other studies use the same keys:
+# - period_name: column name of the periods in the output
+# - periods: labels of the periods, in order
+# - breakpoints: datetimes separating the periods, each one starts the next period
+# - times: times of day as (first hour, end hour), end hours at or below the first
+#   hour wrap around midnight; together they should cover every hour once
+# - websites: domains per website category, websites on other domains are 'other'
+# - top_domains: number of most visited domains listed per period, none if 0 or missing
+# - domain_capacity: number of domains counted per period, DOMAIN_CAPACITY if missing;
+#   visits of a domain are undercounted by at most the number of visits in the period
+#   divided by domain_capacity + 1
+# - session_gap: minutes without visits that end a browsing session, no sessions
+#   if 0 or missing
+# - top_terms: number of most searched terms listed per period, for search activity;
+#   none if 0 or missing
+# - term_capacity: number of terms counted per period, TERM_CAPACITY if missing,
+#   with the same guarantee as domain_capacity
+DEFAULT_STUDY = {
+    "period_name": "Curfew",
+    "periods": ("before", "during", "post"),
+    # Visits at END are during the curfew
+    "breakpoints": (START, END + timedelta(microseconds=1)),
+    "times": {"morning": (6, 12), "afternoon": (12, 18),
+              "evening": (18, 24), "night": (0, 6)},
+    "websites": {"news": NEWS_DOMAINS},
+    "top_domains": 10,
+    "session_gap": 30,
+    "top_terms": 10
+}
+# Chrome history in Takeout, BrowserHistory.json in older exports and Chrome/History.json in newer
+HISTORY_RE = re.compile(r'(?:^|/)(?:BrowserHistory\.json|Chrome/History\.json)$')
+# Search activity in Takeout, as HTML or JSON, in English and Dutch exports
+ACTIVITY_RE = re.compile(r'(?:^|/)(?:My Activity|Mijn activiteit)/(?:Search|Zoeken)/'
+                         r'(?:MyActivity|MijnActiviteit)\.(?:html|json)$')
+# Start of a record in MyActivity.html, and its first content cell with the link and time
+ACTIVITY_RECORD = '<div class="outer-cell'
+ACTIVITY_CONTENT_RE = re.compile(r'<div class="content-cell[^"]*--body-1">(.*?)</div>', re.S)
+# Links to a clicked search result (url) or to a search (search), and the parameter
+# with the encoded URL or query
+GOOGLE_LINK_RE = re.compile(r'https?://(?:www\.)?google\.[a-z.]+/(url|search)(?=\?)')
+LINK_PARAM_RE = re.compile(r'[?&](?:q|url)=([^&#]*)')
+ACTIVITY_LINK_RE = re.compile(r'<a href="([^"]*)"')
+# Times in MyActivity.html, e.g. 'Feb 1, 2021, 9:21:00 AM CET' or '1 feb. 2021 09:21:00 CET'
+ACTIVITY_TIME_RE = re.compile(
+    r'(?:(?P<day>\d{1,2})\.?\s(?P<month>[^\W\d]+)\.?|(?P<month2>[^\W\d]+)\.?\s(?P<day2>\d{1,2})),?'
+    r'\s(?P<year>\d{4}),?\s(?P<hour>\d{1,2}):(?P<minute>\d{2}):(?P<second>\d{2})'
+    r'(?:\s?(?P<ampm>[AaPp])\.?[Mm]\.?)?(?:\s(?P<zone>[A-Z]{3,4}))?')
+# Month numbers by the first three letters of English and Dutch month names
+MONTHS = {"jan": 1, "feb": 2, "mar": 3, "maa": 3, "mrt": 3, "apr": 4, "may": 5, "mei": 5,
+          "jun": 6, "jul": 7, "aug": 8, "sep": 9, "oct": 10, "okt": 10, "nov": 11, "dec": 12}
+# Offsets in hours of time zone abbreviations, times in other zones are taken to be in ZONE
+ZONE_OFFSETS = {"UTC": 0, "GMT": 0, "CET": 1, "CEST": 2}
+# Fields of a Browser History entry that are used
+FIELDS = ("time_usec", "page_transition", "url")
+# Number of bytes read at once from BrowserHistory.json
+READ_CHUNK_SIZE = 1 << 16
+# Number of Browser History entries classified at once
+BATCH_SIZE = 50000
+WHITESPACE = re.compile(r'\s*')
+ARRAY_SEPARATOR = re.compile(r'\s*([,\]])\s*')
 
 
-def _calculate(dates):
-    """Counts number of web searches per time unit (morning, afternoon,
+class _JsonStream:
+    """Incremental reader of a JSON file, which decodes one value at a time
+    Args:
+        file: binary file object
+        chunk_size: int, number of bytes read at once
+    """
+
+    def __init__(self, file, chunk_size=READ_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self, size):
+        """Drops the consumed text and appends the next part of the file
+        Args:
+            size: int, number of bytes to read
+        Returns:
+            read: bool, False if the end of the file was already reached
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character, '' at the end of the file"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read(self.chunk_size):
+                return ""
+
+    def expect(self, chars):
+        """Consumes the next character, which should be one of chars
+        Args:
+            chars: str, allowed characters
+        Returns:
+            char: str, consumed character
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of '{chars}' in JSON file, found '{char}'")
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decodes the next JSON value
+        Returns:
+            value: decoded value
+        """
+        if self.pos >= len(self.buffer) or self.buffer[self.pos].isspace():
+            self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete value: read more, growing the reads to keep long values linear
+                if not self._read(max(self.chunk_size, len(self.buffer))):
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self._read(self.chunk_size):
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self):
+        """Decodes the items of the JSON array at the current position one by one
+        Returns:
+            items: generator, decoded items
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            separator = ARRAY_SEPARATOR.match(self.buffer, self.pos)
+            if separator is None:
+                # The separator is in the next chunk
+                char = self.expect(",]")
+            else:
+                self.pos = separator.end()
+                char = separator.group(1)
+            if char == "]":
+                return
+
+
+def _iter_json_array(file, key):
+    """Yields the items of the array under a top level key of a JSON file one by one,
+        so the file is never held in memory at once
+    Args:
+        file: binary file object with a JSON object
+        key: str, key of the array
+    Returns:
+        items: generator, decoded items of the array
+    """
+    stream = _JsonStream(file)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        name = stream.decode()
+        stream.expect(":")
+        if name == key and stream.peek() == "[":
+            yield from stream.iter_array()
+        else:
+            stream.decode()
+        if stream.expect(",}") == "}":
+            return
+
+
+def _read_browser_history(file):
+    """Reads Browser History entries one by one, keeping only the used fields
+    Args:
+        file: binary file object of BrowserHistory.json
+    Returns:
+        entries: generator, dictionaries with the FIELDS of each entry
+    """
+    for entry in _iter_json_array(file, "Browser History"):
+        yield {field: entry[field] for field in FIELDS}
+
+
+def _activity_entry(url, time_usec):
+    """Converts a search activity record to a Browser History entry: a search is a visit
+        of the search page, a clicked search result a visit of the result
+    Args:
+        url: str, link of the record, '' if it has none
+        time_usec: int, timestamp in microseconds
+    Returns:
+        entry: dict, FIELDS of a Browser History entry and the search query,
+            which is None if the record is not a search
+    """
+    query = None
+    link = GOOGLE_LINK_RE.match(url)
+    param = link and LINK_PARAM_RE.search(url, link.end())
+    if param:
+        if link.group(1) == "url":
+            url = urllib.parse.unquote(param.group(1))
+        else:
+            query = urllib.parse.unquote_plus(param.group(1))
+    return {"time_usec": time_usec, "page_transition": "LINK", "url": url, "query": query}
+
+
+def _parse_activity_time(text):
+    """Parses a time as written in MyActivity.html
+    Args:
+        text: str, time in an English or Dutch format, see ACTIVITY_TIME_RE
+    Returns:
+        time_usec: int, timestamp in microseconds, None if the text has no time
+    """
+    match = ACTIVITY_TIME_RE.search(text)
+    if match is None:
+        return None
+    day, month, month2, day2, year, hour, minute, second, ampm, zone = match.groups()
+    month = MONTHS.get((month or month2)[:3].lower())
+    if month is None:
+        return None
+    hour = int(hour) % 12 + (12 if ampm in "Pp" else 0) if ampm else int(hour)
+    seconds = hour * 3600 + int(minute) * 60 + int(second)
+    if zone not in ZONE_OFFSETS:
+        local = datetime(int(year), month, int(day or day2)) + timedelta(seconds=seconds)
+        return int(ZONE.localize(local).timestamp()) * 1000000
+    day_start = _day_start(int(year), month, int(day or day2))
+    return (day_start + seconds - ZONE_OFFSETS[zone] * 3600) * 1000000
+
+
+@functools.lru_cache(maxsize=HOST_CACHE_SIZE)
+def _day_start(year, month, day):
+    """Computes the start of a day in UTC, most records of a day share it
+    Args:
+        year: int
+        month: int
+        day: int
+    Returns:
+        seconds: int, timestamp in seconds of midnight UTC
+    """
+    return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp())
+
+
+def _parse_iso_time(text):
+    """Parses a UTC time as written in MyActivity.json, e.g. '2021-02-01T08:21:00.123Z'
+    Args:
+        text: str, ISO 8601 time with up to microseconds
+    Returns:
+        time_usec: int, timestamp in microseconds
+    """
+    seconds = (_day_start(int(text[:4]), int(text[5:7]), int(text[8:10]))
+               + int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19]))
+    fraction = text[20:].rstrip("Z")
+    return seconds * 1000000 + (int(fraction.ljust(6, "0")[:6]) if fraction else 0)
+
+
+def _read_activity_html(file, chunk_size=READ_CHUNK_SIZE):
+    """Reads searches from MyActivity.html record by record, without parsing the whole document
+    Args:
+        file: binary file object of MyActivity.html
+        chunk_size: int, number of bytes read at once
+    Returns:
+        entries: generator, see _activity_entry
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    eof = False
+    while not eof:
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += decoder.decode(chunk, final=eof)
+        # The last record in the buffer may continue in the next chunk
+        end = len(buffer) if eof else buffer.rfind(ACTIVITY_RECORD)
+        if end <= 0:
+            continue
+        for match in ACTIVITY_CONTENT_RE.finditer(buffer, 0, end):
+            content = match.group(1)
+            time_usec = _parse_activity_time(html.unescape(content.rpartition("<br>")[2]))
+            if time_usec is not None:
+                link = ACTIVITY_LINK_RE.search(content)
+                yield _activity_entry(html.unescape(link.group(1)) if link else "", time_usec)
+        buffer = buffer[end:]
+
+
+def _read_activity_json(file):
+    """Reads searches from MyActivity.json record by record
+    Args:
+        file: binary file object of MyActivity.json
+    Returns:
+        entries: generator, see _activity_entry
+    """
+    for record in _JsonStream(file).iter_array():
+        if "time" in record:
+            yield _activity_entry(record.get("titleUrl", ""), _parse_iso_time(record["time"]))
+
+
+def load_domains(path):
+    """Loads a list of domains from a text file with one domain per line,
+        empty lines and lines starting with # are skipped
+    Args:
+        path: str or Path, text file with domains
+    Returns:
+        domains: frozenset, lower case domains
+    """
+    with open(path, encoding="utf8") as file:
+        lines = (line.strip().lower().rstrip(".") for line in file)
+        return frozenset(line for line in lines if line and not line.startswith("#"))
+
+
+@functools.lru_cache(maxsize=HOST_CACHE_SIZE)
+def _in_domains(netloc, domains):
+    """Checks if the host of a network location is one of the domains or a subdomain of them
+    Args:
+        netloc: str, part of a URL between '//' and the path, possibly followed by a query
+        domains: frozenset, lower case domains
+    Returns:
+        bool, True if the host or one of its parent domains is in domains
+    """
+    labels = _netloc_host(netloc).split(".")
+    return any(".".join(labels[i:]) in domains for i in range(len(labels)))
+
+
+@functools.lru_cache(maxsize=HOST_CACHE_SIZE)
+def _netloc_host(netloc):
+    """Extracts the host of a network location
+    Args:
+        netloc: str, part of a URL between '//' and the path, possibly followed by a query
+    Returns:
+        host: str, lower case host without user info, port and trailing dot
+    """
+    host = NETLOC_END_RE.split(netloc, 1)[0].rpartition("@")[2].partition(":")[0]
+    return host.lower().rstrip(".")
+
+
+def _domain_names(netlocs):
+    """Names the domains of network locations, as hosts without 'www.'
+    Args:
+        netlocs: np.array, distinct network locations
+    Returns:
+        domains: np.array, domain name per network location
+    """
+    hosts = (_netloc_host(netloc) for netloc in netlocs)
+    return np.array([host[4:] if host.startswith("www.") else host for host in hosts],
+                    dtype=object)
+
+
+def _factorize_netlocs(urls):
+    """Encodes the network location of each URL as an integer
+    Args:
+        urls: np.array, URLs
+    Returns:
+        codes: np.array, index in netlocs per URL
+        netlocs: np.array, distinct parts of the URLs between '//' and the path
+    """
+    netlocs = [url.partition("//")[2].partition("/")[0] for url in urls]
+    return pd.factorize(np.array(netlocs, dtype=object))
+
+
+def _classify_netlocs(netlocs, categories):
+    """Assigns network locations to the first website category that contains their host
+    Args:
+        netlocs: np.array, distinct network locations
+        categories: tuple, frozenset of domains per category
+    Returns:
+        classes: np.array, category index per network location,
+            len(categories) for other websites
+    """
+    def classify(netloc):
+        for index, domains in enumerate(categories):
+            if _in_domains(netloc, domains):
+                return index
+        return len(categories)
+
+    return np.array([classify(netloc) for netloc in netlocs], dtype=np.int64)
+
+
+def _load_columns(entries):
+    """Loads the used fields of the Browser History entries as arrays
+    Args:
+        entries: iterable, Browser History entries
+    Returns:
+        columns: dict, numpy array per field in FIELDS, and 'query' if the entries
+            are search activity
+    """
+    entries = list(entries)
+    columns = {
+        "time_usec": np.array([entry["time_usec"] for entry in entries], dtype=np.int64),
+        "page_transition": np.array([entry["page_transition"] for entry in entries],
+                                    dtype=object),
+        "url": np.array([entry["url"] for entry in entries], dtype=object)}
+    if entries and "query" in entries[0]:
+        columns["query"] = np.array([entry["query"] for entry in entries], dtype=object)
+    return columns
+
+
+def _classify_periods(time_usec, breakpoints):
+    """Assigns web visits to a period
+    Args:
+        time_usec: np.array, timestamps in microseconds
+        breakpoints: np.array, starts of the periods after the first in microseconds
+    Returns:
+        periods: np.array, period index per web visit
+    """
+    return np.searchsorted(breakpoints, time_usec, side='right')
+
+
+def _local_hours(time_usec):
+    """Converts timestamps to the hour of the day in ZONE
+    Args:
+        time_usec: np.array, timestamps in microseconds
+    Returns:
+        hours: np.array, hour of the day per timestamp
+    """
+    return pd.DatetimeIndex(pd.to_datetime(time_usec, unit='us', utc=True)) \
+        .tz_convert(ZONE).hour.to_numpy()
+
+
+def _compile_study(study):
+    """Checks a study configuration and converts it to lookup arrays
+    Args:
+        study: dict, study configuration, see DEFAULT_STUDY
+    Returns:
+        compiled: dict, labels, breakpoints in microseconds, time of day per hour
+            and domains per website category
+    """
+    periods = tuple(study["periods"])
+    breakpoints = np.array([int(breakpoint.timestamp() * 1e6)
+                            for breakpoint in study["breakpoints"]], dtype=np.int64)
+    if len(periods) != len(breakpoints) + 1 or np.any(np.diff(breakpoints) < 0):
+        raise ValueError("A study needs sorted breakpoints between each pair of periods")
+    hour_table = np.full(24, -1, dtype=np.int64)
+    for index, (first, end) in enumerate(study["times"].values()):
+        hours = np.arange(first, end if end > first else end + 24) % 24
+        if np.any(hour_table[hours] != -1):
+            raise ValueError(f"Times of day overlap at hours {hours.tolist()}")
+        hour_table[hours] = index
+    if np.any(hour_table == -1):
+        raise ValueError("Times of day should cover every hour")
+    top_domains = study.get("top_domains", 0)
+    domain_capacity = study.get("domain_capacity", DOMAIN_CAPACITY)
+    if top_domains < 0 or domain_capacity < top_domains:
+        raise ValueError("The domain capacity should be at least the number of top domains")
+    top_terms = study.get("top_terms", 0)
+    term_capacity = study.get("term_capacity", TERM_CAPACITY)
+    if top_terms < 0 or term_capacity < top_terms:
+        raise ValueError("The term capacity should be at least the number of top terms")
+    return {
+        "period_name": study.get("period_name", "Period"),
+        "periods": periods,
+        "breakpoints": breakpoints,
+        "times": tuple(study["times"]),
+        "hour_table": hour_table,
+        "websites": tuple(study["websites"]) + ("other",),
+        "domains": tuple(frozenset(domains) for domains in study["websites"].values()),
+        "top_domains": top_domains,
+        "domain_capacity": domain_capacity,
+        "session_gap": int(study.get("session_gap", 0) * 60 * 1000000),
+        "top_terms": top_terms,
+        "term_capacity": term_capacity
+    }
+
+
+def _count_domains(periods, netloc_codes, names, num_periods):
+    """Counts web visits per domain and period exactly
+    Args:
+        periods: np.array, period index per visit
+        netloc_codes: np.array, index in names per visit
+        names: np.array, domain name per distinct network location
+        num_periods: int, number of periods
+    Returns:
+        summaries: list, (visits per domain, error of 0) per period
+    """
+    counts = np.bincount(periods * len(names) + netloc_codes,
+                         minlength=num_periods * len(names)).reshape(num_periods, len(names))
+    summaries = []
+    for row in counts:
+        visited = row > 0
+        visits = pd.Series(row[visited], index=names[visited])
+        summaries.append((visits.groupby(level=0, sort=False).sum(), 0))
+    return summaries
+
+
+def _tokenize(queries):
+    """Splits search queries into terms, each distinct query once
+    Args:
+        queries: np.array, query per visit, None for visits that are not searches
+    Returns:
+        codes: np.array, index of the distinct query per visit, -1 if it has none
+        terms: pd.Series, lower case terms, except STOPWORDS, indexed by the
+            index of their distinct query
+    """
+    codes, distinct = pd.factorize(queries)
+    terms = pd.Series(distinct, dtype=object).str.lower().str.findall(TERM_RE).explode().dropna()
+    term_codes, words = pd.factorize(terms)
+    stopword = np.array([word in STOPWORDS for word in words], dtype=bool)
+    return codes, terms[~stopword[term_codes]]
+
+
+def _count_terms(periods, queries, num_periods):
+    """Counts search terms per period exactly
+    Args:
+        periods: np.array, period index per visit
+        queries: tuple, query codes per visit and terms per distinct query, see _tokenize
+        num_periods: int, number of periods
+    Returns:
+        summaries: list, (searches per term, error of 0) per period
+    """
+    codes, terms = queries
+    searched = codes >= 0
+    num_queries = codes.max() + 1 if searched.any() else 0
+    searches = np.bincount(periods[searched] * num_queries + codes[searched],
+                           minlength=num_periods * num_queries).reshape(num_periods, num_queries)
+    positions = terms.index.to_numpy(dtype=np.int64)
+    summaries = []
+    for row in searches:
+        counts = pd.Series(row[positions], index=terms.to_numpy())
+        counts = counts[counts > 0].groupby(level=0, sort=False).sum()
+        summaries.append((counts, 0))
+    return summaries
+
+
+def _prune_counts(counts, capacity):
+    """Keeps at most capacity items by subtracting the count of the (capacity + 1)-th
+        most frequent item from all items (Misra-Gries)
+    Args:
+        counts: pd.Series, count per item, such as visits per domain
+        capacity: int, maximum number of items kept
+    Returns:
+        counts: pd.Series, count per remaining item, lower bounds of the true counts
+        decrement: int, number subtracted from each count
+    """
+    if len(counts) <= capacity:
+        return counts, 0
+    values = counts.to_numpy()
+    decrement = int(np.partition(values, len(values) - capacity - 1)[len(values) - capacity - 1])
+    counts = counts - decrement
+    return counts[counts > 0], decrement
+
+
+def _merge_counts(summaries, capacity):
+    """Merges summaries of the counts per item, such as visits per domain,
+        keeping at most capacity items per period
+    Args:
+        summaries: list, summaries of the same periods, each a list of
+            (count per item, error) per period
+        capacity: int, maximum number of items kept per period
+    Returns:
+        merged: list, (count per item, error) per period, where the error is the
+            maximum number by which the count of an item is too low
+    """
+    merged = []
+    for period in zip(*summaries):
+        counts = pd.concat([counts for counts, _ in period])
+        counts, decrement = _prune_counts(counts.groupby(level=0, sort=False).sum(), capacity)
+        merged.append((counts, sum(error for _, error in period) + decrement))
+    return merged
+
+
+def _drop_reloads(columns):
+    """Drops the entries that reload a page
+    Args:
+        columns: dict, numpy array per field in FIELDS, see _load_columns
+    Returns:
+        visits: dict, timestamps ('time_usec'), URLs ('url') and, for search
+            activity, queries ('query') of the other entries
+    """
+    # Only a handful of distinct transitions exist, so they are lowered once each
+    codes, transitions = pd.factorize(columns["page_transition"])
+    reload = np.array([transition.lower() == "reload" for transition in transitions], dtype=bool)
+    keep = ~reload[codes]
+    return {field: values[keep] for field, values in columns.items()
+            if field != "page_transition"}
+
+
+def _flag_repeats(time_usec, keys, window, counted=0):
+    """Flags visits that follow a visit of the same key within the window,
+        by comparing each visit with the previous one after sorting by key and time
+    Args:
+        time_usec: np.array, timestamps in microseconds
+        keys: np.array, integer code of the URL or host per visit
+        window: int, maximum number of microseconds between repeated visits
+        counted: int, number of leading visits that were counted before, the other
+            visits in a chain of repeats with one of them are repeats as well
+    Returns:
+        repeat: np.array, True for visits that repeat another visit
+    """
+    order = np.lexsort((time_usec, keys))
+    sorted_time = time_usec[order]
+    sorted_keys = keys[order]
+    close = np.zeros(len(order), dtype=bool)
+    close[1:] = ((sorted_keys[1:] == sorted_keys[:-1])
+                 & (sorted_time[1:] - sorted_time[:-1] <= window))
+    # Chains of repeats that were partly counted before, e.g. in a history
+    # sorted backwards in time, are not counted again
+    chains = np.cumsum(~close) - 1
+    counted_chains = np.bincount(chains, weights=order < counted) > 0
+    repeat = np.empty(len(order), dtype=bool)
+    repeat[order] = close | counted_chains[chains]
+    return repeat
+
+
+def _drop_repeats(visits, carry, window, key):
+    """Drops rapid repeats of a visit, such as redirect chains and repeated clicks
+    Args:
+        visits: dict, timestamps and URLs of a batch, see _drop_reloads
+        carry: dict, timestamps and URLs of the visits of the previous batches within
+            the window of their earliest or latest visit, which can be repeated in this
+            batch; exact if the history is sorted by time
+        window: int, maximum number of microseconds between repeated visits
+        key: str, 'url' to match visits of the same URL, 'host' of the same host
+    Returns:
+        visits: dict, visits of the batch without repeats
+        carry: dict, the carry for the next batch, including this batch
+        collapsed: int, number of dropped visits
+    """
+    if len(visits["time_usec"]) == 0:
+        return visits, carry, 0
+    time_usec = np.concatenate([carry["time_usec"], visits["time_usec"]])
+    urls = np.concatenate([carry["url"], visits["url"]])
+    if key == "host":
+        netloc_codes, netlocs = _factorize_netlocs(urls)
+        hosts = np.array([_netloc_host(netloc) for netloc in netlocs], dtype=object)
+        keys = pd.factorize(hosts)[0][netloc_codes]
+    else:
+        keys = pd.factorize(urls)[0]
+    counted = len(carry["time_usec"])
+    keep = ~_flag_repeats(time_usec, keys, window, counted)[counted:]
+    # The carried visits stay in the carry while they are near an end, as a batch
+    # can span less than the window
+    near_end = ((time_usec <= time_usec.min() + window)
+                | (time_usec >= time_usec.max() - window))
+    return ({field: values[keep] for field, values in visits.items()},
+            {"time_usec": time_usec[near_end], "url": urls[near_end]},
+            int(len(keep) - keep.sum()))
+
+
+def _count_visits(visits, studies):
+    """Counts web visits per period, website category and time of day for each study,
+        the work shared by the studies is done once
+    Args:
+        visits: dict, timestamps and URLs of the visits, see _drop_reloads
+        studies: list, compiled study configurations
+    Returns:
+        counts: list, counts with the shape (periods, websites, times) per study
+        domains: list, per study the visits per domain of each period, see _count_domains,
+            or None if the study lists no top domains
+        sessions: list, per study the sessions in the visits, see _split_sessions,
+            or None if the study has no sessions
+        terms: list, per study the searches per term of each period, see _count_terms,
+            or None if the study lists no top terms or the visits have no queries
+    """
+    time_usec = visits["time_usec"]
+    order = None
+    if any(study["session_gap"] for study in studies):
+        order = np.argsort(time_usec, kind="stable")
+    hours = _local_hours(time_usec)
+    netloc_codes, netlocs = _factorize_netlocs(visits["url"])
+    names = None
+    if any(study["top_domains"] for study in studies):
+        names = _domain_names(netlocs)
+    queries = None
+    if "query" in visits and any(study["top_terms"] for study in studies):
+        queries = _tokenize(visits["query"])
+
+    counts = []
+    domains = []
+    sessions = []
+    search_terms = []
+    for study in studies:
+        shape = (len(study["periods"]), len(study["websites"]), len(study["times"]))
+        periods = _classify_periods(time_usec, study["breakpoints"])
+        websites = _classify_netlocs(netlocs, study["domains"])[netloc_codes]
+        times = study["hour_table"][hours]
+        index = (periods * shape[1] + websites) * shape[2] + times
+        counts.append(np.bincount(index, minlength=np.prod(shape)).reshape(shape))
+        domains.append(_count_domains(periods, netloc_codes, names, shape[0])
+                       if study["top_domains"] else None)
+        sessions.append(_split_sessions(time_usec[order], websites[order], shape[1],
+                                        study["session_gap"])
+                        if study["session_gap"] else None)
+        search_terms.append(_count_terms(periods, queries, shape[0])
+                            if "query" in visits and study["top_terms"] else None)
+    return counts, domains, sessions, search_terms
+
+
+def _split_sessions(time_usec, websites, num_websites, gap):
+    """Splits time sorted visits into sessions wherever the time between visits exceeds the gap
+    Args:
+        time_usec: np.array, sorted timestamps in microseconds
+        websites: np.array, website category per visit
+        num_websites: int, number of website categories
+        gap: int, maximum number of microseconds between visits of a session
+    Returns:
+        sessions: dict, per session the timestamps of the first ('start') and last
+            ('end') visit and the number of visits per website category ('visits')
+    """
+    first = np.ones(len(time_usec), dtype=bool)
+    first[1:] = np.diff(time_usec) > gap
+    session = np.cumsum(first) - 1
+    last = np.ones(len(time_usec), dtype=bool)
+    last[:-1] = first[1:]
+    visits = np.bincount(session * num_websites + websites,
+                         minlength=first.sum() * num_websites).reshape(-1, num_websites)
+    return {"start": time_usec[first], "end": time_usec[last], "visits": visits}
+
+
+def _merge_sessions(parts, gap):
+    """Merges sessions of different batches that are less than the gap apart or overlap,
+        so sessions that continue in another batch are counted once
+    Args:
+        parts: list, sessions, see _split_sessions
+        gap: int, maximum number of microseconds between visits of a session
+    Returns:
+        sessions: dict, merged sessions sorted by start, see _split_sessions
+    """
+    start = np.concatenate([part["start"] for part in parts])
+    order = np.argsort(start, kind="stable")
+    start = start[order]
+    end = np.concatenate([part["end"] for part in parts])[order]
+    visits = np.concatenate([part["visits"] for part in parts])[order]
+    if len(start) == 0:
+        return {"start": start, "end": end, "visits": visits}
+    first = np.ones(len(start), dtype=bool)
+    first[1:] = start[1:] - np.maximum.accumulate(end)[:-1] > gap
+    index = np.flatnonzero(first)
+    return {"start": start[first], "end": np.maximum.reduceat(end, index),
+            "visits": np.add.reduceat(visits, index, axis=0)}
+
+
+def _scan(data, studies, batch_size=BATCH_SIZE, repeat_window=None, repeat_key="url"):
+    """Counts the web visits of all studies in one pass over the browser history
+    Args:
+        data: BrowserHistory.json file, the entries under "Browser History"
+            can be any iterable, such as a generator
+        studies: list, compiled study configurations
+        batch_size: int, number of entries processed at once
+        repeat_window: float, visits of the same URL or host within this number of
+            seconds of the previous one are not counted, None to count every visit
+        repeat_key: str, 'url' or 'host', what repeated visits have in common
+    Returns:
+        scan: dict with
+            - counts: list, counts with the shape (periods, websites, times) per study
+            - domains: list, per study the summary of visits per domain, see _merge_counts,
+              or None if the study lists no top domains
+            - sessions: list, per study the sessions, see _merge_sessions,
+              or None if the study has no sessions
+            - terms: list, per study the summary of searches per term, see _merge_counts,
+              or None if the study lists no top terms or the history has no queries
+            - bounds: list, timestamps in microseconds of the earliest and latest
+              web search, empty if there are none
+            - collapsed: int, number of repeated visits that are not counted
+    """
+    if repeat_key not in ("url", "host"):
+        raise ValueError(f"Repeated visits are matched on 'url' or 'host', not '{repeat_key}'")
+    entries = iter(data["Browser History"])
+    scan = {
+        "counts": [np.zeros((len(study["periods"]), len(study["websites"]),
+                             len(study["times"])), dtype=np.int64) for study in studies],
+        "domains": [[(pd.Series(dtype=np.int64), 0)] * len(study["periods"])
+                    if study["top_domains"] else None for study in studies],
+        "sessions": [[] for _ in studies],
+        "terms": [None] * len(studies),
+        "bounds": [],
+        "collapsed": 0
+    }
+    carry = {"time_usec": np.array([], dtype=np.int64), "url": np.array([], dtype=object)}
+    while True:
+        columns = _load_columns(itertools.islice(entries, batch_size))
+        if len(columns["time_usec"]) == 0:
+            break
+        visits = _drop_reloads(columns)
+        if repeat_window is not None:
+            visits, carry, repeats = _drop_repeats(visits, carry, int(repeat_window * 1e6),
+                                                   repeat_key)
+            scan["collapsed"] += repeats
+        _add_batch(scan, visits, studies)
+    scan["sessions"] = [_merge_sessions(parts, study["session_gap"])
+                        if study["session_gap"] else None
+                        for study, parts in zip(studies, scan["sessions"])]
+    if scan["bounds"]:
+        scan["bounds"] = [min(scan["bounds"]), max(scan["bounds"])]
+    return scan
+
+
+def _add_batch(scan, visits, studies):
+    """Counts a batch of web visits and adds the counts to a scan in progress
+    Args:
+        scan: dict, see _scan, with the sessions of each batch in a list per study
+            and the bounds of each batch
+        visits: dict, timestamps and URLs of the visits, see _drop_reloads
+        studies: list, compiled study configurations
+    """
+    batch_counts, batch_domains, batch_sessions, batch_terms = _count_visits(visits, studies)
+    for total, batch in zip(scan["counts"], batch_counts):
+        total += batch
+    scan["domains"] = [summary and _merge_counts([summary, batch], study["domain_capacity"])
+                       for study, summary, batch
+                       in zip(studies, scan["domains"], batch_domains)]
+    scan["terms"] = [_merge_summaries([summary, batch], study["term_capacity"])
+                     for study, summary, batch in zip(studies, scan["terms"], batch_terms)]
+    for parts, batch in zip(scan["sessions"], batch_sessions):
+        parts.append(batch)
+    time_usec = visits["time_usec"]
+    if len(time_usec):
+        scan["bounds"].extend((time_usec.min(), time_usec.max()))
+
+
+def _merge_summaries(summaries, capacity):
+    """Merges the summaries that exist, see _merge_counts
+    Args:
+        summaries: list, summaries of the same periods or None
+        capacity: int, maximum number of items kept per period
+    Returns:
+        merged: list, (count per item, error) per period, None if no summary exists
+    """
+    summaries = [summary for summary in summaries if summary is not None]
+    return _merge_counts(summaries, capacity) if summaries else None
+
+
+def _merge_scans(scans, studies):
+    """Adds up the counts of several scans
+    Args:
+        scans: list, scans as returned by _scan
+        studies: list, compiled study configurations
+    Returns:
+        scan: dict, the merged scan, see _scan; without scans, counts
+            and the other results per study are empty
+    """
+    if not scans:
+        return {"counts": [], "domains": [], "sessions": [], "terms": [], "bounds": [],
+                "collapsed": 0}
+    merged = {
+        "counts": [sum(study_counts) for study_counts in zip(*(scan["counts"] for scan in scans))],
+        "domains": [],
+        "sessions": [],
+        "terms": [],
+        "bounds": [bound for scan in scans for bound in scan["bounds"]],
+        "collapsed": sum(scan["collapsed"] for scan in scans)
+    }
+    for index, study in enumerate(studies):
+        summaries = [scan["domains"][index] for scan in scans]
+        merged["domains"].append(summaries[0] and _merge_counts(summaries,
+                                                                study["domain_capacity"]))
+        parts = [scan["sessions"][index] for scan in scans]
+        merged["sessions"].append(parts[0] and _merge_sessions(parts, study["session_gap"]))
+        merged["terms"].append(_merge_summaries([scan["terms"][index] for scan in scans],
+                                                study["term_capacity"]))
+    return merged
+
+
+def _time_range(bounds):
+    """Converts the bounds of scans to datetimes
+    Args:
+        bounds: list, timestamps in microseconds, see _merge_scans
+    Returns:
+        earliest: datetime, earliest web search
+        latest: datetime, latest web search
+    """
+    if not bounds:
+        raise ValueError("The browser history has no web visits")
+    earliest = datetime.fromtimestamp(min(bounds)/1e6).astimezone(ZONE)
+    latest = datetime.fromtimestamp(max(bounds)/1e6).astimezone(ZONE)
+    return earliest, latest
+
+
+def _calculate(study, counts):
+    """Formats the number of web searches per time unit (morning, afternoon,
         evening, night), per website-period combination
     Args:
-        dates: dictionary, dates per website (news vs. other) per period
-            (pre, during, post curfew)
+        study: dict, compiled study configuration
+        counts: np.array, counts with the shape (periods, websites, times)
     Returns:
         results: list, number of times websites are visted per unit of time
     """
     results = []
-    for category in dates.keys():
-        sub = {'morning': 0, 'afternoon': 0,
-               'evening': 0, 'night': 0}
-        sub['Curfew'], sub['Website'] = category.split('_')
-        for date in dates[category]:
-            hour = date.hour
-            if 0 <= hour < 6:
-                sub['night'] += 1
-            elif 6 <= hour < 12:
-                sub['morning'] += 1
-            elif 12 <= hour < 18:
-                sub['afternoon'] += 1
-            elif 18 <= hour < 24:
-                sub['evening'] += 1
+    for website, period in itertools.product(range(len(study["websites"])),
+                                             range(len(study["periods"]))):
+        sub = dict(zip(study["times"], counts[period, website].tolist()))
+        sub[study["period_name"]] = study["periods"][period]
+        sub['Website'] = study["websites"][website]
         results.append(sub)
     return results
 
 
-def _extract(data):
+def _tidy(study, counts):
+    """Makes a tidy dataframe of the web visits of a study
+    Args:
+        study: dict, compiled study configuration
+        counts: np.array, counts with the shape (periods, websites, times)
+    Returns:
+        data_frame: pd.DataFrame, number of searches per period, website and time of day
+    """
+    periods, websites, times = counts.shape
+    return pd.DataFrame({
+        study["period_name"]: np.repeat(np.array(study["periods"], dtype=object), websites * times),
+        "Website": np.tile(np.repeat(np.array(study["websites"], dtype=object), times), periods),
+        "Time": np.tile(np.array(study["times"], dtype=object), periods * websites),
+        "Searches": counts.ravel()
+    })
+
+
+def _top_table(study, summaries, top, item, count):
+    """Makes a dataframe of the most frequent items per period of a study
+    Args:
+        study: dict, compiled study configuration
+        summaries: list, (count per item, error) per period, see _merge_counts
+        top: int, number of items listed per period
+        item: str, column name of the items
+        count: str, column name of the counts
+    Returns:
+        data_frame: pd.DataFrame, top items per period with their counts,
+            which may be too low by at most the error of the period
+    """
+    frames = []
+    for period, (counts, error) in zip(study["periods"], summaries):
+        table = (pd.DataFrame({item: counts.index.to_numpy(dtype=object),
+                               count: counts.to_numpy(dtype=np.int64)})
+                 .sort_values([count, item], ascending=[False, True])
+                 .head(top))
+        table.insert(0, study["period_name"], period)
+        table["Error"] = error
+        frames.append(table)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _session_table(study, sessions):
+    """Makes a dataframe of the browsing sessions per period and time of day of their start
+    Args:
+        study: dict, compiled study configuration
+        sessions: dict, sessions, see _merge_sessions
+    Returns:
+        data_frame: pd.DataFrame, number of sessions, median duration in minutes,
+            median number of visits and mean share of each website category
+            (except other) of the visits of a session, per period and time of day
+    """
+    visits = sessions["visits"]
+    total = visits.sum(axis=1)
+    frame = pd.DataFrame({
+        "group": (_classify_periods(sessions["start"], study["breakpoints"]) * len(study["times"])
+                  + study["hour_table"][_local_hours(sessions["start"])]),
+        "Median minutes": (sessions["end"] - sessions["start"]) / 60e6,
+        "Median visits": total
+    })
+    for index, website in enumerate(study["websites"][:-1]):
+        frame[f"Share {website}"] = visits[:, index] / total
+    groups = range(len(study["periods"]) * len(study["times"]))
+    grouped = frame.groupby("group")
+    shares = [column for column in frame.columns if column.startswith("Share ")]
+    table = pd.concat([grouped.size().reindex(groups, fill_value=0).rename("Sessions"),
+                       grouped[["Median minutes", "Median visits"]].median().reindex(groups),
+                       grouped[shares].mean().reindex(groups)], axis=1)
+    table.insert(0, "Time", np.tile(np.array(study["times"], dtype=object), len(study["periods"])))
+    table.insert(0, study["period_name"],
+                 np.repeat(np.array(study["periods"], dtype=object), len(study["times"])))
+    return table.reset_index(drop=True)
+
+
+def _data_frames(studies, scan):
+    """Makes the dataframes of all studies
+    Args:
+        studies: list, compiled study configurations
+        scan: dict, merged scan, see _merge_scans
+    Returns:
+        data_frames: list, per study the tidy dataframe of web visits,
+            followed by its top domains, its sessions and its top search terms
+            if the study has them
+    """
+    data_frames = []
+    for study, study_counts, domains, sessions, terms in zip(
+            studies, scan["counts"], scan["domains"], scan["sessions"], scan["terms"]):
+        data_frames.append(_tidy(study, study_counts))
+        if domains is not None:
+            data_frames.append(_top_table(study, domains, study["top_domains"], "Domain",
+                                          "Visits"))
+        if sessions is not None:
+            data_frames.append(_session_table(study, sessions))
+        if terms is not None:
+            data_frames.append(_top_table(study, terms, study["top_terms"], "Term", "Searches"))
+    return data_frames
+
+
+def _extract(data, batch_size=BATCH_SIZE, domains=NEWS_DOMAINS):
     """Extracts relevant data from browser history:
         - number of times websites (news vs. other) are visited
         - at which specific periods (pre, during, and post curfew),
         - on which specific times a day (morning, afternoon, evening, night).
     Args:
-        data: BrowserHistory.json file
+        data: BrowserHistory.json file, the entries under "Browser History"
+            can be any iterable, such as a generator
+        batch_size: int, number of entries processed at once
+        domains: frozenset, domains of news websites, see load_domains
     Returns:
         results: list, number of times websites are visted per unit of time,
             per moment
         earliest: datetime, earliest web search
         latest: datetime, latest web search
     """
-    # Count number of news vs. other websites per time period
-    # (i.e., pre/during/after Dutch curfew)
-    dates = {'before_news': [], 'during_news': [], 'post_news': [],
-             'before_other': [], 'during_other': [], 'post_other': []}
-    timestamps = [d["time_usec"]
-                  for d in data["Browser History"] if d["page_transition"].lower() != "reload"]
-    earliest = datetime.fromtimestamp(min(timestamps)/1e6).astimezone(ZONE)
-    latest = datetime.fromtimestamp(max(timestamps)/1e6).astimezone(ZONE)
-    for data_unit in data["Browser History"]:
-        if data_unit["page_transition"].lower() != "reload":
-            time = datetime.fromtimestamp(data_unit["time_usec"]/1e6).astimezone(ZONE)
-            if time < START and re.findall(NEWSSITES, data_unit["url"]):
-                dates['before_news'].append(time)
-            elif time > END and re.findall(NEWSSITES, data_unit["url"]):
-                dates['post_news'].append(time)
-            elif time < START and not re.findall(NEWSSITES, data_unit["url"]):
-                dates['before_other'].append(time)
-            elif time > END and not re.findall(NEWSSITES, data_unit["url"]):
-                dates['post_other'].append(time)
-            elif re.findall(NEWSSITES, data_unit["url"]):
-                dates['during_news'].append(time)
-            elif not re.findall(NEWSSITES, data_unit["url"]):
-                dates['during_other'].append(time)
+    study = _compile_study(dict(DEFAULT_STUDY, websites={"news": domains}, top_domains=0,
+                                session_gap=0))
+    scan = _scan(data, [study], batch_size)
+    (counts,) = scan["counts"]
+    earliest, latest = _time_range(scan["bounds"])
     # Calculate times visited per time unit
     # (i.e., morning, afternoon, evening, night)
-    results = _calculate(dates)
+    results = _calculate(study, counts)
     return results, earliest, latest
 
 
-def process(file_data):
+def extract_studies(data, studies, batch_size=BATCH_SIZE):
+    """Extracts the web visits of several studies in one pass over the browser history
+    Args:
+        data: BrowserHistory.json file, the entries under "Browser History"
+            can be any iterable, such as a generator
+        studies: list, study configurations, see DEFAULT_STUDY
+        batch_size: int, number of entries processed at once
+    Returns:
+        data_frames: list, tidy dataframe of web visits per study, each followed
+            by dataframes of its top domains, sessions and top search terms
+            if the study has them
+        earliest: datetime, earliest web search
+        latest: datetime, latest web search
+    """
+    compiled = [_compile_study(study) for study in studies]
+    scan = _scan(data, compiled, batch_size)
+    return (_data_frames(compiled, scan), *_time_range(scan["bounds"]))
+
+
+def _run_concurrently(func, items):
+    """Applies func to every item in threads, or one by one once no more threads can be
+        started, which is the case from the start in e.g. Pyodide
+    Args:
+        func: callable
+        items: iterable, arguments of func
+    Returns:
+        results: list, results of func in the order of items
+    """
+    items = list(items)
+    results = []
+    if len(items) > 1:
+        # Decompression releases the GIL, so members of different parts are read in parallel
+        with ThreadPoolExecutor() as executor:
+            futures = []
+            try:
+                for item in items:
+                    futures.append(executor.submit(func, item))
+            except RuntimeError:
+                # a thread could not be started
+                pass
+            results = [future.result() for future in futures]
+    return results + [func(item) for item in items[len(results):]]
+
+
+def _index_archives(zfiles):
+    """Indexes the members of all parts of a (split) Takeout export by name,
+        using the central directory of each part
+    Args:
+        zfiles: list, zipfile.ZipFile per part
+    Returns:
+        index: dict, (zipfile, ZipInfo) per member name
+    """
+    index = {}
+    for zfile in zfiles:
+        for info in zfile.infolist():
+            index.setdefault(info.filename, (zfile, info))
+    return index
+
+
+def _scan_member(zfile, info, studies, **options):
+    """Streams a browser history or search activity member of an archive
+        and counts its web visits
+    Args:
+        zfile: zipfile.ZipFile, archive part
+        info: zipfile.ZipInfo, browser history or search activity member
+        studies: list, compiled study configurations
+        options: keyword arguments of _scan
+    Returns:
+        scan: dict, see _scan
+    """
+    if HISTORY_RE.search(info.filename):
+        read = _read_browser_history
+    elif info.filename.endswith(".html"):
+        read = _read_activity_html
+    else:
+        read = _read_activity_json
+    with zfile.open(info) as file:
+        return _scan({"Browser History": read(file)}, studies, **options)
+
+
+def process(file_data, studies=None, repeat_window=None, repeat_key="url"):
     """ Opens BrowserHistory.json and return relevant data pre, during,
         and post Dutch curfew
     Args:
-        file_data: Takeout zipfile
+        file_data: Takeout zipfile, or a list of the parts of a split Takeout export
+            (takeout-...-001.zip, takeout-...-002.zip, ...)
+        studies: list, study configurations evaluated in the same pass,
+            [DEFAULT_STUDY] if None
+        repeat_window: float, visits of the same URL or host within this number of
+            seconds of the previous one are not counted, None to count every visit
+        repeat_key: str, 'url' or 'host', what repeated visits have in common
     Returns:
         summary: summary of read file(s), earliest and latest websearch
         data_frames: pd.dataframe, overview of news vs. other searches
-            per moment per time unit
-    """
-    # Read BrowserHistory.json
-    with zipfile.ZipFile(file_data) as zfile:
-        file_list = zfile.namelist()
-        for name in file_list:
-            if re.search('BrowserHistory.json', name):
-                data = json.loads(zfile.read(name).decode("utf8"))
-    # Extract pre/during/post website searches,
-    # earliest webclick and latest webclick
-    results, earliest, latest = _extract(data)
-    # Make tidy dataframe of webclicks
-    df_results = pd.melt(pd.json_normalize(results), ["Curfew", "Website"],
-                         var_name="Time", value_name="Searches")
-    data_frame = df_results.sort_values(
-        ['Curfew', 'Website']).reset_index(drop=True)
+            per moment per time unit, one per study, each followed by the top
+            domains and the sessions per moment if the study has them
+        search_data_frames: pd.dataframe, the same overview of the searches and clicked
+            search results in the search activity, with the top search terms per moment,
+            empty if the export has none
+    """
+    parts = file_data if isinstance(file_data, (list, tuple)) else [file_data]
+    compiled = [_compile_study(study)
+                for study in ([DEFAULT_STUDY] if studies is None else studies)]
+    with contextlib.ExitStack() as stack:
+        zfiles = [stack.enter_context(zipfile.ZipFile(part)) for part in parts]
+        index = _index_archives(zfiles)
+        histories = [name for name in sorted(index) if HISTORY_RE.search(name)]
+        activities = [name for name in sorted(index) if ACTIVITY_RE.search(name)]
+        if not histories and not activities:
+            raise FileNotFoundError(
+                "No BrowserHistory.json, History.json or MyActivity in the Takeout export")
+        # Stream the browser histories and search activity and extract tidy dataframes
+        # of webclicks, earliest webclick and latest webclick
+        scans = _run_concurrently(
+            lambda name: _scan_member(*index[name], compiled, repeat_window=repeat_window,
+                                      repeat_key=repeat_key),
+            histories + activities)
+    browsing = _merge_scans(scans[:len(histories)], compiled)
+    searching = _merge_scans(scans[len(histories):], compiled)
+    earliest, latest = _time_range(browsing["bounds"] + searching["bounds"])
     # Return output
+    read_files = ", ".join(name.rsplit("/", 1)[-1] for name in histories + activities)
     text = f"""{TEXT}
-    read_files: BrowserHistory.json
+    read_files: {read_files}
     Your earliest web search was on {earliest.strftime('%A %d-%m-%Y at %H:%M:%S')},
     The Dutch curfew took place between {START.strftime('%A %d-%m-%Y %H:%M:%S')} \
     and {END.strftime('%A %d-%m-%Y %H:%M:%S')},
     Your latest web search was on {latest.strftime('%A %d-%m-%Y at %H:%M:%S')}.
     """
+    if repeat_window is not None:
+        collapsed = browsing["collapsed"] + searching["collapsed"]
+        text += (f"collapsed_visits: {collapsed} visits repeated the same {repeat_key} "
+                 f"within {repeat_window:g} seconds and were not counted.\n    ")
     return {
         "summary": text,
-        "data_frames": [
-            data_frame
-        ]
+        "data_frames": _data_frames(compiled, browsing),
+        "search_data_frames": _data_frames(compiled, searching)
     }
@@ -1,120 +1,976 @@
 """Script to extract data from Google Semantic History Location zipfile"""
 __version__ = '0.1.0'
 
+import collections
 import json
-import itertools
+import os
 import re
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import numpy as np
 import pandas as pd
 
 
-# years and months to extract data for
+# years and months to extract data for, unless other periods are given
 YEARS = [2019, 2020, 2021]
 MONTHS = ["JANUARY"]
+MONTH_NAMES = [
+    "JANUARY", "FEBRUARY", "MARCH", "APRIL", "MAY", "JUNE",
+    "JULY", "AUGUST", "SEPTEMBER", "OCTOBER", "NOVEMBER", "DECEMBER"
+]
+# month files in Semantic Location History, e.g. 2021/2021_JANUARY.json
+MONTH_FILE_RE = re.compile(rf'(?:^|/)(\d{{4}})_({"|".join(MONTH_NAMES)})\.json$')
+# fields to keep per timeline object; True keeps the whole value, other fields
+# (e.g. waypointPath, simplifiedRawPath, otherCandidateLocations, childVisits and
+# activities) are skipped without decoding them
+LOCATION_PROJECTION = {"latitudeE7": True, "longitudeE7": True}
+TIMELINE_PROJECTION = {
+    "placeVisit": {
+        "location": {"placeId": True, **LOCATION_PROJECTION},
+        "duration": True
+    },
+    "activitySegment": {
+        "startLocation": LOCATION_PROJECTION,
+        "endLocation": LOCATION_PROJECTION,
+        "duration": True,
+        "distance": True,
+        "activityType": True
+    }
+}
+# quotes (1), opening (2) and closing (3) brackets in JSON, indexed in chunks of bytes
+STRUCTURE = bytes({ord('"'): 1, ord("{"): 2, ord("["): 2, ord("}"): 3, ord("]"): 3}.get(byte, 0)
+                  for byte in range(256))
+# change of depth per structure code
+STEPS = np.array([0, 0, 1, -1], dtype=np.int8)
+CHUNK_SIZE = 2**20
+# objects up to this number of bytes are decoded at once and then projected,
+# which is faster than skipping their fields one by one
+SMALL_OBJECT = 1024
+WHITESPACE_RE = re.compile(rb'[ \t\n\r]*')
+SEPARATOR_RE = re.compile(rb'[ \t\n\r]*(?:,[ \t\n\r]*)?')
+# a field of an object, with its value if the value is a string, number or literal
+FIELD_RE = re.compile(rb'[ \t\n\r,]*"([^"\\]*(?:\\.[^"\\]*)*)"[ \t\n\r]*:[ \t\n\r]*'
+                      rb'("[^"\\]*(?:\\.[^"\\]*)*"|[^,:\[\]{}\s]+)?')
+STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+SCALAR_RE = re.compile(rb'[^,:\]}\s]+')
+DECODER = json.JSONDecoder()
 NPLACES = 3
+# summary, {periods} is replaced by the extracted months, see _describe_periods
 TEXT = "This study examines the change in travel behaviour during the COVID-19 pandemic. \
-We therefore examined your Google semantic Location History data for January in 2019, \
-2020, and 2021. To be precise, we extracted per month the total number of visited places, \
+We therefore examined your Google semantic Location History data for {periods}. \
+To be precise, we extracted per month the total number of visited places, \
 and the number of days spend per place for the three most visited places. Also, we extracted \
 the number of days spend in places and travelling, and the travelled distance in km."
+RECORDS_TEXT = "From your raw Location History (Records.json), we extracted per day in \
+these months the travelled distance in km, and the number and duration of stays of at \
+least 20 minutes within 200 meters."
 
 
-def _visit_duration(data):
-    """Get duration per visited place
+# milliseconds per day
+DAY_MS = 1e3*24*60*60
+
+# raw location records, e.g. Takeout/Location History/Records.json; the legacy
+# Location History.json lists records newest first, which the chunked reader cannot
+# follow, so it is not read
+RECORDS_FILE_RE = re.compile(r'(?:^|/)Records\.json$')
+# bytes of location records decoded at a time, tens of thousands of records; peak
+# memory is about ten times this, see _read_records
+RECORDS_CHUNK_SIZE = 2**24
+# depth of the record objects in {"locations": [{...}, ...]}
+RECORD_DEPTH = 3
+# bytes between a field name and its value, e.g. ' : "', and digits of a number
+NUMBER_PREFIX = 8
+NUMBER_WIDTH = 20
+# bytes of an ISO 8601 timestamp, e.g. 2021-01-01T12:00:00.123Z
+TIMESTAMP_WIDTH = 32
+# mean radius of the earth in meters
+EARTH_RADIUS = 6371008.8
+# records less accurate than this number of meters are ignored
+MAX_ACCURACY = 100
+# a stay is a period of at least STAY_DURATION milliseconds within STAY_RADIUS meters
+STAY_RADIUS = 200
+STAY_DURATION = 20*60*1000
+
+
+def _escaped_quotes(contents):
+    """Find the quotes in a JSON document that are escaped, i.e. follow an odd number of backslashes
+    Args:
+        contents (bytes): JSON document
+    Returns:
+        np.ndarray: positions of the escaped quotes
+    """
+    escaped = []
+    # Searching for a single byte is much faster than for a backslash and a quote
+    pos = contents.find(b"\\")
+    while pos >= 0:
+        end = pos + 1
+        while contents[end:end + 1] == b"\\":
+            end += 1
+        if (end - pos) % 2 and contents[end:end + 1] == b'"':
+            escaped.append(end)
+        pos = contents.find(b"\\", end)
+    return np.array(escaped, dtype=np.intp)
+
+
+def _json_structure(data, depth=0, string=0, escaped=None):
+    """Find the quotes and brackets that structure a piece of JSON, in one numpy pass;
+    shared by the month file and Records.json readers
+    Args:
+        data (bytes): piece of a JSON document
+        depth (int): depth of the JSON structure at the start of the piece
+        string (int): 1 if the piece starts in a string, otherwise 0
+        escaped (np.ndarray): positions of the escaped quotes in the piece,
+            found with _escaped_quotes if None
+    Returns:
+        dict: positions of the unescaped quotes and of the brackets outside strings
+            (found), whether each one is a quote (quotes), its change of depth (steps:
+            1 opening, -1 closing, 0 quote), the depth after it (levels) and whether
+            the piece ends in a string (string)
+    """
+    marks = np.frombuffer(data.translate(STRUCTURE), dtype=np.uint8)
+    found = np.flatnonzero(marks.view(bool))
+    kinds = marks[found]
+    quotes = kinds == 1
+    if escaped is None:
+        escaped = _escaped_quotes(data)
+    if len(escaped):
+        quotes[np.isin(found, escaped)] = False
+    # after an opening quote or in a string 1, otherwise 0
+    strings = np.bitwise_xor.accumulate(quotes.view(np.uint8)) ^ np.uint8(string)
+    steps = STEPS[kinds] * (strings == 0)
+    keep = quotes | (steps != 0)
+    steps = steps[keep]
+    return {"found": found[keep], "quotes": quotes[keep], "steps": steps,
+            "levels": depth + np.cumsum(steps, dtype=np.int16),
+            "string": int(strings[-1]) if len(strings) else string}
+
+
+def _json_index(contents):
+    """Index the brackets of a JSON document, to skip objects and arrays without decoding them
+    Args:
+        contents (bytes): JSON document
+    Returns:
+        tuple: positions of the brackets outside strings, and the index of the
+            matching bracket per bracket
+    """
+    escaped = _escaped_quotes(contents)
+    positions, depths = [], []
+    depth, string = 0, 0
+    # The document is scanned in chunks, to keep the scan small next to the document
+    for start in range(0, len(contents), CHUNK_SIZE):
+        chunk = contents[start:start + CHUNK_SIZE]
+        structure = _json_structure(
+            chunk, depth, string,
+            escaped[(escaped >= start) & (escaped < start + len(chunk))] - start)
+        brackets = structure["steps"] != 0
+        positions.append(structure["found"][brackets] + start)
+        # a closing bracket is at the depth before it
+        depths.append(structure["levels"][brackets] + (structure["steps"][brackets] == -1))
+        if len(structure["levels"]):
+            depth = int(structure["levels"][-1])
+        string = structure["string"]
+    positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.intp)
+    depth = np.concatenate(depths) if depths else np.zeros(0, dtype=np.int16)
+
+    # brackets at the same depth alternate between opening and closing
+    order = np.argsort(depth, kind="stable")
+    matches = np.empty(len(positions), dtype=np.intp)
+    matches[order[0::2]] = order[1::2]
+    matches[order[1::2]] = order[0::2]
+    return positions, matches
+
+
+def _value_end(contents, index, pos):
+    """Find the end of the JSON value starting at a position
+    Args:
+        contents (bytes): JSON document
+        index (tuple): brackets of the document, see _json_index
+        pos (int): position of the first character of the value
+    Returns:
+        int: position after the last character of the value
+    """
+    char = contents[pos]
+    if char == ord('"'):
+        return STRING_RE.match(contents, pos).end()
+    if char in b"{[":
+        brackets, matches = index
+        return int(brackets[matches[brackets.searchsorted(pos)]]) + 1
+    return SCALAR_RE.match(contents, pos).end()
+
+
+def _fields(contents, index, pos):
+    """Iterate over the fields of the JSON object starting at a position
+    Args:
+        contents (bytes): JSON document
+        index (tuple): brackets of the document, see _json_index
+        pos (int): position of the opening bracket of the object
+    Returns:
+        generator: name, start and end position of the value per field
+    """
+    brackets, matches = index
+    field = FIELD_RE.match(contents, pos + 1)
+    while field is not None:
+        if field.group(2) is None:
+            start = field.end()
+            end = int(brackets[matches[brackets.searchsorted(start)]]) + 1
+        else:
+            start, end = field.span(2)
+        yield field.group(1).decode("utf8"), start, end
+        field = FIELD_RE.match(contents, end)
+
+
+def _items(contents, index, pos):
+    """Iterate over the items of the JSON array starting at a position
+    Args:
+        contents (bytes): JSON document
+        index (tuple): brackets of the document, see _json_index
+        pos (int): position of the opening bracket of the array
+    Returns:
+        generator: start position per item
+    """
+    pos = WHITESPACE_RE.match(contents, pos + 1).end()
+    while contents[pos] != ord("]"):
+        yield pos
+        pos = SEPARATOR_RE.match(contents, _value_end(contents, index, pos)).end()
+
+
+def _select(data, projection):
+    """Keep the projected fields of a decoded JSON object
     Args:
-        data (dict): Google Semantic Location History data
+        data (dict): decoded JSON object
+        projection (dict): fields to keep, see _project
     Returns:
-        dict: duration per visited place, sorted in descending order
+        dict: projected fields of the object
     """
-    placevisit_duration = []
-    for data_unit in data["timelineObjects"]:
-        if "placeVisit" in data_unit:
-            address = data_unit["placeVisit"]["location"]["placeId"]
-            start_time = data_unit["placeVisit"]["duration"]["startTimestampMs"]
-            end_time = data_unit["placeVisit"]["duration"]["endTimestampMs"]
-            placevisit_duration.append(
-                {address: (int(end_time) - int(start_time))/(1e3*24*60*60)})
+    result = {}
+    for key, field in projection.items():
+        value = data.get(key)
+        if field is True and key in data:
+            result[key] = value
+        elif isinstance(value, dict):
+            result[key] = _select(value, field)
+    return result
 
-    # list of places visited
-    address_list = {next(iter(duration)) for duration in placevisit_duration}
 
-    # dict of time spend per place
-    places = {}
-    for address in address_list:
-        places[address] = round(sum(
-            [duration[address] for duration in placevisit_duration
-                if address == list(duration.keys())[0]]), 3)
-    # Sort places to amount of time spend
-    places = dict(sorted(places.items(), key=lambda kv: kv[1], reverse=True))
+def _project(contents, index, pos, projection):
+    """Decode the projected fields of the JSON object starting at a position
+    Args:
+        contents (bytes): JSON document
+        index (tuple): brackets of the document, see _json_index
+        pos (int): position of the opening bracket of the object
+        projection (dict): fields to keep, True to keep the whole value, or a
+            projection of the fields to keep of an object
+    Returns:
+        dict: projected fields of the object
+    """
+    result = {}
+    for key, start, end in _fields(contents, index, pos):
+        field = projection.get(key)
+        if field is True:
+            result[key] = DECODER.decode(contents[start:end].decode("utf8"))
+        elif field is not None and contents[start] == ord("{"):
+            if end - start <= SMALL_OBJECT:
+                result[key] = _select(DECODER.decode(contents[start:end].decode("utf8")), field)
+            else:
+                result[key] = _project(contents, index, start, field)
+    return result
 
-    return places
+
+def _read_timeline(contents, projection=None):
+    """Read the timeline objects of a month file one by one, keeping only projected fields.
+    The objects are decoded lazily, but the file is not streamed: peak memory is the whole
+    month file plus its bracket index, 16 bytes per bracket (about half the file size)
+    Args:
+        contents (bytes): Google Semantic Location History month file
+        projection (dict): fields to keep per timeline object, TIMELINE_PROJECTION if None
+    Returns:
+        generator: projected timeline object (dict) per timeline object
+    """
+    if projection is None:
+        projection = TIMELINE_PROJECTION
+    index = _json_index(contents)
+    for key, start, _ in _fields(contents, index, WHITESPACE_RE.match(contents).end()):
+        if key == "timelineObjects" and contents[start] == ord("["):
+            for item in _items(contents, index, start):
+                if contents[item] == ord("{"):
+                    yield _project(contents, index, item, projection)
 
 
-def _activity_duration(data):
+def _timeline_table(objects):
+    """Flatten the timeline objects of a month into one table of visits and activity segments
+    Args:
+        objects (iterable): Google Semantic Location History timeline objects
+    Returns:
+        dict: numpy array per column, one row per place visit followed by one row per
+            activity segment: visit (bool, False for segments), place (int, code of the
+            placeId, -1 for segments), start_ms and end_ms (int64), distance (float,
+            meters, 0 for visits), activity (int, code of the activity type, -1 for
+            visits); and the placeIds (places) and activity types (activities) per code
+    """
+    place_ids, visit_start, visit_end = [], [], []
+    segment_start, segment_end, distance, activity_types = [], [], [], []
+    for data_unit in objects:
+        visit = data_unit.get("placeVisit")
+        if visit is not None:
+            place_ids.append(visit["location"]["placeId"])
+            visit_start.append(visit["duration"]["startTimestampMs"])
+            visit_end.append(visit["duration"]["endTimestampMs"])
+        segment = data_unit.get("activitySegment")
+        if segment is not None:
+            segment_start.append(segment["duration"]["startTimestampMs"])
+            segment_end.append(segment["duration"]["endTimestampMs"])
+            distance.append(segment.get("distance", 0))
+            activity_types.append(segment.get("activityType"))
+    places, place_names = pd.factorize(np.array(place_ids, dtype=object))
+    activities, activity_names = pd.factorize(np.array(activity_types, dtype=object))
+    num_visits, num_segments = len(place_ids), len(segment_start)
+    return {
+        "visit": np.repeat([True, False], [num_visits, num_segments]),
+        "place": np.concatenate([places, np.full(num_segments, -1, dtype=places.dtype)]),
+        "start_ms": np.array(visit_start + segment_start, dtype=np.int64),
+        "end_ms": np.array(visit_end + segment_end, dtype=np.int64),
+        "distance": np.concatenate([np.zeros(num_visits), np.array(distance, dtype=np.float64)]),
+        "activity": np.concatenate([np.full(num_visits, -1, dtype=activities.dtype), activities]),
+        "places": np.asarray(place_names, dtype=object),
+        "activities": np.asarray(activity_names, dtype=object)
+    }
+
+
+def _visit_duration(table):
+    """Get duration per visited place
+    Args:
+        table (dict): timeline table, see _timeline_table
+    Returns:
+        pd.Series: duration in days per visited place, in order of the first visit
+    """
+    visits = table["visit"]
+    days = np.bincount(table["place"][visits],
+                       weights=(table["end_ms"] - table["start_ms"])[visits] / DAY_MS,
+                       minlength=len(table["places"]))
+    return pd.Series(days, index=table["places"]).round(3)
+
+
+def _top_places(places, number):
+    """Get the places with the longest duration, without sorting all places
+    Args:
+        places (pd.Series): duration per place, see _visit_duration
+        number (int): number of places
+    Returns:
+        dict: duration per place for the top places, sorted in descending order,
+            places with the same duration in order of the first visit
+    """
+    days = places.to_numpy()
+    if len(days) > number:
+        threshold = np.partition(days, len(days) - number)[len(days) - number]
+        candidates = np.flatnonzero(days >= threshold)
+    else:
+        candidates = np.arange(len(days))
+    top = candidates[np.lexsort((candidates, -days[candidates]))][:number]
+    return dict(zip(places.index[top], days[top].tolist()))
+
+
+def _activity_duration(table):
     """Get total duration of activities
     Args:
-        data (dict): Google Semantic Location History data
+        table (dict): timeline table, see _timeline_table
     Returns:
         float: duration of actitvities in days
     """
-    activity_duration = 0.0
-    for data_unit in data["timelineObjects"]:
-        if "activitySegment" in data_unit.keys():
-            start_time = data_unit["activitySegment"]["duration"]["startTimestampMs"]
-            end_time = data_unit["activitySegment"]["duration"]["endTimestampMs"]
-            activity_duration += (int(end_time) - int(start_time))/(1e3*24*60*60)
-    return activity_duration
+    segments = ~table["visit"]
+    return float((table["end_ms"] - table["start_ms"])[segments].sum() / DAY_MS)
 
 
-def _activity_distance(data):
+def _activity_distance(table):
     """Get total distance of activities
     Args:
-        data (dict): Google Semantic Location History data
+        table (dict): timeline table, see _timeline_table
     Returns:
-        float: duration of actitvities in days
+        float: distance of actitvities in km
+    """
+    return float(table["distance"][~table["visit"]].sum() / 1000.0)
+
+
+def period_range(start, end):
+    """List the months in a period
+    Args:
+        start (tuple): year and month number (1-12) of the first month
+        end (tuple): year and month number (1-12) of the last month
+    Returns:
+        list: (year, month name) per month, in calendar order
+    """
+    first = start[0] * 12 + start[1] - 1
+    last = end[0] * 12 + end[1] - 1
+    return [(index // 12, MONTH_NAMES[index % 12]) for index in range(first, last + 1)]
+
+
+def _join_words(words):
+    """Join words into an English enumeration, e.g. '2019, 2020, and 2021'
+    Args:
+        words (list): str per item
+    Returns:
+        str: the items separated by commas and 'and'
+    """
+    if len(words) < 3:
+        return " and ".join(words)
+    return f"{', '.join(words[:-1])}, and {words[-1]}"
+
+
+def _describe_periods(periods):
+    """Describe months in words, e.g. 'January in 2019, 2020, and 2021'
+    Args:
+        periods (list): (year, month name) per month
+    Returns:
+        str: the years of each month, months in order of their first occurrence
+    """
+    years = {}
+    for year, month in periods:
+        years.setdefault(month, []).append(str(year))
+    if not years:
+        return "none of the selected months"
+    return _join_words([f"{month.capitalize()} in {_join_words(names)}"
+                        for month, names in years.items()])
+
+
+def _index_months(zfile):
+    """Index the month files of a zipfile with one pass over its central directory
+    Args:
+        zfile (zipfile.ZipFile): Google Takeout zipfile
+    Returns:
+        dict: ZipInfo per (year, month name), the first file if a month occurs twice
+    """
+    index = {}
+    for info in zfile.infolist():
+        match = MONTH_FILE_RE.search(info.filename)
+        if match is not None:
+            index.setdefault((int(match.group(1)), match.group(2)), info)
+    return index
+
+
+def _extract_month(year, month, objects):
+    """Get the relevant data of one month
+    Args:
+        year (int): year of the month
+        month (str): name of the month
+        objects (iterable): Google Semantic Location History timeline objects of the month
+    Returns:
+        dict: extracted data of the month
+    """
+    table = _timeline_table(objects)
+    places = _visit_duration(table)
+    return {
+        "Year": year,
+        "Month": month,
+        "Top Places": _top_places(places, NPLACES),
+        "Number of Places": len(places),
+        "Places Duration [days]": round(places.sum(), 3),
+        "Activity Duration [days]": round(_activity_duration(table), 3),
+        "Activity Distance [km]": round(_activity_distance(table), 3)
+    }
+
+
+def _parse_numbers(text, starts, width=NUMBER_WIDTH):
+    """Read the integers that follow the field names ending at positions in a JSON document
+    Args:
+        text (np.ndarray): bytes of the JSON document, followed by at least the prefix
+            and width in padding
+        starts (np.ndarray): positions after the field names, the integers may be quoted
+        width (int): maximum number of digits
+    Returns:
+        np.ndarray: integer per position
+        np.ndarray: whether an integer follows the position, e.g. False after null
+    """
+    prefix = np.lib.stride_tricks.sliding_window_view(text, NUMBER_PREFIX)[starts]
+    first = ~((prefix <= ord(" ")) | (prefix == ord(":")) | (prefix == ord('"')))
+    first = first.argmax(axis=1)
+    chars = prefix[np.arange(len(starts)), first]
+    negative = chars == ord("-")
+    valid = negative | (chars - np.uint8(ord("0")) < 10)
+
+    # Add the digits column by column, until all numbers ended
+    windows = np.lib.stride_tricks.sliding_window_view(text, width)
+    digits = np.ascontiguousarray(windows[starts + first + negative].T) - np.uint8(ord("0"))
+    values = np.zeros(len(starts), dtype=np.int64)
+    active = valid
+    for column in digits:
+        active = active & (column < 10)
+        if not active.any():
+            break
+        values = np.where(active, values * 10 + column, values)
+    return np.where(negative, -values, values), valid
+
+
+def _parse_timestamps(text, starts, width=TIMESTAMP_WIDTH):
+    """Read ISO 8601 timestamps in UTC from a JSON document
+    Args:
+        text (np.ndarray): bytes of the JSON document, followed by at least the width
+            in padding
+        starts (np.ndarray): positions of the first character of the timestamps
+        width (int): maximum number of bytes of a timestamp
+    Returns:
+        np.ndarray: milliseconds since epoch per timestamp
+    """
+    window = np.lib.stride_tricks.sliding_window_view(text, width)[starts]
+    ends = ((window == ord('"')) | (window == ord("Z"))).argmax(axis=1)
+    window[np.arange(width) >= ends[:, None]] = 0
+    return window.view(f"S{width}").ravel().astype("datetime64[ms]").astype(np.int64)
+
+
+def _record_structure(data, depth):
+    """Find the quotes and brackets of a piece of Records.json, up to the end of its last
+    complete record
+    Args:
+        data (bytes): piece of Records.json, starting outside strings
+        depth (int): depth of the JSON structure at the start of the piece
+    Returns:
+        dict: positions of the quotes and brackets (found), whether each one is an
+            unescaped quote (quotes), the depth after each one (levels), and whether
+            each one opens a record (openers)
+        int: position after the last complete record
+        int: depth of the JSON structure at that position
+    """
+    structure = _json_structure(data, depth)
+    found, quotes = structure["found"], structure["quotes"]
+    steps, levels = structure["steps"], structure["levels"]
+
+    # Only decode up to the end of the last complete record
+    ends = np.flatnonzero((steps == -1) & (levels == RECORD_DEPTH - 1))
+    count = ends[-1] + 1 if len(ends) else 0
+    structure = {"found": found[:count], "quotes": quotes[:count], "levels": levels[:count],
+                 "openers": (steps[:count] == 1) & (levels[:count] == RECORD_DEPTH)}
+    if not count:
+        return structure, 0, depth
+    return structure, int(found[count - 1]) + 1, int(levels[count - 1])
+
+
+def _record_strings(text, structure):
+    """Find the strings at the depth of the record fields, which are field names or string values
+    Args:
+        text (np.ndarray): bytes of the piece of Records.json, followed by padding
+        structure (dict): quotes and brackets of the piece, see _record_structure
+    Returns:
+        dict: position of the opening and closing quote of every string (opening,
+            closing); and of the strings at the depth of the record fields the index
+            (at_record), the length (lengths), the first and last eight bytes (heads,
+            tails) and the index of their record (owners)
+    """
+    found = structure["found"]
+    pairs = np.flatnonzero(structure["quotes"])
+    opening, closing = found[pairs[0::2]], found[pairs[1::2]]
+    at_record = np.flatnonzero(structure["levels"][pairs[0::2]] == RECORD_DEPTH)
+    # Field names are told apart by their length and their first and last eight bytes
+    words = np.lib.stride_tricks.sliding_window_view(text, 8)
+    return {
+        "opening": opening,
+        "closing": closing,
+        "at_record": at_record,
+        "lengths": closing[at_record] - opening[at_record] - 1,
+        "heads": words[opening[at_record] + 1].view(np.uint64)[:, 0],
+        "tails": words[np.maximum(closing[at_record] - 8, 0)].view(np.uint64)[:, 0],
+        "owners": (np.cumsum(structure["openers"]) - 1)[pairs[2 * at_record]]
+    }
+
+
+def _find_field(strings, name):
+    """Find the occurrences of a field name of at least 8 bytes in the records
+    Args:
+        strings (dict): strings of a piece of Records.json, see _record_strings
+        name (str): field name
+    Returns:
+        np.ndarray: index of the string per occurrence
+        np.ndarray: index of the record per occurrence
+    """
+    name = name.encode("utf8")
+    head, tail = (np.frombuffer(part, dtype=np.uint64)[0] for part in (name[:8], name[-8:]))
+    match = ((strings["lengths"] == len(name)) & (strings["heads"] == head)
+             & (strings["tails"] == tail))
+    return strings["at_record"][match], strings["owners"][match]
+
+
+def _decode_records(data, depth=0):
+    """Decode the complete location records in a piece of Records.json, without decoding
+    other fields (e.g. activity)
+    Args:
+        data (bytes): piece of Records.json, starting outside strings
+        depth (int): depth of the JSON structure at the start of the piece
+    Returns:
+        dict: numpy array per field of the records with a time and coordinates:
+            time_ms (int64, milliseconds since epoch), lat_e7 and lng_e7 (int32, degrees
+            times 10^7), accuracy (int32, meters, -1 if missing)
+        int: position after the last complete record
+        int: depth of the JSON structure at that position
+    """
+    text = np.frombuffer(data + bytes(NUMBER_PREFIX + max(NUMBER_WIDTH, TIMESTAMP_WIDTH)),
+                         dtype=np.uint8)
+    structure, cut, next_depth = _record_structure(data, depth)
+    strings = _record_strings(text, structure)
+    num = int(structure["openers"].sum())
+    columns = {
+        "time_ms": np.zeros(num, dtype=np.int64),
+        "lat_e7": np.zeros(num, dtype=np.int32),
+        "lng_e7": np.zeros(num, dtype=np.int32),
+        "accuracy": np.full(num, -1, dtype=np.int32)
+    }
+    present = {column: np.zeros(num, dtype=bool) for column in columns}
+    for name, column in [("timestampMs", "time_ms"), ("latitudeE7", "lat_e7"),
+                         ("longitudeE7", "lng_e7"), ("accuracy", "accuracy")]:
+        found, owners = _find_field(strings, name)
+        values, valid = _parse_numbers(text, strings["closing"][found] + 1)
+        columns[column][owners[valid]] = values[valid]
+        present[column][owners[valid]] = True
+    found, owners = _find_field(strings, "timestamp")
+    # the value of the field is the next string
+    followed = found + 1 < len(strings["opening"])
+    found, owners = found[followed], owners[followed]
+    columns["time_ms"][owners] = _parse_timestamps(text, strings["opening"][found + 1] + 1)
+    present["time_ms"][owners] = True
+
+    complete = present["time_ms"] & present["lat_e7"] & present["lng_e7"]
+    return {column: values[complete] for column, values in columns.items()}, cut, next_depth
+
+
+def _read_records(file, chunk_size=RECORDS_CHUNK_SIZE):
+    """Read the location records of Records.json a chunk at a time. The positions of the
+    quotes and brackets of a chunk and the arrays derived from them take several times
+    the size of the chunk: peak memory is about ten times the chunk size, independent
+    of the size of the file
+    Args:
+        file (file object): Records.json, opened in binary mode
+        chunk_size (int): number of bytes read at a time
+    Returns:
+        generator: records per chunk, see _decode_records
+    """
+    rest, depth = b"", 0
+    while True:
+        data = file.read(chunk_size)
+        records, cut, next_depth = _decode_records(rest + data, depth)
+        if len(records["time_ms"]):
+            yield records
+        if not data:
+            break
+        rest, depth = (rest + data)[cut:], next_depth
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    """Get the great-circle distance between points
+    Args:
+        lat1 (np.ndarray): latitude of the first points in degrees
+        lng1 (np.ndarray): longitude of the first points in degrees
+        lat2 (np.ndarray): latitude of the second points in degrees
+        lng2 (np.ndarray): longitude of the second points in degrees
+    Returns:
+        np.ndarray: distance in meters
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    half = (np.sin((lat2 - lat1) / 2) ** 2
+            + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(half))
+
+
+def _first_beyond(beyond, anchor, num, start):
+    """Find the first point after an anchor that is beyond the radius of a stay from the anchor
+    Args:
+        beyond (callable): whether points are beyond the radius from anchors, see _stay_points
+        anchor (int): index of the anchor
+        num (int): number of points
+        start (int): index of the first point to compare
+    Returns:
+        int: index of the first point beyond the radius, -1 if there is none
     """
-    activity_distance = 0.0
-    for data_unit in data["timelineObjects"]:
-        if "activitySegment" in data_unit.keys():
-            activity_distance += int(data_unit["activitySegment"]["distance"])/1000.0
+    size = 64
+    while start < num:
+        stop = min(start + size, num)
+        far = np.flatnonzero(beyond(anchor, np.arange(start, stop)))
+        if len(far):
+            return start + int(far[0])
+        start, size = stop, size * 4
+    return -1
 
-    return activity_distance
 
+def _run_ends(time_ms, beyond, min_duration):
+    """Find where the run from each point leaves the radius, for all points at once, until
+    the run lasts long enough to be a stay; the end of stays is found when needed
+    Args:
+        time_ms (np.ndarray): time per point in milliseconds, ascending
+        beyond (callable): whether points are beyond the radius from anchors, see _stay_points
+        min_duration (int): minimum duration of a stay in milliseconds
+    Returns:
+        np.ndarray: index of the first point beyond the radius per point, -1 if the run
+            lasts long enough first or does not leave the radius
+    """
+    num = len(time_ms)
+    ends = np.full(num, -1, dtype=np.intp)
+    pending = np.arange(num)
+    offset = 0
+    while len(pending):
+        offset += 1
+        pending = pending[pending + offset < num]
+        pending = pending[time_ms[pending + offset - 1] - time_ms[pending] < min_duration]
+        far = beyond(pending, pending + offset)
+        ends[pending[far]] = pending[far] + offset
+        pending = pending[~far]
+    return ends
 
-def process(file_data):
+
+def _stay_points(points, radius=STAY_RADIUS, min_duration=STAY_DURATION, final=True):
+    """Detect stay points: runs of points within a radius of the first point of the run,
+    that last long enough (Li et al., 2008)
+    Args:
+        points (dict): time_ms (milliseconds, ascending), lat and lng (degrees) per point
+        radius (float): radius of a stay in meters
+        min_duration (int): minimum duration of a stay in milliseconds
+        final (bool): whether the points end the data; if not, the run that is still
+            within the radius at the last point is left open
+    Returns:
+        list: index of the first point per stay
+        list: index after the last point per stay
+        int: index of the first point of the open run, the number of points if final
+    """
+    num = len(points["time_ms"])
+    phi, lam = np.radians(points["lat"]), np.radians(points["lng"])
+    cos_phi = np.cos(phi)
+    # haversine of the angle of the radius, so the distance itself is not needed
+    limit = np.sin(radius / EARTH_RADIUS / 2) ** 2
+
+    def beyond(anchors, others):
+        """Whether points are beyond the radius from their anchors"""
+        return (np.sin((phi[others] - phi[anchors]) / 2) ** 2 + cos_phi[anchors] * cos_phi[others]
+                * np.sin((lam[others] - lam[anchors]) / 2) ** 2) > limit
+
+    ends = _run_ends(points["time_ms"], beyond, min_duration).tolist()
+    times = points["time_ms"].tolist()
+    starts, stay_ends = [], []
+    anchor = 0
+    while anchor < num:
+        end = ends[anchor]
+        if end < 0:
+            end = _first_beyond(beyond, anchor, num, anchor + 1)
+        if end < 0 and not final:
+            return starts, stay_ends, anchor
+        stop = num if end < 0 else end
+        if times[stop - 1] - times[anchor] >= min_duration:
+            starts.append(anchor)
+            stay_ends.append(stop)
+            anchor = stop
+        elif end < 0:
+            break
+        else:
+            anchor += 1
+    return starts, stay_ends, num
+
+
+def _stay_table(points, starts, ends, skipped):
+    """Get the arrival, departure and mean location of stays
+    Args:
+        points (dict): time_ms, lat and lng per point
+        starts (list): index of the first point per stay, see _stay_points
+        ends (list): index after the last point per stay
+        skipped (np.ndarray): number, latitude sum and longitude sum of points left out
+            between the first two points, which belong to the stay starting at 0
+    Returns:
+        pd.DataFrame: arrival_ms and departure_ms (milliseconds since epoch), lat and
+            lng (mean location in degrees) per stay
+    """
+    starts, ends = np.array(starts, dtype=np.intp), np.array(ends, dtype=np.intp)
+    sums = [np.concatenate([[0], np.cumsum(points[key])]) for key in ("lat", "lng")]
+    totals = np.stack([ends - starts] + [values[ends] - values[starts] for values in sums])
+    if len(starts) and starts[0] == 0:
+        totals[:, 0] += skipped
+    return pd.DataFrame({
+        "arrival_ms": points["time_ms"][starts],
+        "departure_ms": points["time_ms"][ends - 1],
+        "lat": totals[1] / totals[0],
+        "lng": totals[2] / totals[0]
+    })
+
+
+def _summarize_records(chunks, max_accuracy=MAX_ACCURACY, radius=STAY_RADIUS,
+                       min_duration=STAY_DURATION):
+    """Get the travelled distance and the stay points in location records, chunk by chunk
+    Args:
+        chunks (iterable): location records per chunk, see _read_records
+        max_accuracy (float): records less accurate than this number of meters are ignored
+        radius (float): radius of a stay in meters, see _stay_points
+        min_duration (int): minimum duration of a stay in milliseconds
+    Returns:
+        pd.Series: travelled distance in meters per day (days since epoch, UTC), the
+            distance between two records counts for the day of the second
+        pd.DataFrame: stay points, see _stay_table
+    """
+    distances, stays = [], []
+    # points of the run that is still open at the end of the previous chunk, and the
+    # number and coordinate sums of the points left out of it
+    run = {"time_ms": np.zeros(0, dtype=np.int64), "lat": np.zeros(0), "lng": np.zeros(0)}
+    skipped = np.zeros(3)
+    for chunk in chunks:
+        # Ignore inaccurate records and records that go back in time
+        keep = np.flatnonzero(chunk["accuracy"] <= max_accuracy)
+        time_ms = chunk["time_ms"][keep]
+        latest = np.maximum.accumulate(
+            np.concatenate([[np.iinfo(np.int64).min], run["time_ms"][-1:], time_ms]))
+        keep = keep[time_ms > latest[-len(time_ms) - 1:-1]]
+        points = {
+            "time_ms": np.concatenate([run["time_ms"], chunk["time_ms"][keep]]),
+            "lat": np.concatenate([run["lat"], chunk["lat_e7"][keep] / 1e7]),
+            "lng": np.concatenate([run["lng"], chunk["lng_e7"][keep] / 1e7])
+        }
+
+        # Travelled distance, continuing from the last point of the previous chunk
+        time_ms, lat, lng = (points[key][max(len(run["time_ms"]) - 1, 0):]
+                             for key in ("time_ms", "lat", "lng"))
+        if len(time_ms) > 1:
+            steps = _haversine(lat[:-1], lng[:-1], lat[1:], lng[1:])
+            distances.append(pd.Series(steps).groupby(time_ms[1:] // int(DAY_MS)).sum())
+
+        # Stay points, continuing the open run of the previous chunk
+        starts, ends, open_start = _stay_points(points, radius, min_duration, final=False)
+        stays.append(_stay_table(points, starts, ends, skipped))
+        if starts and starts[0] == 0:
+            skipped = np.zeros(3)
+        run = {key: values[open_start:] for key, values in points.items()}
+        if len(run["time_ms"]) > 2 and run["time_ms"][-1] - run["time_ms"][0] >= min_duration:
+            # The open run is a stay already, only its first and last point are needed
+            skipped += [len(run["time_ms"]) - 2, run["lat"][1:-1].sum(), run["lng"][1:-1].sum()]
+            run = {key: values[[0, -1]] for key, values in run.items()}
+
+    # The open run ends with the data
+    starts, ends, _ = _stay_points(run, radius, min_duration, final=True)
+    stays.append(_stay_table(run, starts, ends, skipped))
+    distance = pd.concat(distances).groupby(level=0).sum() if distances else pd.Series(dtype=float)
+    return distance, pd.concat(stays, ignore_index=True)
+
+
+def _daily_records(distance, stays, periods):
+    """Summarize the travelled distance and stays per day, for the days in selected months
+    Args:
+        distance (pd.Series): travelled distance in meters per day, see _summarize_records
+        stays (pd.DataFrame): stay points, see _stay_table
+        periods (list): (year, month name) per selected month
+    Returns:
+        pd.DataFrame: distance, number of stays and duration of stays by day of arrival per day
+    """
+    stay_days = stays["arrival_ms"].to_numpy(dtype=np.int64) // int(DAY_MS)
+    durations = pd.Series((stays["departure_ms"] - stays["arrival_ms"]).to_numpy() / DAY_MS)
+    stay_days = durations.groupby(stay_days).agg(["size", "sum"])
+    days = np.union1d(distance.index.to_numpy(dtype=np.int64),
+                      stay_days.index.to_numpy(dtype=np.int64))
+    dates = days.astype("datetime64[D]")
+    selected = {year * 12 + MONTH_NAMES.index(month) for year, month in periods}
+    months = dates.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    days = days[[month in selected for month in months.tolist()]]
+    stay_days = stay_days.reindex(days, fill_value=0)
+    return pd.DataFrame({
+        "Date": days.astype("datetime64[D]").astype(str),
+        "Distance [km]": (distance.reindex(days, fill_value=0).to_numpy() / 1000).round(3),
+        "Number of Stays": stay_days["size"].to_numpy(dtype=np.int64),
+        "Stay Duration [days]": stay_days["sum"].to_numpy().round(3)
+    })
+
+
+def _find_records(zfile):
+    """Find the raw location records in a zipfile
+    Args:
+        zfile (zipfile.ZipFile): Google Takeout zipfile
+    Returns:
+        zipfile.ZipInfo: Records.json, None if the zipfile has none
+    """
+    return next((info for info in zfile.infolist() if RECORDS_FILE_RE.search(info.filename)), None)
+
+
+def _process_month(job):
+    """Read and extract one month, in a worker process or in the main process
+    Args:
+        job (tuple): year, month name and the contents of the month file
+    Returns:
+        dict: extracted data of the month, see _extract_month
+    """
+    year, month, contents = job
+    return _extract_month(year, month, _read_timeline(contents))
+
+
+def _process_pool(workers):
+    """Start a process pool, if the platform supports it (Pyodide does not)
+    Args:
+        workers (int): number of worker processes
+    Returns:
+        ProcessPoolExecutor: the pool, None if processes are not available
+    """
+    try:
+        return ProcessPoolExecutor(workers)
+    except (ImportError, NotImplementedError, OSError):
+        return None
+
+
+def _map_months(jobs, workers=1):
+    """Extract months in a pool of worker processes, or one by one
+    Args:
+        jobs (iterable): (year, month name, contents) per month, read lazily; each job
+            holds a whole month file, see _read_timeline
+        workers (int): number of worker processes, 1 to extract in this process
+    Returns:
+        generator: extracted data per month, in the order of the jobs; if the pool
+            breaks, the months that are not yet extracted are extracted one by one
+    """
+    executor = _process_pool(workers) if workers > 1 else None
+    jobs = iter(jobs)
+    if executor is None:
+        yield from map(_process_month, jobs)
+        return
+    # Keep a few months per worker in flight, so the contents of all months
+    # are never held in memory at once
+    pending, futures = collections.deque(), collections.deque()
+    try:
+        with executor:
+            for job in jobs:
+                pending.append(job)
+                futures.append(executor.submit(_process_month, job))
+                if len(futures) >= 2 * workers:
+                    yield futures[0].result()
+                    futures.popleft()
+                    pending.popleft()
+            while futures:
+                yield futures[0].result()
+                futures.popleft()
+                pending.popleft()
+    except (BrokenProcessPool, OSError):
+        # e.g. a worker was killed or could not be started
+        yield from map(_process_month, pending)
+        yield from map(_process_month, jobs)
+
+
+def process(file_data, periods=None, workers=1):
     """Return relevant data from zipfile for years and months
     Args:
         file_data: zip file or object
+        periods (list): (year, month name) per month to extract, e.g. made with
+            period_range; all combinations of YEARS and MONTHS if None
+        workers (int): number of worker processes that extract months concurrently,
+            the number of CPUs if None; months are extracted one by one if 1,
+            if processes are not available or once the pool breaks
 
     Returns:
-        dict: dict with summary and DataFrame with extracted data
+        dict: dict with summary and DataFrame with extracted data, and a DataFrame with
+            the distance and stays per day in the raw location records (records_data_frames),
+            if the zipfile has Records.json
     """
-    results = []
-    filenames = []
+    if periods is None:
+        periods = [(year, month) for year in YEARS for month in MONTHS]
 
     # Extract info from selected years and months
     with zipfile.ZipFile(file_data) as zfile:
-        file_list = zfile.namelist()
-        for year in YEARS:
-            for month in MONTHS:
-                for name in file_list:
-                    monthfile = f"{year}_{month}.json"
-                    if re.search(monthfile, name) is not None:
-                        filenames.append(monthfile)
-                        data = json.loads(zfile.read(name).decode("utf8"))
-                        places = _visit_duration(data)
-                        results.append({
-                            "Year": year,
-                            "Month": month,
-                            "Top Places": dict(itertools.islice(places.items(), NPLACES)),
-                            "Number of Places": len(places),
-                            "Places Duration [days]": round(
-                                sum(value for value in places.values()), 3),
-                            "Activity Duration [days]": round(_activity_duration(data), 3),
-                            "Activity Distance [km]": round(_activity_distance(data), 3)
-                        })
-                        break
+        index = _index_months(zfile)
+        extracted = [period for period in periods if period in index]
+        jobs = ((year, month, zfile.read(index[year, month])) for year, month in extracted)
+        results = list(_map_months(jobs, workers or os.cpu_count() or 1))
+        records = _find_records(zfile)
+        records_frames = []
+        if records is not None:
+            with zfile.open(records) as file:
+                distance, stays = _summarize_records(_read_records(file))
+            records_frames.append(_daily_records(distance, stays, periods))
+
+    text = TEXT.format(periods=_describe_periods(extracted))
 
     # Put results in DataFrame
     data_frame = pd.json_normalize(results)
@@ -127,8 +983,9 @@ def process(file_data):
             data_frame.rename(columns={column: f"Place {number} [days]"}, inplace=True)
 
     return {
-        "summary": TEXT,
+        "summary": f"{text} {RECORDS_TEXT}" if records_frames else text,
         "data_frames": [
             data_frame.fillna(0)
-        ]
+        ],
+        "records_data_frames": records_frames
     }
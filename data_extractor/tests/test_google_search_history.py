@@ -1,13 +1,38 @@
 """Test data extraction from Google Browser History .json file"""
 
 import json
+from datetime import datetime
 from zipfile import ZipFile
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 from google_search_history import _extract
+from google_search_history import _classify_periods
+from google_search_history import _local_hours
+from google_search_history import _factorize_netlocs
+from google_search_history import _classify_netlocs
+from google_search_history import _compile_study
+from google_search_history import extract_studies
+from google_search_history import DEFAULT_STUDY
+from google_search_history import load_domains
+from google_search_history import NEWS_DOMAINS
+from google_search_history import START, END, ZONE
+from google_search_history import _read_browser_history
+from google_search_history import _JsonStream
+from google_search_history import _flag_repeats
+from google_search_history import _scan
+from google_search_history import _split_sessions
+from google_search_history import _tokenize
+from google_search_history import _parse_activity_time
+from google_search_history import _read_activity_html
+from google_search_history import _read_activity_json
 from google_search_history import process
+from google_search_history import _run_concurrently
+import google_search_history
 from pandas.testing import assert_frame_equal
+import pytest
 
+import numpy as np
 import pandas as pd
 
 DATA = {
@@ -135,3 +160,457 @@ def test_process():
     result = process(_create_zip())
     expected = _reshape_expected()
     assert_frame_equal(result["data_frames"][0], expected)
+
+
+def test_process_top_domains():
+    """ checks if the most visited domains per period are listed next to the counts
+    returns: if no AssertionError, dataframes are the same
+    """
+    result = process(_create_zip())
+    expected = pd.DataFrame({
+        "Curfew": ["before"] * 4 + ["during"] * 2 + ["post"] * 2,
+        "Domain": ["canarias.mediamarkt.es", "nederland.fm", "nos.nl", "uu.nl",
+                   "nos.nl", "ns.nl", "nrc.nl", "wehkamp.com"],
+        "Visits": [1] * 8,
+        "Error": [0] * 8
+    })
+    assert_frame_equal(result["data_frames"][1], expected)
+
+
+
+def _create_split_export():
+    """
+    returns: parts of a split Takeout export, with the browser history
+        divided over BrowserHistory.json and Chrome/History.json
+    """
+    entries = DATA["Browser History"]
+    members = [{"Takeout/archive_browser.html": "<html></html>"},
+               {"Takeout/Chrome/BrowserHistory.json": {"Browser History": entries[:4]}},
+               {"Takeout/Chrome/History.json": {"Browser History": entries[4:]},
+                "Takeout/YouTube/History.json": {"Browser History": entries}}]
+    parts = []
+    for part in members:
+        archive = BytesIO()
+        with ZipFile(archive, 'w') as zip_archive:
+            for path, data in part.items():
+                zip_archive.writestr(path, data if isinstance(data, str) else json.dumps(data))
+        parts.append(archive)
+    return parts
+
+
+def test_process_split_export():
+    """ checks if the browser history is read from all parts of a split export
+    returns: if no AssertionError, dataframes are the same
+    """
+    result = process(_create_split_export())
+    assert_frame_equal(result["data_frames"][0], _reshape_expected())
+    assert "read_files: BrowserHistory.json, History.json" in result["summary"]
+
+
+def test_process_without_history():
+    """ checks if an export without browser history is rejected
+    returns: if no AssertionError, an error is raised
+    """
+    with pytest.raises(FileNotFoundError):
+        process(_create_split_export()[:1])
+
+
+def _create_activity():
+    """
+    returns: the visits in DATA, without reloads, and a search as search activity
+        in the MyActivity.json and MyActivity.html formats
+    """
+    records = [{"title": "Visited", "time": entry["time_usec"],
+                "titleUrl": f"https://www.google.com/url?q={entry['url']}&usg=AOv"}
+               for entry in DATA["Browser History"] if entry["page_transition"] == "LINK"]
+    records.append({"title": "Searched for", "time": 1612167600000000,
+                    "titleUrl": "https://www.google.com/search?q=avondklok+nos"})
+    html_records = []
+    for record in records:
+        local = datetime.fromtimestamp(record["time"] / 1e6, ZONE)
+        html_records.append(
+            '<div class="outer-cell mdl-cell mdl-cell--12-col mdl-shadow--2dp">'
+            '<div class="mdl-grid"><div class="header-cell mdl-cell mdl-cell--12-col">'
+            '<p class="mdl-typography--title">Search<br></p></div>'
+            '<div class="content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1">'
+            f'{record["title"]}&nbsp;<a href="{record["titleUrl"].replace("&", "&amp;")}">'
+            f'title</a><br>{local.strftime("%b %d, %Y, %I:%M:%S %p %Z")}</div>'
+            '<div class="content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1 '
+            'mdl-typography--text-right"></div></div></div>')
+        record["time"] = np.datetime_as_string(np.datetime64(record["time"], "us"),
+                                               unit="ms") + "Z"
+    html_text = ('<html><head><style>p {}</style></head><body><div class="mdl-grid">'
+                 + "".join(html_records) + '</div></body></html>')
+    return json.dumps(records), html_text
+
+
+def test_read_activity():
+    """ checks if searches and clicked results are read from both activity formats
+    returns: if no AssertionError, entries are the same
+    """
+    json_text, html_text = _create_activity()
+    from_json = list(_read_activity_json(BytesIO(json_text.encode("utf8"))))
+    from_html = list(_read_activity_html(BytesIO(html_text.encode("utf8")), chunk_size=100))
+    assert from_json == from_html
+    assert len(from_json) == 9
+    assert from_json[1] == {"time_usec": 1607821200000000, "page_transition": "LINK",
+                            "url": "https://nederland.fm/", "query": None}
+    assert from_json[-1]["query"] == "avondklok nos"
+    assert from_json[-1]["url"].startswith("https://www.google.com/search")
+
+
+def test_parse_activity_time():
+    """ checks if English and Dutch times of MyActivity.html are parsed
+    returns: if no AssertionError, timestamps are the same
+    """
+    expected = 1612167660000000
+    assert _parse_activity_time("Feb 1, 2021, 9:21:00\u202fAM CET") == expected
+    assert _parse_activity_time("1 Feb 2021, 09:21:00 CET") == expected
+    assert _parse_activity_time("1 feb. 2021 09:21:00 CET") == expected
+    assert _parse_activity_time("1 feb 2021 09:21:00") == expected
+    assert _parse_activity_time("29 apr. 2021 16:00:00 CEST") == 1619704800000000
+    assert _parse_activity_time("Products: Search") is None
+
+
+def test_process_activity():
+    """ checks if search activity is counted like the browser history
+    returns: if no AssertionError, dataframes are as expected
+    """
+    json_text, html_text = _create_activity()
+    for path, text in (("Takeout/My Activity/Search/MyActivity.json", json_text),
+                       ("Takeout/Mijn activiteit/Zoeken/MijnActiviteit.html", html_text)):
+        archive = BytesIO()
+        with ZipFile(archive, 'w') as zip_archive:
+            zip_archive.writestr(path, text)
+        result = process(archive)
+        assert result["data_frames"] == []
+        searches = result["search_data_frames"][0]
+        expected = _reshape_expected()
+        # The search is on the search page, during the curfew in the morning
+        expected.loc[(expected["Curfew"] == "during") & (expected["Website"] == "other")
+                     & (expected["Time"] == "morning"), "Searches"] += 1
+        assert_frame_equal(searches, expected)
+        assert path.rsplit("/", 1)[-1] in result["summary"]
+
+
+def test_read_browser_history():
+    """ checks if streamed entries only keep the used fields
+    returns: if no AssertionError, entries are the same
+    """
+    result = list(_read_browser_history(BytesIO(json.dumps(DATA).encode('utf-8'))))
+    assert result == [{"time_usec": d["time_usec"],
+                       "page_transition": d["page_transition"],
+                       "url": d["url"]} for d in DATA["Browser History"]]
+
+
+def test_json_stream_small_chunks():
+    """ checks if values split over chunks are decoded
+    returns: if no AssertionError, values are the same
+    """
+    text = '\ufeff{"other": {"x": "]}"}, "numbers" : [ 1, 22 ,333 ], "last": 4444}'
+    stream = _JsonStream(BytesIO(text.encode('utf-8')), chunk_size=1)
+    stream.expect("{")
+    assert stream.decode() == "other"
+    stream.expect(":")
+    assert stream.decode() == {"x": "]}"}
+    stream.expect(",")
+    assert stream.decode() == "numbers"
+    stream.expect(":")
+    assert list(stream.iter_array()) == [1, 22, 333]
+    stream.expect(",")
+    assert stream.decode() == "last"
+    stream.expect(":")
+    assert stream.decode() == 4444
+    assert stream.expect("}") == "}"
+    assert stream.peek() == ""
+
+
+def test_classify_periods():
+    """ checks if visits at the start and end of the curfew are during the curfew
+    returns: if no AssertionError, periods are as expected
+    """
+    start = int(START.timestamp() * 1e6)
+    end = int(END.timestamp() * 1e6)
+    time_usec = np.array([start - 1, start, end, end + 1])
+    breakpoints = _compile_study(DEFAULT_STUDY)["breakpoints"]
+    assert _classify_periods(time_usec, breakpoints).tolist() == [0, 1, 1, 2]
+
+
+def test_local_hours():
+    """ checks if hours are converted to Amsterdam time, including daylight saving time
+    returns: if no AssertionError, hours are as expected
+    """
+    # 2020-12-1 12:30 UTC (CET) and 2021-4-29 12:00 UTC (CEST)
+    time_usec = np.array([1606825800000000, 1619697600000000])
+    assert _local_hours(time_usec).tolist() == [13, 14]
+
+
+def test_extract_batches():
+    """ checks if the result does not depend on the batch size
+    returns: if no AssertionError, outputs are the same
+    """
+    assert _extract(DATA, batch_size=2) == _extract(DATA)
+
+
+def test_classify_urls():
+    """ checks if news websites are matched on their host and subdomains only
+    returns: if no AssertionError, classifications are as expected
+    """
+    urls = np.array(["https://at5.nl/artikel", "https://www.NOS.nl:443/", "https://menu.nl/",
+                     "https://nos.nl.example.com/", "https://www.google.com/news.google.com",
+                     "http://user@news.google.com?x=1"], dtype=object)
+    codes, netlocs = _factorize_netlocs(urls)
+    assert _classify_netlocs(netlocs, (NEWS_DOMAINS,))[codes].tolist() == [0, 0, 1, 1, 1, 0]
+
+
+def test_load_domains(tmp_path):
+    """ checks if domains are loaded from a file
+    returns: if no AssertionError, domains are as expected
+    """
+    path = tmp_path / "domains.txt"
+    path.write_text("# news\nNOS.nl\n\n  uu.nl.  \n", encoding="utf8")
+    domains = load_domains(path)
+    assert domains == {"nos.nl", "uu.nl"}
+    assert _extract(DATA, domains=domains)[0][3]["night"] == 1
+
+
+STUDY = {
+    "period_name": "Year",
+    "periods": ("2020", "2021"),
+    "breakpoints": (ZONE.localize(datetime(2021, 1, 1)),),
+    "times": {"day": (7, 22), "night": (22, 7)},
+    "websites": {"news": {"nos.nl"}, "education": {"uu.nl"}}
+}
+
+
+def test_extract_studies():
+    """ checks if several studies are extracted in one pass over a generator
+    returns: if no AssertionError, dataframes are as expected
+    """
+    data = {"Browser History": iter(DATA["Browser History"])}
+    (curfew, _, _, year), _, _ = extract_studies(data, [DEFAULT_STUDY, STUDY])
+    assert_frame_equal(curfew, _reshape_expected())
+    assert list(year.columns) == ["Year", "Website", "Time", "Searches"]
+    assert year["Website"].tolist()[:6] == ["news", "news", "education", "education",
+                                            "other", "other"]
+    assert year["Searches"].tolist() == [0, 0, 0, 1, 1, 1, 2, 0, 0, 0, 2, 1]
+
+
+def test_compile_study_hours():
+    """ checks if times of day have to cover every hour once
+    returns: if no AssertionError, invalid studies are rejected
+    """
+    with pytest.raises(ValueError):
+        _compile_study(dict(STUDY, times={"day": (6, 22), "night": (21, 6)}))
+    with pytest.raises(ValueError):
+        _compile_study(dict(STUDY, times={"day": (7, 22)}))
+
+
+def test_top_domains_bounded():
+    """ checks if the top domains keep their error guarantee when fewer domains
+        are counted than visited
+    returns: if no AssertionError, estimates are within the error bound
+    """
+    rng = np.random.default_rng(0)
+    hosts = rng.zipf(1.5, 2000) % 300
+    entries = [{"page_transition": "LINK", "url": f"https://site{host}.nl/page",
+                "time_usec": 1606825800000000} for host in hosts]
+    study = dict(STUDY, top_domains=5, domain_capacity=20)
+    (_, top), _, _ = extract_studies({"Browser History": entries}, [study], batch_size=300)
+    top = top[top["Year"] == "2020"]
+    true = pd.Series(hosts).map(lambda host: f"site{host}.nl").value_counts()
+    error = top["Error"].iloc[0]
+    assert 0 < error <= len(entries) / (20 + 1)
+    assert top["Domain"].tolist() == true.index[:5].tolist()
+    for domain, visits in zip(top["Domain"], top["Visits"]):
+        assert visits <= true[domain] <= visits + error
+
+
+def test_compile_study_top_domains():
+    """ checks if the domain capacity has to fit the top domains
+    returns: if no AssertionError, invalid studies are rejected
+    """
+    with pytest.raises(ValueError):
+        _compile_study(dict(STUDY, top_domains=10, domain_capacity=5))
+
+
+def test_flag_repeats():
+    """ checks if visits of the same key within the window of the previous visit are flagged
+    returns: if no AssertionError, flags are as expected
+    """
+    time_usec = np.array([30, 0, 5, 12, 100, 3]) * 1000000
+    keys = np.array([0, 0, 0, 0, 0, 1])
+    repeat = _flag_repeats(time_usec, keys, 10 * 1000000)
+    assert repeat.tolist() == [False, False, True, True, False, False]
+
+
+def test_scan_repeats():
+    """ checks if rapid repeats are collapsed, also across batches
+    returns: if no AssertionError, counts do not depend on the batch size
+    """
+    entries = []
+    for entry in DATA["Browser History"]:
+        entries.extend([entry, dict(entry, time_usec=entry["time_usec"] + 2000000),
+                        dict(entry, url=entry["url"] + "?redirect",
+                             time_usec=entry["time_usec"] + 3000000)])
+    study = _compile_study(dict(DEFAULT_STUDY, top_domains=0))
+    expected = _scan(DATA, [study])["counts"][0]
+    for batch_size in (2, 3, 50):
+        data = {"Browser History": entries[::-1]}
+        by_url = _scan(data, [study], batch_size, repeat_window=5)
+        assert by_url["collapsed"] == 8
+        assert (by_url["counts"][0] == 2 * expected).all()
+        by_host = _scan(data, [study], batch_size, repeat_window=5, repeat_key="host")
+        assert by_host["collapsed"] == 16
+        assert (by_host["counts"][0] == expected).all()
+    with pytest.raises(ValueError):
+        _scan(DATA, [study], repeat_window=5, repeat_key="title")
+
+
+def test_process_repeats():
+    """ checks if the number of collapsed visits is reported
+    returns: if no AssertionError, the summary mentions the collapsed visits
+    """
+    result = process(_create_zip(), repeat_window=1e6)
+    assert "collapsed_visits: 0 visits repeated the same url" in result["summary"]
+    assert "collapsed_visits" not in process(_create_zip())["summary"]
+
+
+def test_split_sessions():
+    """ checks if sorted visits are split where the gap between them is too large
+    returns: if no AssertionError, sessions are as expected
+    """
+    sessions = _split_sessions(np.array([0, 10, 20, 100, 200, 205]), np.array([0, 1, 1, 1, 0, 0]),
+                               2, 50)
+    assert sessions["start"].tolist() == [0, 100, 200]
+    assert sessions["end"].tolist() == [20, 100, 205]
+    assert sessions["visits"].tolist() == [[1, 2], [0, 1], [2, 0]]
+
+
+def test_scan_sessions():
+    """ checks if sessions do not depend on the batch size and order of the visits
+    returns: if no AssertionError, sessions and their table are as expected
+    """
+    minute = 60 * 1000000
+    entries = [{"page_transition": "LINK", "url": url, "time_usec": 1612167660000000 + offset}
+               for url, offset in (("https://nos.nl/", 0), ("https://uu.nl/", 20 * minute),
+                                   ("https://nos.nl/", 45 * minute), ("https://ns.nl/", 90 * minute),
+                                   ("https://nos.nl/", 200 * minute))]
+    study = _compile_study(DEFAULT_STUDY)
+    for batch_size, order in ((50, 1), (1, 1), (2, -1)):
+        scan = _scan({"Browser History": entries[::order]}, [study], batch_size)
+        (sessions,) = scan["sessions"]
+        assert sessions["start"].tolist() == [entries[0]["time_usec"], entries[3]["time_usec"],
+                                              entries[4]["time_usec"]]
+        assert sessions["visits"].tolist() == [[2, 1], [0, 1], [1, 0]]
+    (_, _, table), _, _ = extract_studies({"Browser History": entries}, [DEFAULT_STUDY])
+    morning = table[(table["Curfew"] == "during")
+                    & (table["Time"] == "morning")].to_dict("records")[0]
+    assert morning["Sessions"] == 2
+    assert morning["Median minutes"] == 22.5
+    assert morning["Median visits"] == 2
+    assert morning["Share news"] == pytest.approx((2 / 3 + 0) / 2)
+    assert table["Sessions"].sum() == 3
+
+
+def test_tokenize():
+    """ checks if queries are split into lower case terms without stopwords and numbers
+    returns: if no AssertionError, terms are as expected
+    """
+    codes, terms = _tokenize(np.array(["Avondklok de COVID-19 regels", None, "the weather 2021",
+                                       "Één café", "the weather 2021"], dtype=object))
+    assert codes.tolist() == [0, -1, 1, 2, 1]
+    assert terms.tolist() == ["avondklok", "covid", "regels", "weather", "één", "café"]
+    assert terms.index.tolist() == [0, 0, 0, 1, 2, 2]
+
+
+def test_top_terms_bounded():
+    """ checks if the top search terms keep their error guarantee when fewer terms
+        are counted than searched
+    returns: if no AssertionError, estimates are within the error bound
+    """
+    rng = np.random.default_rng(1)
+    words = rng.zipf(1.5, (1500, 2)) % 400
+    entries = [{"page_transition": "LINK", "url": "https://www.google.com/search",
+                "time_usec": 1612167660000000, "query": f"covid term{first} term{second}"}
+               for first, second in words]
+    study = dict(STUDY, top_terms=4, term_capacity=30)
+    (_, top), _, _ = extract_studies({"Browser History": entries}, [study], batch_size=200)
+    top = top[top["Year"] == "2021"]
+    true = pd.Series([f"term{word}" for word in words.ravel()] + ["covid"] * len(entries))
+    true = true.value_counts()
+    error = top["Error"].iloc[0]
+    assert 0 < error <= true.sum() / (30 + 1)
+    assert top["Term"].tolist() == true.index[:4].tolist()
+    for term, searches in zip(top["Term"], top["Searches"]):
+        assert searches <= true[term] <= searches + error
+
+
+def test_extract_studies_without_top_domains():
+    """ checks if a study without top domains only gets the other dataframes
+    returns: if no AssertionError, dataframes are as expected
+    """
+    entries = [dict(entry, query="avondklok") for entry in DATA["Browser History"]]
+    study = dict(DEFAULT_STUDY, top_domains=0)
+    (curfew, sessions, terms), _, _ = extract_studies({"Browser History": entries}, [study])
+    assert_frame_equal(curfew, _reshape_expected())
+    assert "Sessions" in sessions.columns
+    assert terms["Term"].unique().tolist() == ["avondklok"]
+
+
+def test_extract_studies_without_top_lists():
+    """ checks if a study that counts neither domains nor search terms only gets its counts
+        and sessions, even if the visits have queries
+    returns: if no AssertionError, dataframes are as expected
+    """
+    entries = [dict(entry, query="avondklok") for entry in DATA["Browser History"]]
+    study = dict(DEFAULT_STUDY, top_domains=0, top_terms=0)
+    (curfew, sessions), _, _ = extract_studies({"Browser History": entries}, [study])
+    assert_frame_equal(curfew, _reshape_expected())
+    assert "Sessions" in sessions.columns
+
+
+def test_run_concurrently_without_threads(monkeypatch):
+    """ checks if the items are handled one by one once no more threads can be started
+    returns: if no AssertionError, results keep the order of the items
+    """
+    class LimitedExecutor(ThreadPoolExecutor):
+        """Executor that cannot start a thread for more than two items"""
+        submitted = 0
+
+        def submit(self, fn, /, *args, **kwargs):
+            LimitedExecutor.submitted += 1
+            if LimitedExecutor.submitted > 2:
+                raise RuntimeError("can't start new thread")
+            return super().submit(fn, *args, **kwargs)
+
+    assert _run_concurrently(str.upper, "abcde") == list("ABCDE")
+    monkeypatch.setattr(google_search_history, "ThreadPoolExecutor", LimitedExecutor)
+    assert _run_concurrently(str.upper, "abcde") == list("ABCDE")
+    assert LimitedExecutor.submitted == 3
+
+
+def test_scan_repeats_random_batches():
+    """ checks if collapsing repeats does not depend on the batch size, for random histories
+        sorted forwards or backwards in time
+    returns: if no AssertionError, small batches collapse the same visits as one batch
+    """
+    rng = np.random.default_rng(2)
+    study = _compile_study(dict(DEFAULT_STUDY, top_domains=0))
+    for _ in range(50):
+        time_usec = 1612167660000000 + np.sort(rng.integers(0, 60, 12)) * 1000000
+        entries = [{"page_transition": "LINK", "url": f"https://site{host}.nl/",
+                    "time_usec": int(time)}
+                   for time, host in zip(time_usec, rng.integers(0, 3, 12))]
+        for order in (1, -1):
+            data = {"Browser History": entries[::order]}
+            expected = _scan(data, [study], repeat_window=13)
+            for batch_size in (1, 2, 5):
+                scan = _scan(data, [study], batch_size, repeat_window=13)
+                assert scan["collapsed"] == expected["collapsed"]
+                assert scan["counts"][0].sum() == expected["counts"][0].sum()
+                if order == 1:
+                    assert (scan["counts"][0] == expected["counts"][0]).all()
+    forward = [{"page_transition": "LINK", "url": f"https://{url}.nl/", "time_usec": time}
+               for time, url in ((18000000, "b"), (21000000, "a"), (23000000, "b"))]
+    assert _scan({"Browser History": forward}, [study], 1, repeat_window=13)["collapsed"] == 1
@@ -3,15 +3,29 @@ import copy
 import json
 from zipfile import ZipFile
 from io import BytesIO
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from pytest import approx
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 from numpy import nan
 
+from google_semantic_location_history import _read_timeline
+from google_semantic_location_history import _read_records
+from google_semantic_location_history import _haversine
+from google_semantic_location_history import _stay_points
+from google_semantic_location_history import _summarize_records
+from google_semantic_location_history import _timeline_table
 from google_semantic_location_history import _visit_duration
+from google_semantic_location_history import _top_places
 from google_semantic_location_history import _activity_duration
 from google_semantic_location_history import _activity_distance
+from google_semantic_location_history import _describe_periods
+from google_semantic_location_history import _map_months
+from google_semantic_location_history import period_range
 from google_semantic_location_history import process
+import google_semantic_location_history
 
 
 ACTIVITY_DATA = {
@@ -79,6 +93,56 @@ VISIT_DATA = {
 ]}
 
 
+DETAILED_DATA = {
+    "timelineObjects" : [ {
+        "activitySegment" : {
+            "startLocation" : {"latitudeE7" : 523702000, "longitudeE7" : 48952000},
+            "endLocation" : {"latitudeE7" : 520907000, "longitudeE7" : 51214000},
+            "duration" : {"startTimestampMs" : "0", "endTimestampMs" : "3600000"},
+            "distance" : 42000,
+            "activityType" : "IN_PASSENGER_VEHICLE",
+            "activities" : [{"activityType" : "IN_PASSENGER_VEHICLE", "probability" : 91.5},
+                            {"activityType" : "CYCLING", "probability" : 4.2}],
+            "waypointPath" : {"waypoints" : [{"latE7" : 523702000, "lngE7" : 48952000}] * 50},
+            "simplifiedRawPath" : {"points" : [{"latE7" : 1, "lngE7" : 2, "timestampMs" : "3"}] * 20}
+        }
+    }, {
+        "placeVisit" : {
+            "location" : {
+                "latitudeE7" : 520907000,
+                "longitudeE7" : 51214000,
+                "placeId" : "place\"[{Utrecht}]\\",
+                "address" : "Domplein 29\n3512 JE Utrecht \u00e9 [centrum]"
+            },
+            "duration" : {"startTimestampMs" : "3600000", "endTimestampMs" : "7200000"},
+            "otherCandidateLocations" : [{"placeId" : "placeB", "locationConfidence" : 1.5}],
+            "childVisits" : [{"location" : {"placeId" : "placeC"}, "duration" : {}}],
+            "editConfirmationStatus" : "NOT_CONFIRMED"
+        }
+    } ]
+}
+
+# A stay of half an hour, a trip of six steps north of 0.01 degree and another stay
+START_MS = 1577865600000
+RECORDS_DATA = {"locations": [{
+    "latitudeE7": 520900000 + 100000 * max(0, min(step - 6, 6)),
+    "longitudeE7": 51200000,
+    "accuracy": 10,
+    "timestampMs": str(START_MS + step * 300000),
+    "activity": [{
+        "activity": [{"type": "STILL", "confidence": 100}],
+        "timestampMs": "0"
+    }],
+    "source": "WIFI"
+} for step in range(19)]}
+RECORDS_DATA["locations"][3]["accuracy"] = 500
+RECORDS_DATA["locations"][3]["latitudeE7"] = 0
+del RECORDS_DATA["locations"][4]["accuracy"]
+RECORDS_DATA["locations"][5]["timestamp"] = "2020-01-01T08:25:00.000Z"
+del RECORDS_DATA["locations"][5]["timestampMs"]
+RECORDS_DATA["locations"][6]["source"] = "a \\\"quoted\\\" {source}"
+RECORDS_DATA["locations"].insert(7, {"timestampMs": "0", "deviceTag": 1})
+
 def _create_zip():
     """
     returns: zip archive
@@ -97,6 +161,27 @@ def _create_zip():
             file1.write(json.dumps(data_2020).encode('utf-8'))
     return archive
 
+def _create_zip_records():
+    """
+    returns: zip archive with Records.json
+    """
+    archive = _create_zip()
+    with ZipFile(archive, 'a') as zip_archive:
+        with zip_archive.open('Takeout/Location History/Records.json', 'w') as file1:
+            file1.write(json.dumps(RECORDS_DATA, indent=2).encode('utf-8'))
+    return archive
+
+def _create_zip_legacy_records():
+    """
+    returns: zip archive with the records in the legacy Location History.json, newest first
+    """
+    archive = _create_zip()
+    data = {"locations": RECORDS_DATA["locations"][::-1]}
+    with ZipFile(archive, 'a') as zip_archive:
+        with zip_archive.open('Takeout/Location History/Location History.json', 'w') as file1:
+            file1.write(json.dumps(data, indent=2).encode('utf-8'))
+    return archive
+
 def _create_zip_no_matching_files():
     """
     returns: zip archive
@@ -111,16 +196,58 @@ def _create_zip_no_matching_files():
             file1.write(json.dumps(data).encode('utf-8'))
     return archive
 
+def test_timeline_table():
+    table = _timeline_table(ACTIVITY_DATA["timelineObjects"] + VISIT_DATA["timelineObjects"])
+    assert table["visit"].tolist() == [True, True, True, True, False, False]
+    assert table["place"].tolist() == [0, 1, 2, 3, -1, -1]
+    assert table["places"].tolist() == ["placeX", "placeZ", "placeY", "placeA"]
+    assert table["start_ms"].dtype == "int64"
+    assert table["end_ms"].tolist()[3:] == [10000000, 302400000, 43200000]
+    assert table["distance"].tolist()[3:] == [0, 1000, 500]
+
+def test_read_timeline():
+    expected = [{
+        "activitySegment" : {
+            "startLocation" : {"latitudeE7" : 523702000, "longitudeE7" : 48952000},
+            "endLocation" : {"latitudeE7" : 520907000, "longitudeE7" : 51214000},
+            "duration" : {"startTimestampMs" : "0", "endTimestampMs" : "3600000"},
+            "distance" : 42000,
+            "activityType" : "IN_PASSENGER_VEHICLE"
+        }
+    }, {
+        "placeVisit" : {
+            "location" : {"latitudeE7" : 520907000, "longitudeE7" : 51214000, "placeId" : "place\"[{Utrecht}]\\"},
+            "duration" : {"startTimestampMs" : "3600000", "endTimestampMs" : "7200000"}
+        }
+    }]
+    assert list(_read_timeline(json.dumps(DETAILED_DATA).encode("utf8"))) == expected
+    assert list(_read_timeline(json.dumps(DETAILED_DATA, indent=2, ensure_ascii=False).encode("utf8"))) == expected
+    assert list(_read_timeline(json.dumps(VISIT_DATA).encode("utf8"))) == VISIT_DATA["timelineObjects"]
+    assert list(_read_timeline(b'{"timelineObjects": []}')) == []
+
+def test_read_timeline_chunks(monkeypatch):
+    # chunk boundaries fall in strings and between a backslash and a quote
+    contents = json.dumps(DETAILED_DATA).encode("utf8")
+    expected = list(_read_timeline(contents))
+    for chunk_size in [1, 2, 3, 7]:
+        monkeypatch.setattr(google_semantic_location_history, "CHUNK_SIZE", chunk_size)
+        assert list(_read_timeline(contents)) == expected
+
 def test_visit_duration():
-    result = _visit_duration(VISIT_DATA)
-    assert result == dict([('placeX', 1.0), ('placeY', 0.5), ('placeZ', 0.25), ('placeA', 0.116)])
+    result = _visit_duration(_timeline_table(VISIT_DATA["timelineObjects"]))
+    assert result.to_dict() == dict([('placeX', 1.0), ('placeY', 0.5), ('placeZ', 0.25), ('placeA', 0.116)])
+
+def test_top_places():
+    places = pd.Series([0.5, 2.0, 0.5, 1.0, 0.5], index=["A", "B", "C", "D", "E"])
+    assert list(_top_places(places, 3).items()) == [("B", 2.0), ("D", 1.0), ("A", 0.5)]
+    assert list(_top_places(places, 10)) == ["B", "D", "A", "C", "E"]
 
 def test_activity_duration():
-    result = _activity_duration(ACTIVITY_DATA)
+    result = _activity_duration(_timeline_table(ACTIVITY_DATA["timelineObjects"]))
     assert result == approx(3.0)
 
 def test_activity_distance():
-    result = _activity_distance(ACTIVITY_DATA)
+    result = _activity_distance(_timeline_table(ACTIVITY_DATA["timelineObjects"]))
     assert result == approx(1.5)
 
 def test_process():
@@ -129,8 +256,122 @@ def test_process():
         {'Year': 2020, 'Month': 'JANUARY', 'Number of Places': 3, 'Places Duration [days]': 1.866, 'Activity Duration [days]': 0.0, 'Activity Distance [km]': 0.0, 'Place 1 [days]': 1.116, 'Place 2 [days]': 0.5, 'Place 3 [days]': 0.25, 'Place 4 [days]': 0.},
         {'Year': 2021, 'Month': 'JANUARY', 'Number of Places': 4, 'Places Duration [days]': 1.866, 'Activity Duration [days]': 0.0, 'Activity Distance [km]': 0.0, 'Place 1 [days]': 0., 'Place 2 [days]': 0.5, 'Place 3 [days]': 0.25, 'Place 4 [days]': 1.0}])
     assert_frame_equal(result["data_frames"][0], expected)
+    assert "Location History data for January in 2020 and 2021." in result["summary"]
 
 def test_process_no_matching_files():
     result = process(_create_zip_no_matching_files())
     expected = pd.DataFrame()
     assert_frame_equal(result["data_frames"][0], expected)
+    assert "data for none of the selected months." in result["summary"]
+
+def test_describe_periods():
+    periods = [(2019, "JANUARY"), (2020, "JANUARY"), (2020, "MARCH"), (2021, "JANUARY")]
+    assert _describe_periods(periods) == "January in 2019, 2020, and 2021 and March in 2020"
+    assert _describe_periods(periods[:2]) == "January in 2019 and 2020"
+
+def test_period_range():
+    assert period_range((2020, 11), (2021, 2)) == [
+        (2020, "NOVEMBER"), (2020, "DECEMBER"), (2021, "JANUARY"), (2021, "FEBRUARY")]
+    assert period_range((2021, 3), (2021, 2)) == []
+
+def test_process_period_range():
+    result = process(_create_zip_no_matching_files(), period_range((2015, 1), (2022, 12)))
+    data_frame = result["data_frames"][0]
+    assert list(zip(data_frame["Year"], data_frame["Month"])) == [(2018, "JANUARY"), (2021, "MARCH")]
+    assert data_frame["Number of Places"].tolist() == [4, 4]
+    assert "data for January in 2018 and March in 2021." in result["summary"]
+
+def test_process_workers():
+    periods = period_range((2019, 1), (2021, 12))
+    result = process(_create_zip(), periods, workers=2)
+    assert_frame_equal(result["data_frames"][0], process(_create_zip(), periods)["data_frames"][0])
+
+def test_process_workers_unavailable(monkeypatch):
+    def unavailable(workers):
+        raise NotImplementedError("no processes")
+    monkeypatch.setattr(google_semantic_location_history, "ProcessPoolExecutor", unavailable)
+    result = process(_create_zip(), workers=4)
+    assert_frame_equal(result["data_frames"][0], process(_create_zip())["data_frames"][0])
+
+def test_map_months_broken_pool(monkeypatch):
+    class BrokenPool:
+        """Pool whose workers die after five months, when a month is submitted
+        or when its result is collected"""
+        def __init__(self, workers):
+            self.submitted = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def submit(self, func, job):
+            self.submitted += 1
+            if self.submitted > 5 and breaks == "submit":
+                raise BrokenProcessPool("a worker died")
+            future = Future()
+            if self.submitted > 5:
+                future.set_exception(BrokenProcessPool("a worker died"))
+            else:
+                future.set_result(func(job))
+            return future
+
+    monkeypatch.setattr(google_semantic_location_history, "ProcessPoolExecutor", BrokenPool)
+    monkeypatch.setattr(google_semantic_location_history, "_process_month", lambda job: job * 10)
+    for breaks in ("submit", "result"):
+        assert list(_map_months(iter(range(9)), workers=2)) == [job * 10 for job in range(9)]
+
+def test_read_records():
+    locations = [location for location in RECORDS_DATA["locations"] if "latitudeE7" in location]
+    for contents in [json.dumps(RECORDS_DATA), json.dumps(RECORDS_DATA, indent=2)]:
+        for chunk_size in [16, 2**20]:
+            chunks = list(_read_records(BytesIO(contents.encode("utf8")), chunk_size))
+            records = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+            assert records["time_ms"].tolist() == [START_MS + step * 300000 for step in range(19)]
+            assert records["lat_e7"].tolist() == [location["latitudeE7"] for location in locations]
+            assert records["lng_e7"].tolist() == [51200000] * 19
+            assert records["accuracy"].tolist() == [10, 10, 10, 500, -1] + [10] * 14
+
+def test_haversine():
+    assert _haversine(52.09, 5.12, 52.10, 5.12) == approx(1111.95, abs=0.01)
+    assert _haversine(np.zeros(2), np.zeros(2), np.zeros(2), np.array([0, 180])).tolist() == approx([0, 20015114], abs=1)
+
+def test_stay_points():
+    time_ms = np.arange(12) * 300000
+    lat = np.array([52.09] * 5 + [52.1, 52.11] + [52.12] * 5)
+    points = {"time_ms": time_ms, "lat": lat, "lng": np.full(12, 5.12)}
+    assert _stay_points(points) == ([0, 7], [5, 12], 12)
+    assert _stay_points(points, final=False) == ([0], [5], 7)
+    assert _stay_points(points, min_duration=3600000) == ([], [], 12)
+
+def test_summarize_records():
+    contents = json.dumps(RECORDS_DATA).encode("utf8")
+    distance, stays = _summarize_records(_read_records(BytesIO(contents)))
+    assert distance.to_dict() == {18262: approx(6671.7, abs=0.1)}
+    assert stays["arrival_ms"].tolist() == [START_MS, START_MS + 12 * 300000]
+    assert stays["departure_ms"].tolist() == [START_MS + 6 * 300000, START_MS + 18 * 300000]
+    assert stays["lat"].tolist() == approx([52.09, 52.15])
+    chunked = _summarize_records(_read_records(BytesIO(contents), 100))
+    assert chunked[0].to_dict() == approx(distance.to_dict())
+    assert_frame_equal(chunked[1], stays)
+
+def test_process_records():
+    result = process(_create_zip_records())
+    expected = pd.DataFrame({
+        "Date": ["2020-01-01"],
+        "Distance [km]": [6.672],
+        "Number of Stays": [2],
+        "Stay Duration [days]": [0.042]
+    })
+    assert_frame_equal(result["records_data_frames"][0], expected)
+    assert result["summary"].endswith(google_semantic_location_history.RECORDS_TEXT)
+    assert_frame_equal(result["data_frames"][0], process(_create_zip())["data_frames"][0])
+    assert process(_create_zip())["records_data_frames"] == []
+    assert process(_create_zip_records(), [(2021, "JANUARY")])["records_data_frames"][0].empty
+
+def test_process_legacy_records():
+    # newest first records are not mistaken for records that go back in time
+    result = process(_create_zip_legacy_records())
+    assert result["records_data_frames"] == []
+    assert not result["summary"].endswith(google_semantic_location_history.RECORDS_TEXT)
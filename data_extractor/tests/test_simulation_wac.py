@@ -0,0 +1,48 @@
+import pytest
+
+from whatsapp_chat import candidate_hformats, get_participants_features, parse_chat
+from whatsapp_chat.benchmark_wac import benchmark, compare
+from whatsapp_chat.simulation_wac import _header_format, create_chat, create_zip
+
+
+def test_header_format():
+    header, alert = _header_format("[%d-%m-%y %H:%M:%S] %name:")
+    assert header == "[%d-%m-%y %H:%M:%S] {name}: "
+    assert alert == "[%d-%m-%y %H:%M:%S] "
+
+
+def test_create_chat_seeded():
+    assert create_chat(50, 3, seed=1) == create_chat(50, 3, seed=1)
+    assert create_chat(50, 3, seed=1)[0] != create_chat(50, 3, seed=2)[0]
+
+
+@pytest.mark.parametrize("hformat", candidate_hformats())
+def test_create_chat_parses(hformat):
+    text, stats = create_chat(300, 5, hformat, seed=0)
+    errors = []
+    df_chat = parse_chat(errors.append, text)
+    assert len(df_chat) == 300
+    assert len(text.splitlines()) == stats["lines"]
+
+    features = get_participants_features(df_chat).set_index("username")
+    assert features["Number of messages"].to_dict() == dict(stats["messages"])
+    assert features["Number of URLs"].sum() == stats["urls"]
+    assert features["Number of shared locations"].sum() == stats["locations"]
+    assert features["Number of shared files"].sum() == stats["attachments"]
+
+
+def test_create_zip(tmp_path):
+    zip_path, stats = create_zip(tmp_path, 100, 4, seed=0)
+    assert zip_path.exists()
+    assert sum(stats["messages"].values()) == 100
+
+
+def test_benchmark():
+    results = benchmark(200, 3, repeat=1)
+    assert list(results["step"]) == ["parse_chat", "get_participants_features", "process"]
+    assert (results["messages/s"] > 0).all()
+    assert (results["peak MB"] > 0).all()
+
+    baseline = results.assign(**{"messages/s": results["messages/s"] * 2})
+    assert compare(results, baseline)["regression"].all()
+    assert not compare(results, results)["regression"].any()
@@ -0,0 +1,30 @@
+"""Test that the extraction scripts run on their own, as in the web application"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+# the web application fetches a single script (pyprocess.js) and runs it without
+# its package (pyworker.js), so it cannot import modules next to it
+RUN_SCRIPT = """
+import sys
+with open(sys.argv[1], encoding="utf8") as file:
+    namespace = {"__name__": "__main__"}
+    exec(file.read(), namespace)
+assert callable(namespace["process"])
+"""
+
+
+@pytest.mark.parametrize("package", sorted(path.parent.name for path in ROOT.glob("*/index.html")))
+def test_script_runs_standalone(package, tmp_path):
+    """ checks if the script of each extractor runs without the rest of the project
+    returns: if no AssertionError, the script defines process
+    """
+    script = ROOT / package / "__init__.py"
+    # isolated mode, so neither the project nor the working directory is importable
+    result = subprocess.run([sys.executable, "-I", "-c", RUN_SCRIPT, str(script)],
+                            cwd=tmp_path, capture_output=True, text=True, check=False)
+    assert result.returncode == 0, result.stderr
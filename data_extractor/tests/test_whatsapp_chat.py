@@ -1,38 +1,86 @@
+import codecs
+from io import BytesIO
 from pathlib import Path
+import zipfile
+import numpy as np
 import pandas as pd
+import pytest
+
+import whatsapp_chat
 
 from whatsapp_chat import process
 from whatsapp_chat import anonymize_participants
+from whatsapp_chat import parse_chat
+from whatsapp_chat import sniff_hformats
+from whatsapp_chat import iter_chat_records
+from whatsapp_chat import get_participants_features
+from whatsapp_chat import get_participants_features_from_records
+from whatsapp_chat import decode_header_dates
+from whatsapp_chat import scan_messages
+from whatsapp_chat import strip_alerts
+from whatsapp_chat import compile_hformat
+from whatsapp_chat import zipfile_participants
+from whatsapp_chat import get_response_pairs
+from whatsapp_chat import get_response_matrix
+from whatsapp_chat import get_top_repliers
+from whatsapp_chat import remove_system_messages
+from whatsapp_chat import compile_emoji_regex
+from whatsapp_chat import count_emojis
 
 from pandas.testing import assert_frame_equal
 
 
 DATA_PATH = Path(__file__).parent / "data"
 
+US_CHAT = """3/16/22, 15:20 - person1: Hi shiva!
+3/16/22, 15:25 - person2: Hi
+how are you?
+12/1/22, 09:00 - person1: Fine
+"""
+
+# Day-first chat whose first 4 KB only has days up to 12
+AMBIGUOUS_CHAT = "".join(f"{day}/2/22, 10:00 - person{day % 3}: message number {number}\n"
+                         for number, day in enumerate([1, 2, 3, 12] * 40)) + \
+    "13/2/22, 10:00 - person1: bye\n"
+
+ALERT_CHAT = """[16/03/2022, 15:20:25] person1: Hi
+second line
+[16/03/2022, 15:21:00] person1 added person3
+[16/03/2022, 15:25:38] person2: Hoi
+"""
+
 EXPECTED = [
     {'username': 'person1', 'Total number of words': 20, 'Number of URLs': 1,
-     'Number of shared locations': 1, 'file_no': 0, 'Number of messages': 3,
+     'Number of shared locations': 1, 'Number of shared files': 0, 'Number of emojis': 1, 'Favorite emoji': '😁',
+     'Number of messages': 3,
      'Date first message': pd.to_datetime('2022-03-16 15:20:25'),
      'Date last message': pd.to_datetime('2022-03-24 20:19:38'),
-     'user_reply2': 'person2', 'reply_2_user': 'person2'},
+     'Who do you most often reply to?': 'person2',
+     'Who replies to you the most often?': 'person2'},
 
     {'username': 'person2', 'Total number of words': 7, 'Number of URLs': 1,
-     'Number of shared locations': 0, 'file_no': 0, 'Number of messages': 3,
+     'Number of shared locations': 0, 'Number of shared files': 0, 'Number of emojis': 2, 'Favorite emoji': '👋',
+     'Number of messages': 3,
      'Date first message': pd.to_datetime('2022-03-16 15:25:38'),
      'Date last message': pd.to_datetime('2022-03-26 18:52:15'),
-     'user_reply2': 'person1', 'reply_2_user': 'person1'},
+     'Who do you most often reply to?': 'person1',
+     'Who replies to you the most often?': 'person1'},
 
     {'username': 'person3', 'Total number of words': 1, 'Number of URLs': 0,
-     'Number of shared locations': 0, 'file_no': 0, 'Number of messages': 1,
+     'Number of shared locations': 0, 'Number of shared files': 0, 'Number of emojis': 0, 'Favorite emoji': np.nan,
+     'Number of messages': 1,
      'Date first message': pd.to_datetime('2022-03-16 15:26:48'),
      'Date last message': pd.to_datetime('2022-03-16 15:26:48'),
-     'user_reply2': 'person2', 'reply_2_user': 'person2'},
+     'Who do you most often reply to?': 'person2',
+     'Who replies to you the most often?': 'person2'},
 
     {'username': 'person4', 'Total number of words': 21, 'Number of URLs': 0,
-     'Number of shared locations': 0, 'file_no': 0, 'Number of messages': 2,
+     'Number of shared locations': 0, 'Number of shared files': 0, 'Number of emojis': 1, 'Favorite emoji': '👍',
+     'Number of messages': 2,
      'Date first message': pd.to_datetime('2020-07-14 22:05:54'),
      'Date last message': pd.to_datetime('2022-03-20 20:08:51'),
-     'user_reply2': 'person1', 'reply_2_user': 'person1'}
+     'Who do you most often reply to?': 'person1',
+     'Who replies to you the most often?': 'person1'}
 ]
 
 
@@ -46,46 +94,322 @@ def test_process():
          participants dataframe
         """
 
-    df_expected = pd.DataFrame(EXPECTED)
-    df_expected = anonymize_participants(df_expected)
-    df_expected['Number of messages'] = df_expected['Number of messages'].astype('int64')
-    df_expected['Number of URLs'] = df_expected['Number of URLs'].astype('int32')
-    df_expected['Number of shared locations'] = \
-        df_expected['Number of shared locations'].astype('int32')
-    df_expected['file_no'] = df_expected['file_no'].astype('int32')
-
-    results = []
+    df_expected = anonymize_participants(pd.DataFrame(EXPECTED))
     df_melt = pd.melt(df_expected, id_vars=["username"],
                       value_vars=["Total number of words",
                                   "Number of messages",
                                   "Date first message",
                                   "Date last message",
                                   "Number of URLs",
-                                  "file_no",
+                                  "Number of shared files",
                                   "Number of shared locations",
-                                  "reply_2_user",
-                                  "user_reply2"],
+                                  "Number of emojis",
+                                  "Favorite emoji",
+                                  "Who replies to you the most often?",
+                                  "Who do you most often reply to?"],
                       var_name='Description', value_name='Value')
+    df_melt = df_melt.sort_values("username", kind="stable")
+    df_melt = df_melt[df_melt["Value"].notna() & (df_melt["Value"] != 0)].reset_index(drop=True)
+    df_melt.insert(0, "Chat", "chat1")
+
+    result = process(DATA_PATH.joinpath("_chat.txt"))
+
+    assert [r["id"] for r in result] == ["participants"]
+    assert_frame_equal(result[0]["data_frame"], df_melt)
+
+
+def test_sniff_hformats_day_first():
+    """ Test that the header format of _chat.txt is detected as day-first."""
+    text = DATA_PATH.joinpath("_chat.txt").read_text(encoding="utf8")
+    assert sniff_hformats(text) == ['[%d/%m/%y, %H:%M:%S] %name:']
+
+
+def test_sniff_hformats_month_first():
+    """ Test that days above 12 rank the month-first format first."""
+    assert sniff_hformats(US_CHAT)[0] == '%m/%d/%y, %H:%M - %name:'
+
+
+def test_sniff_hformats_ambiguous_sample(monkeypatch):
+    """ Test that a sample with days up to 12 is extended until a day tells the formats apart."""
+    text = AMBIGUOUS_CHAT
+    assert len(text.split("13/2/22")[0]) > 4096
+    assert sniff_hformats(text[:4096]) == ['%m/%d/%y, %H:%M - %name:', '%d/%m/%y, %H:%M - %name:']
+    assert sniff_hformats(text) == ['%d/%m/%y, %H:%M - %name:', '%m/%d/%y, %H:%M - %name:']
+
+    calls = []
+    parse_text = whatsapp_chat.parse_text
+
+    def counted_parse_text(*args):
+        calls.append(args)
+        return parse_text(*args)
+
+    monkeypatch.setattr(whatsapp_chat, "parse_text", counted_parse_text)
+    errors = []
+    chat = parse_chat(errors.append, text)
+    assert len(calls) == 1
+    assert str(chat["date"].iloc[-1]) == "2022-02-13 10:00:00"
+
+
+def test_parse_chat_detected_format():
+    """ Test that a chat is parsed with the detected header format."""
+    errors = []
+    chat = parse_chat(errors.append, US_CHAT)
+    assert list(chat["username"]) == ["person1", "person2", "person1"]
+    assert list(chat["message"]) == ["Hi shiva!", "Hi\nhow are you?", "Fine"]
+    assert str(chat["date"][2]) == "2022-12-01 09:00:00"
+
+
+def test_parse_chat_no_format():
+    """ Test that text without any known header is rejected."""
+    errors = []
+    assert parse_chat(errors.append, "no headers here") is None
+    assert errors == ["hformats did not match the provided text. No match was found"]
+
+
+def test_iter_chat_records():
+    """ Test that streamed records keep multi-line messages and drop alerts."""
+    errors = []
+    records = list(iter_chat_records(errors.append, BytesIO(ALERT_CHAT.encode("utf8")), chunk_size=5))
+    assert [record[1:] for record in records] == [("person1", "Hi\nsecond line"), ("person2", "Hoi")]
+    assert str(records[1][0]) == "2022-03-16 15:25:38"
+    assert errors == ["Number of unprocessed system messages: 1"]
+
+
+def test_participants_features_from_records():
+    """ Test that streamed participant features equal the ones of the whole chat."""
+    errors = []
+    with zipfile.ZipFile(DATA_PATH.joinpath("whatsapp_chat.zip")) as zfile:
+        chat = whatsapp_chat.parse_zipfile(errors.append, zfile)[0]
+        with zfile.open("_chat.txt") as f:
+            streamed = get_participants_features_from_records(
+                iter_chat_records(errors.append, f), chunk_size=2)
+    assert_frame_equal(streamed, get_participants_features(chat))
+
+
+def test_process_streaming(monkeypatch):
+    """ Test that process gives the same results when the chat is streamed."""
+    expected = process(DATA_PATH.joinpath("whatsapp_chat.zip"))
+    monkeypatch.setattr(whatsapp_chat, "STREAMING_THRESHOLD", 0)
+    result = process(DATA_PATH.joinpath("whatsapp_chat.zip"))
+    assert [r["id"] for r in result] == [r["id"] for r in expected]
+    for streamed, parsed in zip(result, expected):
+        assert_frame_equal(streamed["data_frame"], parsed["data_frame"])
+
+
+def test_chat_participants_streaming_ambiguous_head(tmp_path, monkeypatch):
+    """ Test that a streamed day-first chat with only days up to 12 in its head is parsed."""
+    with zipfile.ZipFile(tmp_path / "chat.zip", "w") as zfile:
+        zfile.writestr("_chat.txt", AMBIGUOUS_CHAT)
+    with zipfile.ZipFile(tmp_path / "chat.zip") as zfile:
+        errors = []
+        expected = whatsapp_chat.chat_participants(errors.append, zfile, "_chat.txt")
+        monkeypatch.setattr(whatsapp_chat, "STREAMING_THRESHOLD", 0)
+        streamed = whatsapp_chat.chat_participants(errors.append, zfile, "_chat.txt")
+
+        # The next format is tried when the best ranked one fails on a later header
+        monkeypatch.setattr(whatsapp_chat, "sniff_chat_file", lambda f: [
+            '%m/%d/%y, %H:%M - %name:', '%d/%m/%y, %H:%M - %name:'])
+        fallback = whatsapp_chat.chat_participants(errors.append, zfile, "_chat.txt")
+    assert errors == []
+    assert_frame_equal(streamed, expected)
+    assert_frame_equal(fallback, expected)
+    assert str(expected["Date last message"].max()) == "2022-02-13 10:00:00"
+
+
+def test_chat_participants_streaming_bom(tmp_path, monkeypatch, capsys):
+    """ Test that the first message of a streamed chat with a byte order mark is counted."""
+    with zipfile.ZipFile(tmp_path / "chat.zip", "w") as zfile:
+        zfile.writestr("_chat.txt", codecs.BOM_UTF8 + AMBIGUOUS_CHAT.encode("utf-8"))
+    with zipfile.ZipFile(tmp_path / "chat.zip") as zfile:
+        errors = []
+        expected = whatsapp_chat.chat_participants(errors.append, zfile, "_chat.txt")
+        monkeypatch.setattr(whatsapp_chat, "STREAMING_THRESHOLD", 0)
+        streamed = whatsapp_chat.chat_participants(errors.append, zfile, "_chat.txt")
+    assert errors == []
+    assert_frame_equal(streamed, expected)
+    assert expected["Number of messages"].sum() == AMBIGUOUS_CHAT.count(" - ")
+    # Formats that do not match are skipped without debugging output
+    assert capsys.readouterr().out == ""
+
+
+def test_process_streaming_same_output(tmp_path, monkeypatch):
+    """ Test that pseudonyms and rows do not depend on whether the chat is streamed."""
+    with zipfile.ZipFile(tmp_path / "chat.zip", "w") as zfile:
+        zfile.writestr("_chat.txt", AMBIGUOUS_CHAT)
+    expected = process(tmp_path / "chat.zip")
+    monkeypatch.setattr(whatsapp_chat, "STREAMING_THRESHOLD", 0)
+    result = process(tmp_path / "chat.zip")
+    assert [r["id"] for r in result] == ["participants"]
+    assert_frame_equal(result[0]["data_frame"], expected[0]["data_frame"])
+    assert expected[0]["data_frame"]["username"].unique().tolist() == ["person0", "person1", "person2"]
+
+
+def test_decode_header_dates():
+    """ Test the columnar header decoder on 12-hour clocks and 2-digit years."""
+    fields = {"year": ["22", "2021", "20"], "month": ["3", "12", "2"], "day": ["16", "31", "29"],
+              "hour": ["12", "12", "1"], "minutes": ["05", "00", "30"],
+              "ampm": ["AM", "pm", "PM"]}
+    expected = np.array(["2022-03-16T00:05", "2021-12-31T12:00", "2020-02-29T13:30"],
+                        dtype="datetime64[ns]")
+    np.testing.assert_array_equal(decode_header_dates(fields), expected)
+
+
+def test_decode_header_dates_out_of_range():
+    """ Test that impossible dates are rejected."""
+    fields = {"year": ["2021"], "month": ["2"], "day": ["29"], "hour": ["10"],
+              "minutes": ["00"], "seconds": ["00"]}
+    with pytest.raises(ValueError):
+        decode_header_dates(fields)
+
+
+def test_scan_messages():
+    """ Test that the single scan counts the features of every message."""
+    messages = ["https://start.nl Location: https://maps.google.com/?q=3,4",
+                "see https://a.nl and (https://b.nl)",
+                "\u200eLocation: https://maps.google.com/?q=1,2",
+                "<attached: 0001-PHOTO.jpg> nice",
+                "bye\n"]
+    features = scan_messages(messages)
+    assert features.to_dict("list") == {
+        "Total number of words": [3, 4, 2, 3, 1],
+        "Number of URLs": [2, 2, 1, 0, 0],
+        "Number of shared locations": [1, 0, 1, 0, 0],
+        "Number of shared files": [0, 0, 0, 1, 0]}
+    assert list(features.dtypes) == [np.int64] * 4
+    assert scan_messages([]).empty
+
+
+def test_strip_alerts():
+    """ Test that messages are cut at their first alert and all alerts are counted."""
+    _, alert_regex, _ = compile_hformat('[%d/%m/%y, %H:%M:%S] %name:')
+    messages = ["see https://a.nl",
+                "bye\n[16/03/2022, 15:21:00] person1 left https://c.nl\n[16/03/2022, 15:22:00] x"]
+    cleaned, alerts_no = strip_alerts(messages, alert_regex)
+    assert cleaned == ["see https://a.nl", "bye\n"]
+    assert alerts_no == 2
+
+
+def _create_multi_chat_zip(path):
+    """ Write a zip file with the test chat and US_CHAT."""
+    with zipfile.ZipFile(path, "w") as zfile:
+        zfile.write(DATA_PATH.joinpath("_chat.txt"), "WhatsApp Chat - group/_chat.txt")
+        zfile.writestr("WhatsApp Chat - friend/_chat.txt", US_CHAT)
+        zfile.writestr("__MACOSX/._chat.txt", "")
+    return path
+
+
+def test_zipfile_participants_all_chats(tmp_path, monkeypatch):
+    """ Test that every chat in the archive is parsed, in threads, processes or serially."""
+    path = _create_multi_chat_zip(tmp_path / "chats.zip")
+    errors = []
+    with zipfile.ZipFile(path) as zfile:
+        threaded = zipfile_participants(errors.append, zfile)
+        serial = zipfile_participants(errors.append, zfile, max_workers=1)
+        monkeypatch.setattr(whatsapp_chat, "PROCESS_POOL_THRESHOLD", -1)
+        processes = zipfile_participants(errors.append, zfile, path=path)
+    assert list(threaded["Chat"]) == ["chat1"] * 4 + ["chat2"] * 2
+    assert list(threaded["username"]) == ["person1", "person2", "person3", "person4",
+                                          "person1", "person2"]
+    assert list(threaded["Number of messages"]) == [3, 3, 1, 2, 2, 1]
+    assert_frame_equal(serial, threaded)
+    assert_frame_equal(processes, threaded)
+
+
+def test_process_multi_chat(tmp_path):
+    """ Test that process reports participants per chat with shared pseudonyms."""
+    result = process(_create_multi_chat_zip(tmp_path / "chats.zip"))
+    assert [r["id"] for r in result] == ["participants"]
+    participants = result[0]["data_frame"][["Chat", "username"]].drop_duplicates()
+    assert participants.values.tolist() == [
+        ["chat1", "person0"], ["chat1", "person1"], ["chat1", "person2"],
+        ["chat1", "person3"], ["chat2", "person0"], ["chat2", "person1"]]
+
+
+REPLY_CHAT = pd.DataFrame({"username": ["a", "a", "b", "c", "b", "a", "c", "b"]})
+
+
+def test_get_response_pairs():
+    """ Test that reply pairs are counted in coordinate format."""
+    pairs = get_response_pairs(REPLY_CHAT)
+    assert pairs.astype({"sender": object, "receiver": object}).values.tolist() == [
+        ["a", "b", 1], ["b", "a", 1], ["b", "c", 2], ["c", "a", 1], ["c", "b", 1]]
+    matrix = get_response_matrix(REPLY_CHAT)
+    assert matrix.values.tolist() == [[0, 1, 0], [1, 0, 2], [1, 1, 0]]
+
+
+def test_get_top_repliers():
+    """ Test that the top repliers per user are ranked by replies, ties by username."""
+    top = get_top_repliers(get_response_pairs(REPLY_CHAT), k=2)
+    assert top.astype({"sender": object, "receiver": object}).values.tolist() == [
+        ["b", "a", 1, 1], ["c", "a", 1, 2], ["a", "b", 1, 1], ["c", "b", 1, 2], ["b", "c", 2, 1]]
+
+
+def test_reply_features_without_replies():
+    """ Test that users who never reply get no reply partner."""
+    chat = pd.DataFrame({"date": ["2022-01-01"] * 3, "username": ["a", "a", "b"],
+                         "message": ["x", "y", "z"]})
+    features = get_participants_features(chat).set_index("username")
+    assert pd.isna(features.loc["a", "Who do you most often reply to?"])
+    assert features.loc["a", "Who replies to you the most often?"] == "b"
+    assert features.loc["b", "Who do you most often reply to?"] == "a"
+    assert pd.isna(features.loc["b", "Who replies to you the most often?"])
+
+
+GROUP_CHAT = """[16/03/2022, 15:10:17] Group: Messages and calls are end-to-end encrypted. \
+No one outside of this chat, not even WhatsApp, can read them.
+[16/03/2022, 15:20:25] a: Hi
+[16/03/2022, 15:21:25] Group: changed icon
+[16/03/2022, 15:25:38] b: Hoi https://nos.nl
+"""
+
+
+def test_chat_schema():
+    """ Test that parsed chats are typed and left untouched by the feature calculation."""
+    errors = []
+    chat = parse_chat(errors.append, GROUP_CHAT)
+    assert [str(dtype) for dtype in chat.dtypes] == ["datetime64[ns]", "category", "object"]
+    features = get_participants_features(chat)
+    assert list(chat.columns) == ["date", "username", "message"]
+    assert list(features["Number of URLs"]) == [0, 0, 1]
+
+
+def test_features_without_group():
+    """ Test that the removed group does not show up in the participant features."""
+    errors = []
+    chat = remove_system_messages(errors.append, parse_chat(errors.append, GROUP_CHAT))
+    features = get_participants_features(chat).set_index("username")
+    assert list(features.index) == ["a", "b"]
+    assert features.loc["b", "Who do you most often reply to?"] == "a"
+    assert errors == ["Identified group name:Group"]
+
+
+def test_anonymize_participants_without_replies():
+    """ Test that users without replies keep a missing value after anonymization."""
+    df = pd.DataFrame({"username": ["a", "b"],
+                       "Who do you most often reply to?": [np.nan, "a"],
+                       "Who replies to you the most often?": ["b", np.nan]})
+    df = anonymize_participants(df)
+    assert df["username"].tolist() == ["person0", "person1"]
+    assert df["Who do you most often reply to?"].isna().tolist() == [True, False]
+    assert df["Who replies to you the most often?"].tolist()[0] == "person1"
+
+
+def test_compile_emoji_regex():
+    """ Test that multi-codepoint sequences are matched as one emoji and text symbols are not."""
+    text = "ok 👍🏽👍 🇳🇱 👨\u200d👩\u200d👧 ❤️\u200d🔥 1️⃣ ©️ © ✔ ✔️ ★ ✂ ✌🏽 ✅ é"
+    assert compile_emoji_regex().findall(text) == [
+        "👍🏽", "👍", "🇳🇱", "👨\u200d👩\u200d👧", "❤️\u200d🔥", "1️⃣", "©️", "✔️", "✌🏽", "✅"]
+
+
+def test_emoji_features():
+    """ Test the number of emojis and the favorite emoji per participant."""
+    df_chat = pd.DataFrame({"date": pd.to_datetime(["2022-03-16"] * 4),
+                            "username": ["a", "b", "a", "c"],
+                            "message": ["hi 😁😁", "🇳🇱!", "👍🏽 😁", "no emoji"]})
+    counts = count_emojis(df_chat)
+    assert counts.to_dict() == {("a", "👍🏽"): 1, ("a", "😁"): 3, ("b", "🇳🇱"): 1}
 
-    usernames = df_melt["username"].unique()
-    for user in usernames:
-        df_user = df_melt[(df_melt["username"] == user) & df_melt["Value"] != 0]
-        results.append(df_user)
-
-    expected_results = []
-    for df in results:
-        user_name = pd.unique(df["username"])[0]
-        expected_results.append(
-            {
-                "id": user_name,  # "overview",
-                "title": user_name,  # "The following data is extracted from the file:",
-                "data_frame": df[["Description", "Value"]].reset_index(drop=True)
-            }
-        )
-
-    df_result = process(DATA_PATH.joinpath("_chat.txt"))
-
-    assert_frame_equal(df_result[0]["data_frame"], expected_results[0]["data_frame"])
-    assert_frame_equal(df_result[1]["data_frame"], expected_results[1]["data_frame"])
-    assert_frame_equal(df_result[2]["data_frame"], expected_results[2]["data_frame"])
-    assert_frame_equal(df_result[3]["data_frame"], expected_results[3]["data_frame"])
+    features = get_participants_features(df_chat).set_index("username")
+    assert features["Number of emojis"].tolist() == [4, 1, 0]
+    assert features["Favorite emoji"].tolist()[:2] == ["😁", "🇳🇱"]
+    assert pd.isna(features.loc["c", "Favorite emoji"])
@@ -3,21 +3,92 @@ The main part is extracted from https://github.com/lucasrodes/whatstk.git
 """
 __version__ = '0.2.0'
 
+import codecs
+import functools
+import itertools
 import os
 import re
-from datetime import datetime
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 import pandas as pd
 import zipfile
 
 
-URL_PATTERN = r'(https?://\S+)'
-LOCATION_PATTERN = r'(Location: https?://\S+)'
-ATTACH_FILE_PATTERN = r'(<attached: \S+>)'
+# URLs and attached files, matched in one scan; it starts with a literal, so re can search
+# for it quickly. A URL prefixed by LOCATION_PREFIX is a shared location.
+FEATURE_RE = re.compile(r'https?://\S+|<attached: \S+>')
+LOCATION_PREFIX = 'Location: '
 FILE_RE = re.compile(r".*.txt$")
 HIDDEN_FILE_RE = re.compile(r".*__MACOSX*")
 
-SYSTEM_MESSAGES = ['end-to-end','WhatsApp']
-hformats = ['%m/%d/%y, %H:%M - %name:', '[%d/%m/%y, %H:%M:%S] %name:', '%d-%m-%y %H:%M - %name:', '[%d-%m-%y %H:%M:%S] %name:']
+SYSTEM_MESSAGES = ['end-to-end', 'WhatsApp']
+hformats = ['%m/%d/%y, %H:%M - %name:', '[%d/%m/%y, %H:%M:%S] %name:',
+            '%d-%m-%y %H:%M - %name:', '[%d-%m-%y %H:%M:%S] %name:']
+# Number of characters at the start of a chat used to detect its header format
+HFORMAT_SAMPLE_SIZE = 4096
+# Number of bytes read at once when a chat file is streamed
+READ_CHUNK_SIZE = 1 << 16
+# Number of records turned into a DataFrame at once when features are streamed
+RECORDS_CHUNK_SIZE = 10000
+# Chat files larger than this number of bytes are streamed instead of read at once
+STREAMING_THRESHOLD = 32 << 20
+# Archives on disk with more chat bytes than this are parsed in a process pool instead of threads
+PROCESS_POOL_THRESHOLD = 8 << 20
+
+# Code point ranges of characters that are emoji by default (Emoji_Presentation, Unicode 15.1)
+EMOJI_RANGES = (
+    (0x231A, 0x231B), (0x23E9, 0x23EC), (0x23F0, 0x23F0), (0x23F3, 0x23F3), (0x25FD, 0x25FE),
+    (0x2614, 0x2615), (0x2648, 0x2653), (0x267F, 0x267F), (0x2693, 0x2693), (0x26A1, 0x26A1),
+    (0x26AA, 0x26AB), (0x26BD, 0x26BE), (0x26C4, 0x26C5), (0x26CE, 0x26CE), (0x26D4, 0x26D4),
+    (0x26EA, 0x26EA), (0x26F2, 0x26F3), (0x26F5, 0x26F5), (0x26FA, 0x26FA), (0x26FD, 0x26FD),
+    (0x2705, 0x2705), (0x270A, 0x270B), (0x2728, 0x2728), (0x274C, 0x274C), (0x274E, 0x274E),
+    (0x2753, 0x2755), (0x2757, 0x2757), (0x2795, 0x2797), (0x27B0, 0x27B0), (0x27BF, 0x27BF),
+    (0x2B1B, 0x2B1C), (0x2B50, 0x2B50), (0x2B55, 0x2B55), (0x1F004, 0x1F004), (0x1F0CF, 0x1F0CF),
+    (0x1F18E, 0x1F18E), (0x1F191, 0x1F19A), (0x1F1E6, 0x1F1FF), (0x1F201, 0x1F201),
+    (0x1F21A, 0x1F21A), (0x1F22F, 0x1F22F), (0x1F232, 0x1F236), (0x1F238, 0x1F23A),
+    (0x1F250, 0x1F251), (0x1F300, 0x1F320), (0x1F32D, 0x1F335), (0x1F337, 0x1F37C),
+    (0x1F37E, 0x1F393), (0x1F3A0, 0x1F3CA), (0x1F3CF, 0x1F3D3), (0x1F3E0, 0x1F3F0),
+    (0x1F3F4, 0x1F3F4), (0x1F3F8, 0x1F43E), (0x1F440, 0x1F440), (0x1F442, 0x1F4FC),
+    (0x1F4FF, 0x1F53D), (0x1F54B, 0x1F54E), (0x1F550, 0x1F567), (0x1F57A, 0x1F57A),
+    (0x1F595, 0x1F596), (0x1F5A4, 0x1F5A4), (0x1F5FB, 0x1F64F), (0x1F680, 0x1F6C5),
+    (0x1F6CC, 0x1F6CC), (0x1F6D0, 0x1F6D2), (0x1F6D5, 0x1F6D7), (0x1F6DC, 0x1F6DF),
+    (0x1F6EB, 0x1F6EC), (0x1F6F4, 0x1F6FC), (0x1F7E0, 0x1F7EB), (0x1F7F0, 0x1F7F0),
+    (0x1F90C, 0x1F93A), (0x1F93C, 0x1F945), (0x1F947, 0x1F9FF), (0x1FA70, 0x1FA7C),
+    (0x1FA80, 0x1FA88), (0x1FA90, 0x1FABD), (0x1FABF, 0x1FAC5), (0x1FACE, 0x1FADB),
+    (0x1FAE0, 0x1FAE8), (0x1FAF0, 0x1FAF8)
+)
+# Code point ranges of characters that are text by default and only emoji when followed by
+# variation selector 16 or a skin tone
+TEXT_EMOJI_RANGES = (
+    (0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x203C, 0x203C), (0x2049, 0x2049), (0x2122, 0x2122),
+    (0x2139, 0x2139), (0x2194, 0x2199), (0x21A9, 0x21AA), (0x2328, 0x2328), (0x23CF, 0x23CF),
+    (0x23ED, 0x23EF), (0x23F1, 0x23F2), (0x23F8, 0x23FA), (0x24C2, 0x24C2), (0x25AA, 0x25AB),
+    (0x25B6, 0x25B6), (0x25C0, 0x25C0), (0x25FB, 0x25FC), (0x2600, 0x2604), (0x260E, 0x260E),
+    (0x2611, 0x2611), (0x2618, 0x2618), (0x261D, 0x261D), (0x2620, 0x2620), (0x2622, 0x2623),
+    (0x2626, 0x2626), (0x262A, 0x262A), (0x262E, 0x262F), (0x2638, 0x263A), (0x2640, 0x2640),
+    (0x2642, 0x2642), (0x265F, 0x2660), (0x2663, 0x2663), (0x2665, 0x2666), (0x2668, 0x2668),
+    (0x267B, 0x267B), (0x267E, 0x267E), (0x2692, 0x2692), (0x2694, 0x2697), (0x2699, 0x2699),
+    (0x269B, 0x269C), (0x26A0, 0x26A0), (0x26A7, 0x26A7), (0x26B0, 0x26B1), (0x26C8, 0x26C8),
+    (0x26CF, 0x26CF), (0x26D1, 0x26D1), (0x26D3, 0x26D3), (0x26E9, 0x26E9), (0x26F0, 0x26F1),
+    (0x26F4, 0x26F4), (0x26F7, 0x26F9), (0x2702, 0x2702), (0x2708, 0x2709), (0x270C, 0x270D),
+    (0x270F, 0x270F), (0x2712, 0x2712), (0x2714, 0x2714), (0x2716, 0x2716), (0x271D, 0x271D),
+    (0x2721, 0x2721), (0x2733, 0x2734), (0x2744, 0x2744), (0x2747, 0x2747), (0x2763, 0x2764),
+    (0x27A1, 0x27A1), (0x2934, 0x2935), (0x2B05, 0x2B07), (0x3030, 0x3030), (0x303D, 0x303D),
+    (0x3297, 0x3297), (0x3299, 0x3299), (0x1F170, 0x1F171), (0x1F17E, 0x1F17F), (0x1F202, 0x1F202),
+    (0x1F237, 0x1F237), (0x1F321, 0x1F321), (0x1F324, 0x1F32C), (0x1F336, 0x1F336),
+    (0x1F37D, 0x1F37D), (0x1F396, 0x1F397), (0x1F399, 0x1F39B), (0x1F39E, 0x1F39F),
+    (0x1F3CB, 0x1F3CE), (0x1F3D4, 0x1F3DF), (0x1F3F3, 0x1F3F3), (0x1F3F5, 0x1F3F5),
+    (0x1F3F7, 0x1F3F7), (0x1F43F, 0x1F43F), (0x1F441, 0x1F441), (0x1F4FD, 0x1F4FD),
+    (0x1F549, 0x1F54A), (0x1F56F, 0x1F570), (0x1F573, 0x1F579), (0x1F587, 0x1F587),
+    (0x1F58A, 0x1F58D), (0x1F590, 0x1F590), (0x1F5A5, 0x1F5A5), (0x1F5A8, 0x1F5A8),
+    (0x1F5B1, 0x1F5B2), (0x1F5BC, 0x1F5BC), (0x1F5C2, 0x1F5C4), (0x1F5D1, 0x1F5D3),
+    (0x1F5DC, 0x1F5DE), (0x1F5E1, 0x1F5E1), (0x1F5E3, 0x1F5E3), (0x1F5E8, 0x1F5E8),
+    (0x1F5EF, 0x1F5EF), (0x1F5F3, 0x1F5F3), (0x1F5FA, 0x1F5FA), (0x1F6CB, 0x1F6CB),
+    (0x1F6CD, 0x1F6CF), (0x1F6E0, 0x1F6E5), (0x1F6E9, 0x1F6E9), (0x1F6F0, 0x1F6F0),
+    (0x1F6F3, 0x1F6F3)
+)
 
 
 class ColnamesDf:
@@ -62,11 +133,17 @@ class ColnamesDf:
     FILE_NO = 'Number of shared files'
     """Number of files column"""
 
-    EMOJI_NO = 'emoji_no'
-    """Total number of emojies column"""
+    EMOJI_NO = 'Number of emojis'
+    """Total number of emojis column"""
 
-    EMOJI_Fav = 'emoji_fav'
-    """Favorite emojies column"""
+    EMOJI_Fav = 'Favorite emoji'
+    """Favorite emoji column"""
+
+    EMOJI = 'emoji'
+    """Emoji column"""
+
+    EMOJI_COUNT = 'count'
+    """Number of times an emoji is used column"""
 
     DESCRIPTION = 'Description'
     """Variable column in melted dataframe"""
@@ -74,8 +151,32 @@ class ColnamesDf:
     VALUE = 'Value'
     """Value column in melted dataframe"""
 
+    CHAT = 'Chat'
+    """Chat the participant features are extracted from"""
+
+    SENDER = 'sender'
+    """Sender of a reply column"""
+
+    RECEIVER = 'receiver'
+    """Receiver of a reply column"""
+
+    REPLY_NO = 'replies'
+    """Number of replies column"""
+
+    RANK = 'rank'
+    """Rank of a reply pair column"""
+
 
 COLNAMES_DF = ColnamesDf()
+# Participant features, in the order they are reported
+PARTICIPANT_FEATURES = [COLNAMES_DF.WORDS_NO, COLNAMES_DF.MESSAGE_NO,
+                        COLNAMES_DF.FirstMessage, COLNAMES_DF.LastMessage,
+                        COLNAMES_DF.URL_NO, COLNAMES_DF.FILE_NO, COLNAMES_DF.LOCATION_NO,
+                        COLNAMES_DF.EMOJI_NO, COLNAMES_DF.EMOJI_Fav,
+                        COLNAMES_DF.REPLY_2USER, COLNAMES_DF.USER_REPLY2]
+# Per message counters computed by scan_messages
+FEATURE_COLUMNS = [COLNAMES_DF.WORDS_NO, COLNAMES_DF.URL_NO, COLNAMES_DF.LOCATION_NO,
+                   COLNAMES_DF.FILE_NO]
 
 # *** parsing functions ***
 regex_simplifier = {
@@ -121,6 +222,7 @@ def generate_regex(log_error, hformat):
 
 def add_schema(df):
     """Add default chat schema to df.
+    Dates are datetime64, usernames categorical and messages plain strings.
     Parameters
     ----------
     df : pandas.DataFrame
@@ -131,140 +233,174 @@ def add_schema(df):
         Chat DataFrame with correct dtypes
     """
     df = df.astype({
-        COLNAMES_DF.DATE: pd.StringDtype(),
-        COLNAMES_DF.USERNAME: pd.StringDtype(),
-        COLNAMES_DF.MESSAGE: pd.StringDtype()
+        COLNAMES_DF.DATE: 'datetime64[ns]',
+        COLNAMES_DF.USERNAME: 'category',
+        COLNAMES_DF.MESSAGE: object
     })
     return df
 
 
-def parse_line(text, headers, i):
-    """Get date, username and message from the i:th intervention.
+def header_fields(regex, parts):
+    """Collect the fields of all headers from a chat split on its headers.
     Parameters
     ----------
-    text : str
-        Whole log chat text
-    headers : list
-        All headers.
-    i : int
-        Index denoting the message number
+    regex : re.Pattern
+        Compiled header regular expression
+    parts : list
+        Result of ``regex.split(text)``: the text before the first header followed by the groups
+        and the message of every header
     Returns
     -------
     dict
-        ith date, username and message.
-    """
-    result_ = headers[i].groupdict()
-    if 'ampm' in result_:
-        hour = int(result_['hour'])
-        mode = result_.get('ampm').lower()
-        if hour == 12 and mode == 'am':
-            hour = 0
-        elif hour != 12 and mode == 'pm':
-            hour += 12
-    else:
-        hour = int(result_['hour'])
-
-    # Check format of year. If year is 2-digit represented we add 2000
-    if len(result_['year']) == 2:
-        year = int(result_['year']) + 2000
-    else:
-        year = int(result_['year'])
-
-    if 'seconds' not in result_:
-        date = datetime(year, int(result_['month']), int(result_['day']), hour,
-                        int(result_['minutes']))
-    else:
-        date = datetime(year, int(result_['month']), int(result_['day']), hour,
-                        int(result_['minutes']), int(result_['seconds']))
-    username = result_[COLNAMES_DF.USERNAME]
-    message = get_message(text, headers, i)
-    line_dict = {
-        COLNAMES_DF.DATE: date,
-        COLNAMES_DF.USERNAME: username,
-        COLNAMES_DF.MESSAGE: message
-    }
-    return line_dict
+        Header field name mapped to the list of its values, one per header
+    """
+    step = regex.groups + 1
+    return {name: parts[index::step] for name, index in regex.groupindex.items()}
 
 
-def remove_alerts_from_df(r_x, df):
-    """Try to get rid of alert/notification messages.
+def decode_header_dates(fields):
+    """Build the dates of all headers at once with array arithmetic.
     Parameters
     ----------
-    r_x : str
-        Regular expression to detect whatsapp warnings
-    df : pandas.DataFrame
-        pandas.DataFrame with all interventions
+    fields : dict
+        Header field name mapped to a sequence of its string values, one per header
     Returns
     -------
-    pandas.DataFrame
-        Fixed version of input DataFrame
+    numpy.ndarray
+        datetime64[ns] array with the date of each header
+    Raises
+    ------
+    ValueError
+        When a header contains a date or time which is out of range
     """
+    def to_int(name):
+        return np.asarray(fields[name], dtype=str).astype(np.int64)
 
-    alerts_no = count_alerts(r_x, df)
-    df_new = df.copy()
-    df_new.loc[:, COLNAMES_DF.MESSAGE] = df_new[COLNAMES_DF.MESSAGE].apply(lambda x: remove_alerts_from_line(r_x, x))
-    return df_new,alerts_no
-
-
-def remove_alerts_from_line(r_x, line_df):
-    """Remove line content that is not desirable (automatic alerts etc.).
+    year_text = np.asarray(fields['year'], dtype=str)
+    year = year_text.astype(np.int64)
+    # Check format of year. If year is 2-digit represented we add 2000
+    year = np.where(np.char.str_len(year_text) == 2, year + 2000, year)
+    month = to_int('month')
+    day = to_int('day')
+    hour = to_int('hour')
+    minutes = to_int('minutes')
+    seconds = to_int('seconds') if 'seconds' in fields else np.zeros_like(year)
+    if 'ampm' in fields:
+        is_pm = np.char.startswith(np.char.lower(np.asarray(fields['ampm'], dtype=str)), 'p')
+        hour = np.where(hour == 12, 0, hour) + np.where(is_pm, 12, 0)
+
+    months = (year - 1970) * 12 + month - 1
+    month_start = months.astype('datetime64[M]').astype('datetime64[D]')
+    next_month_start = (months + 1).astype('datetime64[M]').astype('datetime64[D]')
+    days_in_month = (next_month_start - month_start).astype(np.int64)
+    if np.any((month < 1) | (month > 12) | (day < 1) | (day > days_in_month) |
+              (hour > 23) | (minutes > 59) | (seconds > 59)):
+        raise ValueError("Header date out of range")
+
+    total_seconds = ((month_start.astype(np.int64) + day - 1) * 86400 +
+                     hour * 3600 + minutes * 60 + seconds)
+    return total_seconds.astype('datetime64[s]').astype('datetime64[ns]')
+
+
+def strip_alerts(messages, alert_regex):
+    """Cut messages off at their first alert (automatic notifications etc.).
     Parameters
     ----------
-    r_x : str
-        Regula expression to detect WhatsApp warnings
-    line_df : str
-        Message sent as string
+    messages : iterable
+        Messages sent as strings
+    alert_regex : re.Pattern
+        Regular expression to detect WhatsApp warnings
     Returns
     -------
-    str
-        Cleaned message string
+    tuple
+        The cleaned messages and the total number of alerts
     """
-    if re.search(r_x, line_df):
-        print(line_df[:re.search(r_x, line_df).start()])
-        return line_df[:re.search(r_x, line_df).start()]
-    else:
-        return line_df
-
-
-def count_alerts(r_x, df):
-    """Count line content that is not desirable (automatic alerts etc.).
+    cleaned = []
+    alerts_no = 0
+    for message in messages:
+        alert = alert_regex.search(message)
+        if alert is not None:
+            alerts_no += len(alert_regex.findall(message, alert.start()))
+            message = message[:alert.start()]
+        cleaned.append(message)
+    return cleaned, alerts_no
+
+
+def scan_messages(messages):
+    """Count the words, URLs, locations and files of messages in a single scan of all messages.
+    Alerts are stripped while parsing, see ``strip_alerts``.
     Parameters
     ----------
-    r_x : str
-        Regula expression to detect WhatsApp warnings
-    df : pandas.DataFrame
-        pandas.DataFrame with all interventions
-
+    messages : iterable
+        Messages sent as strings
     Returns
     -------
-    int
-        Number of line contents that is not desirable
+    pandas.DataFrame
+        The number of words, URLs, locations and files of every message
     """
-
-    # alerts_count = df[COLNAMES_DF.MESSAGE].apply(lambda x: (re.search(r_x, x) is not None))
-    alerts_count = df[COLNAMES_DF.MESSAGE].apply(lambda x: re.findall(r_x, x))
-    return alerts_count.str.len().sum()
-
-
-def get_message(text, headers, i):
-    """Get i:th message from text.
+    messages = list(messages)
+    # Features end at whitespace, so none crosses the newline between two messages
+    text = '\n'.join(messages)
+    ends = np.cumsum([len(message) + 1 for message in messages], dtype=np.int64)
+    starts = [match.start() for match in FEATURE_RE.finditer(text)]
+    files = np.array([text[start] == '<' for start in starts], dtype=bool)
+    locations = np.array([text[start - len(LOCATION_PREFIX):start] == LOCATION_PREFIX
+                          for start in starts], dtype=bool)
+    owners = np.searchsorted(ends, np.array(starts, dtype=np.int64), side='right')
+    return pd.DataFrame({
+        COLNAMES_DF.WORDS_NO: np.array([len(message.split()) for message in messages],
+                                       dtype=np.int64),
+        COLNAMES_DF.URL_NO: np.bincount(owners[~files], minlength=len(messages)),
+        COLNAMES_DF.LOCATION_NO: np.bincount(owners[locations], minlength=len(messages)),
+        COLNAMES_DF.FILE_NO: np.bincount(owners[files], minlength=len(messages))
+    }, columns=FEATURE_COLUMNS)
+
+
+def code_point_class(ranges):
+    """Generate a regex character class from code point ranges.
     Parameters
     ----------
-        text : str
-            Whole log chat text
-    headers : list
-        All headers
-    i : int
-        Index denoting the message number
+    ranges : iterable
+        (first, last) code points, inclusive
     Returns
     -------
     str
-     ith message.
+        Character class matching any of the code points
+    """
+    return '[' + ''.join(re.escape(chr(first)) if first == last else
+                         f'{re.escape(chr(first))}-{re.escape(chr(last))}'
+                         for first, last in ranges) + ']'
+
+
+@functools.lru_cache(maxsize=None)
+def compile_emoji_regex():
+    """Compile the regular expression matching complete emoji sequences.
+    Flags (pairs of regional indicators), keycaps, subdivision flags and ZWJ sequences of
+    emoji with variation selectors and skin tones are each matched as one emoji. Symbols that
+    are text by default (e.g. ✔ and ★) only count with variation selector 16 or a skin tone.
+    The pattern starts with a single small character class, so the regex engine can skip
+    plain text quickly; lookbehinds on that first character select the kind of sequence.
+    Returns
+    -------
+    re.Pattern
+        Compiled emoji regex
     """
-    msg_start = headers[i].end()
-    msg_end = headers[i + 1].start() if i < len(headers) - 1 else headers[i].endpos
-    msg = text[msg_start:msg_end].strip()
-    return msg
+    emoji = code_point_class(EMOJI_RANGES)
+    text_emoji = code_point_class(TEXT_EMOJI_RANGES)
+    regional_indicator = '[\\U0001F1E6-\\U0001F1FF]'
+    skin_tone = '[\\U0001F3FB-\\U0001F3FF]'
+    element = f'(?:{emoji}\\uFE0F?{skin_tone}?|{text_emoji}(?:\\uFE0F|{skin_tone}))'
+    zwj_sequence = f'(?:\\u200D{element})*'
+    # Letters of e.g. Latin, Greek and CJK scripts fall outside the span of the emoji ranges
+    first_emoji = code_point_class(
+        [(0x00A9, 0x00AE), (0x203C, 0x3299), (0x1F004, 0x1FAFF)])[1:-1]
+    return re.compile(
+        f'[0-9#*{first_emoji}]'
+        f'(?:(?<={regional_indicator}){regional_indicator}'
+        '|(?<=\\U0001F3F4)[\\U000E0020-\\U000E007E]+\\U000E007F'
+        '|(?<=[0-9#*])\\uFE0F?\\u20E3'
+        f'|(?<={emoji})\\uFE0F?{skin_tone}?{zwj_sequence}'
+        f'|(?<={text_emoji})(?:\\uFE0F|{skin_tone}){zwj_sequence})')
 
 
 def parse_text(text, regex):
@@ -273,36 +409,174 @@ def parse_text(text, regex):
     ----------
     text : str
         Whole log chat text
-    regex : str
+    regex : str or re.Pattern
         Regular expression
     Returns
     -------
     pandas.DataFrame
         pandas.DataFrame with messages sent by users, index is the date the messages was sent.
-    Raises
-    ------
-    RegexError
-        When provided regex could not match the text
+        None when the regex could not match the text.
     """
-    result = []
-    headers = list(re.finditer(regex, text))
-    try:
-        for i in range(len(headers)):
-            line_dict = parse_line(text, headers, i)
-            result.append(line_dict)
-    except KeyError:
+    regex = re.compile(regex)
+    # Splitting on the headers yields the header fields and the message of every header in one go
+    parts = regex.split(text)
+    if len(parts) == 1:
         print("Could not match the provided regex with provided text. No match was found.")
         return None
 
-    df_chat = pd.DataFrame.from_records(result)
-    df_chat = df_chat[[COLNAMES_DF.DATE,COLNAMES_DF.USERNAME, COLNAMES_DF.MESSAGE]]
+    fields = header_fields(regex, parts)
+    df_chat = pd.DataFrame({
+        COLNAMES_DF.DATE: decode_header_dates(fields),
+        COLNAMES_DF.USERNAME: fields[COLNAMES_DF.USERNAME],
+        COLNAMES_DF.MESSAGE: parts[regex.groups + 1::regex.groups + 1]
+    })
+    df_chat[COLNAMES_DF.MESSAGE] = df_chat[COLNAMES_DF.MESSAGE].str.strip()
 
     # clean username
-    df_chat[COLNAMES_DF.USERNAME] = df_chat[COLNAMES_DF.USERNAME].apply(lambda u: u.strip('\u202c'))
+    df_chat[COLNAMES_DF.USERNAME] = df_chat[COLNAMES_DF.USERNAME].str.strip('\u202c')
 
     return df_chat
 
 
+@functools.lru_cache(maxsize=None)
+def compile_hformat(hformat):
+    """Compile the header and alert regular expressions of hformat.
+    The result is cached, so every hformat is only compiled once.
+    Parameters
+    ----------
+    hformat : str
+        Simplified syntax for the header, e.g. ``'%y-%m-%d, %H:%M:%S - %name:'``
+    Returns
+    -------
+    tuple
+        Compiled header regex, compiled alert regex and a tuple of error messages
+    """
+    errors = []
+    # Bracket is reserved character in RegEx, add backslash before them.
+    escaped = hformat.replace('[', r'\[').replace(']', r'\]')
+    r, r_x = generate_regex(errors.append, hformat=escaped)
+    return re.compile(r), re.compile(r_x), tuple(errors)
+
+
+def swap_day_month(hformat):
+    """Swap the day and month fields of hformat.
+    Parameters
+    ----------
+    hformat : str
+        Simplified syntax for the header, e.g. ``'%m/%d/%y, %H:%M - %name:'``
+    Returns
+    -------
+    str
+        The same header syntax with day and month exchanged, e.g. ``'%d/%m/%y, %H:%M - %name:'``
+    """
+    return re.sub(r'%[dm]', lambda field: '%m' if field.group() == '%d' else '%d', hformat)
+
+
+def candidate_hformats():
+    """List every known header format in both day-first and month-first order.
+    Returns
+    -------
+    list
+        Header formats, each entry of ``hformats`` directly followed by its swapped variant
+    """
+    candidates = []
+    for hformat in hformats:
+        for candidate in (hformat, swap_day_month(hformat)):
+            if candidate not in candidates:
+                candidates.append(candidate)
+    return candidates
+
+
+def score_hformat(sample, hformat):
+    """Count the valid headers of hformat in sample.
+    Parameters
+    ----------
+    sample : str
+        Start of the chat text
+    hformat : str
+        Simplified syntax for the header
+    Returns
+    -------
+    int
+        Number of headers whose day, month and hour are in range
+    """
+    regex, _, _ = compile_hformat(hformat)
+    score = 0
+    for header in regex.finditer(sample):
+        fields = header.groupdict()
+        if (1 <= int(fields['month']) <= 12 and 1 <= int(fields['day']) <= 31
+                and int(fields['hour']) <= 23):
+            score += 1
+    return score
+
+
+def rank_hformats(blocks):
+    """Rank the known header formats on consecutive blocks of a chat.
+    The first block is always scored. The next blocks are only scored while the best format
+    and its day/month swapped variant are equally valid, which is the case until a header with
+    a day above 12 tells them apart.
+    Parameters
+    ----------
+    blocks : iterable
+        Consecutive pieces of the chat text, each ending at a line break
+    Returns
+    -------
+    list
+        Header formats with at least one valid header, best match first.
+        Ties that remain after the last block keep the order of ``hformats``.
+    """
+    scores = dict.fromkeys(candidate_hformats(), 0)
+    ranked = []
+    for block in blocks:
+        for hformat in scores:
+            scores[hformat] += score_hformat(block, hformat)
+        ranked = sorted((hformat for hformat in scores if scores[hformat] > 0),
+                        key=lambda hformat: -scores[hformat])
+        if not ranked or scores[ranked[0]] > scores[swap_day_month(ranked[0])]:
+            break
+    return ranked
+
+
+def text_blocks(text, size):
+    """Split text at line breaks into consecutive blocks of doubling size.
+    Parameters
+    ----------
+    text : str
+        Whole log chat text
+    size : int
+        Minimum number of characters of the first block
+    Returns
+    -------
+    generator
+        Blocks of text, the first one at least size characters long unless text is shorter
+    """
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start + size) + 1 or len(text)
+        yield text[start:end]
+        start = end
+        size *= 2
+
+
+def sniff_hformats(text, sample_size=HFORMAT_SAMPLE_SIZE):
+    """Rank the known header formats on the first characters of a chat.
+    When no header in the sample has a day above 12, day-first and month-first formats are
+    equally valid and further text is inspected until a header tells them apart.
+    Parameters
+    ----------
+    text : str
+        Whole log chat text
+    sample_size : int
+        Number of characters at the start of text to inspect at least
+    Returns
+    -------
+    list
+        Header formats with at least one valid header in the sample, best match first.
+        Ties that remain after the whole text keep the order of ``hformats``.
+    """
+    return rank_hformats(text_blocks(text, sample_size))
+
+
 def make_chat_df(log_error, text, hformat):
     """Load chat as a DataFrame.
     Parameters
@@ -318,29 +592,27 @@ def make_chat_df(log_error, text, hformat):
     pandas.DataFrame
         A pandas.DataFrame with three columns, i.e. 'date', 'username', and 'message'
     """
-    # Bracket is reserved character in RegEx, add backslash before them.
-    hformat = hformat.replace('[', r'\[').replace(']', r'\]')
-
-    # Generate regex for given hformat
-    r, r_x = generate_regex(log_error,hformat=hformat)
+    r, r_x, regex_errors = compile_hformat(hformat)
+    for error in regex_errors:
+        log_error(error)
 
     # Parse chat to DataFrame
     try:
         df = parse_text(text, r)
-        df, alerts_no = remove_alerts_from_df(r_x, df)
+        df[COLNAMES_DF.MESSAGE], alerts_no = strip_alerts(df[COLNAMES_DF.MESSAGE], r_x)
         df = add_schema(df)
 
-        if alerts_no>0:
-            log_error("Number of unprocessed system messages: "+str(alerts_no))
+        if alerts_no > 0:
+            log_error("Number of unprocessed system messages: " + str(alerts_no))
 
         return df
-    except:
+    except Exception:
         print(f"hformat : {hformat} is not match with the given text")
         return None
 
 
 def parse_chat(log_error, data):
-    """Parse chat and test it with defined hformats.
+    """Parse chat with the header format detected at its start.
     Parameters
     ----------
     log_error : list
@@ -352,11 +624,12 @@ def parse_chat(log_error, data):
     pandas.dataframe
         A pandas.DataFrame with three columns, i.e. 'date', 'username', and 'message'
     """
-    for hformat in hformats:
+    # The best ranked format normally parses the chat; the others are only tried when it fails.
+    for hformat in sniff_hformats(data):
         # Build DataFrame
         df = make_chat_df(log_error, data, hformat)
         if df is not None:
-             return df
+            return df
     log_error("hformats did not match the provided text. No match was found")
     return None
 
@@ -378,12 +651,27 @@ def decode_chat(log_error, f, filename):
     """
     try:
         data = f.decode("utf-8")
-    except:
+    except Exception:
         log_error(f"Could not decode to utf-8: {filename}")
     else:
         return parse_chat(log_error, data)
 
 
+def chat_names(zfile):
+    """List the chat files in the given zip file.
+    Parameters
+    ----------
+    zfile : ZipFile object
+        Zip file with chat files
+    Returns
+    -------
+    list
+        Names of the chat files
+    """
+    return [name for name in zfile.namelist()
+            if FILE_RE.match(name) and not HIDDEN_FILE_RE.match(name)]
+
+
 def parse_zipfile(log_error, zfile):
     """Parse the given zip file.
     Parameters
@@ -394,20 +682,246 @@ def parse_zipfile(log_error, zfile):
         Regular expression
     Returns
     -------
-    pandas.DataFrame
-        A pandas.DataFrames which include the content of the chat file.
+    list
+        A list of pandas.DataFrames which include the content of the chat files.
     """
-    for name in zfile.namelist():
-        if HIDDEN_FILE_RE.match(name):
-            continue
-        if not FILE_RE.match(name):
-            continue
-        chat = decode_chat(log_error,zfile.read(name),name)
+    chats = [decode_chat(log_error, zfile.read(name), name) for name in chat_names(zfile)]
+    chats = [chat for chat in chats if chat is not None]
 
-    if chat is None:
+    if not chats:
         log_error("No valid chat file is available")
 
-    return chat
+    return chats
+
+
+@functools.lru_cache(maxsize=None)
+def threads_available():
+    """Check if threads can be started, which is not the case in e.g. Pyodide.
+    Returns
+    -------
+    bool
+        True if a thread could be started
+    """
+    try:
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+    except RuntimeError:
+        return False
+    return True
+
+
+def run_concurrently(func, items, max_workers=None, processes=False):
+    """Apply func to every item concurrently and return the results in the order of items.
+    Parameters
+    ----------
+    func : callable
+        Function to apply, it must be picklable when processes is set
+    items : iterable
+        Arguments of func
+    max_workers : int
+        Maximum number of workers, 1 runs func serially
+    processes : bool
+        Use a process pool instead of a thread pool
+    Returns
+    -------
+    list
+        Results of func. Falls back to threads when no processes can be started and to a serial
+        loop when no threads can be started.
+    """
+    items = list(items)
+    if max_workers == 1 or len(items) < 2:
+        return [func(item) for item in items]
+    if processes:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(func, items))
+        except (ImportError, NotImplementedError, OSError, BrokenProcessPool):
+            pass
+    if threads_available():
+        # Decompression releases the GIL, so threads read the members in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(func, items))
+    return [func(item) for item in items]
+
+
+def iter_lines(f, chunk_size=READ_CHUNK_SIZE):
+    """Read a binary file incrementally and yield its utf-8 decoded lines.
+    Parameters
+    ----------
+    f : file object
+        Binary file, e.g. a member opened with ``zipfile.ZipFile.open``
+    chunk_size : int
+        Number of bytes read at once
+    Returns
+    -------
+    generator
+        Lines of the file without line endings
+    Raises
+    ------
+    UnicodeDecodeError
+        When the file is not utf-8 encoded
+    """
+    # A byte order mark at the start of the file is not part of the first line
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ''
+    while True:
+        chunk = f.read(chunk_size)
+        text = pending + decoder.decode(chunk, final=not chunk)
+        lines = text.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+        if not chunk:
+            break
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def decode_records(regex, pending):
+    """Turn buffered headers and message lines into (date, username, message) records.
+    Parameters
+    ----------
+    regex : re.Pattern
+        Compiled header regular expression
+    pending : list
+        Groups of a matched header and the lines of its message, per message
+    Returns
+    -------
+    generator
+        Date, username and message of every buffered message
+    """
+    names = sorted(regex.groupindex, key=regex.groupindex.get)
+    fields = dict(zip(names, zip(*(groups for groups, _ in pending))))
+    dates = decode_header_dates(fields).astype('datetime64[us]').tolist()
+    for date, username, (_, message_lines) in zip(dates, fields[COLNAMES_DF.USERNAME], pending):
+        yield date, username.strip('\u202c'), '\n'.join(message_lines).strip()
+
+
+def sniff_chat_file(f, chunk_size=READ_CHUNK_SIZE):
+    """Rank the known header formats on the start of a chat file.
+    Lines are read in blocks of ``HFORMAT_SAMPLE_SIZE`` characters, past the first block only
+    while day and month are ambiguous, and are not kept, so memory stays constant.
+    Parameters
+    ----------
+    f : file object
+        Binary chat file, e.g. a member opened with ``zipfile.ZipFile.open``
+    chunk_size : int
+        Number of bytes read at once
+    Returns
+    -------
+    list
+        Header formats, see ``rank_hformats``
+    Raises
+    ------
+    UnicodeDecodeError
+        When the file is not utf-8 encoded
+    """
+    def blocks():
+        block = []
+        block_size = 0
+        for line in iter_lines(f, chunk_size):
+            block.append(line)
+            block_size += len(line) + 1
+            if block_size >= HFORMAT_SAMPLE_SIZE:
+                yield '\n'.join(block) + '\n'
+                block = []
+                block_size = 0
+        if block:
+            yield '\n'.join(block)
+
+    return rank_hformats(blocks())
+
+
+def iter_chat_records(log_error, f, chunk_size=READ_CHUNK_SIZE, hformat=None):
+    """Parse a chat file message by message.
+    Only the current message is buffered, so the whole chat is never held in memory.
+    Parameters
+    ----------
+    log_error : list
+        List of error messages
+    f : file object
+        Binary chat file, e.g. a member opened with ``zipfile.ZipFile.open``
+    chunk_size : int
+        Number of bytes read at once
+    hformat : str
+        Simplified syntax for the header. If None, the best format of ``sniff_chat_file`` is
+        used, which requires f to be seekable.
+    Returns
+    -------
+    generator
+        (date, username, message) records in the order of the chat
+    Raises
+    ------
+    ValueError
+        When a header contains a date or time which is out of range for hformat
+    """
+    if hformat is None:
+        ranked = sniff_chat_file(f, chunk_size)
+        if not ranked:
+            log_error("hformats did not match the provided text. No match was found")
+            return
+        hformat = ranked[0]
+        f.seek(0)
+    regex, alert_regex, regex_errors = compile_hformat(hformat)
+    for error in regex_errors:
+        log_error(error)
+
+    # Headers are decoded RECORDS_CHUNK_SIZE at a time, with array arithmetic
+    pending = []
+    message_lines = None
+    in_alert = False
+    alerts_no = 0
+    for line in iter_lines(f, chunk_size):
+        match = regex.match(line)
+        if match:
+            if len(pending) >= RECORDS_CHUNK_SIZE:
+                yield from decode_records(regex, pending)
+                pending = []
+            message_lines = [line[match.end():]]
+            pending.append((match.groups(), message_lines))
+            in_alert = False
+        elif message_lines is None:
+            continue
+        elif alert_regex.match(line):
+            # Alerts and the lines following them are not part of the message
+            alerts_no += 1
+            in_alert = True
+        elif not in_alert:
+            message_lines.append(line)
+    if pending:
+        yield from decode_records(regex, pending)
+
+    if alerts_no > 0:
+        log_error("Number of unprocessed system messages: " + str(alerts_no))
+
+
+def remove_system_records(log_error, records):
+    """Remove system messages from a stream of chat records.
+    Streaming counterpart of ``remove_system_messages``.
+    Parameters
+    ----------
+    log_error : list
+        List of error messages
+    records : iterable
+        (date, username, message) records
+    Returns
+    -------
+    generator
+        Records which are not sent by the group itself
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return
+    if all(s in first[2] for s in SYSTEM_MESSAGES):
+        group_name = first[1]
+        log_error("Identified group name:" + group_name)
+        yield from (record for record in records if record[1] != group_name)
+    else:
+        yield first
+        yield from records
+
 
 # *** test related function ***
 
@@ -427,15 +941,69 @@ def input_df(data_path):
     log_error = errors.append
     fp = os.path.join(data_path, "whatsapp_chat.zip")
     zfile = zipfile.ZipFile(fp)
-    chat = parse_zipfile(log_error, zfile)
+    chat = parse_zipfile(log_error, zfile)[0]
     participants = extract_participants_features(chat, anonymize=False)
     return chat, participants
 
 # *** analysis functions ***
 
 
+def count_response_pairs(sender_codes, receiver_codes, users, counts=None):
+    """Sum reply counts per (sender, receiver) pair in coordinate format.
+    Parameters
+    ----------
+    sender_codes : numpy.ndarray
+        Position of the sender of every reply in users
+    receiver_codes : numpy.ndarray
+        Position of the receiver of every reply in users
+    users : array-like
+        Sorted usernames
+    counts : numpy.ndarray
+        Number of replies of every entry, one each if not given
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame with categorical sender and receiver columns over users and the number of
+        replies, one row per pair with replies, sorted by sender and receiver
+    """
+    n_users = max(len(users), 1)
+    keys = (np.asarray(sender_codes, dtype=np.int64) * n_users +
+            np.asarray(receiver_codes, dtype=np.int64))
+    keys, inverse = np.unique(keys, return_inverse=True)
+    replies = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+    return pd.DataFrame({
+        COLNAMES_DF.SENDER: pd.Categorical.from_codes(keys // n_users, categories=users),
+        COLNAMES_DF.RECEIVER: pd.Categorical.from_codes(keys % n_users, categories=users),
+        COLNAMES_DF.REPLY_NO: replies
+    })
+
+
+def get_response_pairs(df_chat):
+    """Count the replies between users of the given DataFrame in coordinate format.
+    A message replies to the previous message when both are sent by different users.
+    Memory grows with the number of pairs that actually reply to each other, not with the
+    square of the number of users.
+    Parameters
+    ----------
+    df_chat: padas.DataFrame
+        A DataFrame including chat data
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame with sender, receiver and number of replies, one row per pair with replies
+    """
+    codes, users = pd.factorize(df_chat[COLNAMES_DF.USERNAME], sort=True)
+    # Categorical usernames factorize to a CategoricalIndex, only its values are needed
+    users = pd.Index(np.asarray(users, dtype=object))
+    senders = codes[1:]
+    receivers = codes[:-1]
+    is_reply = senders != receivers
+    return count_response_pairs(senders[is_reply], receivers[is_reply], users)
+
+
 def get_response_matrix(df_chat):
     """Create a response matrix for the usernames mentioned in the given DataFrame.
+    The matrix is dense, use ``get_response_pairs`` for chats with many users.
     Parameters
     ----------
     df_chat: padas.DataFrame
@@ -445,37 +1013,65 @@ def get_response_matrix(df_chat):
     pandas.DataFrame
         A DataFrame with senders in the rows and receivers in the columns
     """
-    users = set(df_chat[COLNAMES_DF.USERNAME])
-    users = sorted(users)
-
-    # Get list of username transitions and initialize dicitonary with counts
-    user_transitions = df_chat[COLNAMES_DF.USERNAME].tolist()
-    responses = {user: dict(zip(users, [0] * len(users))) for user in users}
-    # Fill count dictionary
-    for i in range(1, len(user_transitions)):
-        sender = user_transitions[i]
-        receiver = user_transitions[i - 1]
-        if sender != receiver:
-            responses[sender][receiver] += 1
+    pairs = get_response_pairs(df_chat)
+    users = pairs[COLNAMES_DF.SENDER].cat.categories
+    responses = np.zeros((len(users), len(users)), dtype=np.int64)
+    responses[pairs[COLNAMES_DF.SENDER].cat.codes, pairs[COLNAMES_DF.RECEIVER].cat.codes] = \
+        pairs[COLNAMES_DF.REPLY_NO]
+    return pd.DataFrame(responses, index=list(users), columns=list(users))
 
-    responses = pd.DataFrame.from_dict(responses, orient='index')
-    return responses
 
-
-# def make_salt():
-#     """Return an string as salt for anonym_txt function.
-#     Returns
-#     -------
-#     str
-#         The salt value is deliberately set to be a fixed value for all the usernames, because then we can generate the
-#         same hashed value for the same value in the UERNAME, REPLY_2USER, and USER_REPLY2 columns.
-#     """
-#     return str.encode('WhatsAppProject@2022')
+def get_top_responses(pairs, k=3, by=COLNAMES_DF.SENDER):
+    """Select the k pairs with most replies per user from reply pairs in coordinate format.
+    Parameters
+    ----------
+    pairs : pandas.DataFrame
+        Reply pairs as returned by ``get_response_pairs``
+    k : int
+        Number of pairs to keep per user
+    by : str
+        COLNAMES_DF.SENDER for who a user replies to most, COLNAMES_DF.RECEIVER for who replies
+        to a user most
+    Returns
+    -------
+    pandas.DataFrame
+        The selected pairs with their rank per user, ties ordered by username
+    """
+    other = COLNAMES_DF.RECEIVER if by == COLNAMES_DF.SENDER else COLNAMES_DF.SENDER
+    order = np.lexsort((pairs[other].cat.codes.to_numpy(), -pairs[COLNAMES_DF.REPLY_NO].to_numpy(),
+                        pairs[by].cat.codes.to_numpy()))
+    top = pairs.iloc[order].reset_index(drop=True)
+
+    # Rank within each user from the position of the user's first pair
+    codes = top[by].cat.codes.to_numpy()
+    positions = np.arange(len(top))
+    starts = np.ones(len(top), dtype=bool)
+    starts[1:] = codes[1:] != codes[:-1]
+    top[COLNAMES_DF.RANK] = positions - np.maximum.accumulate(np.where(starts, positions, 0)) + 1
+    return top[top[COLNAMES_DF.RANK] <= k].reset_index(drop=True)
+
+
+def get_top_repliers(pairs, k=3):
+    """Select the k users replying most often to each user.
+    Parameters
+    ----------
+    pairs : pandas.DataFrame
+        Reply pairs as returned by ``get_response_pairs``
+    k : int
+        Number of repliers to keep per user
+    Returns
+    -------
+    pandas.DataFrame
+        Receiver, sender, number of replies and rank of the top repliers
+    """
+    return get_top_responses(pairs, k, by=COLNAMES_DF.RECEIVER)
 
 
 def anonymize_participants(df_participants):
     """Anonymize text data.
     Anonymize USERNAME, REPLY_2USER, and USER_REPLY2 columns of the given DataFrame.
+    Pseudonyms are numbered in the order of the sorted usernames, so they do not depend on the
+    order of the rows.
     Parameters
     ----------
     df_participants : pandas.DataFrame
@@ -485,52 +1081,151 @@ def anonymize_participants(df_participants):
     pandas.DataFrame
         An anonymized DataFrame
     """
-    # salt = make_salt()
-    # df_participants[COLNAMES_DF.USERNAME] = df_participants[COLNAMES_DF.USERNAME].apply(lambda u: anonym_txt(u, salt))
-    # df_participants[COLNAMES_DF.REPLY_2USER] = df_participants[COLNAMES_DF.REPLY_2USER].apply(lambda u: anonym_txt(u,salt))
-    # df_participants[COLNAMES_DF.USER_REPLY2] = df_participants[COLNAMES_DF.USER_REPLY2].apply(lambda u: anonym_txt(u,salt))
-    # df_participants[['username', 'user_reply2']] = df_participants[['username', 'user_reply2']].stack().rank(method='dense').unstack()
-
-    stacked = df_participants[[COLNAMES_DF.USERNAME,COLNAMES_DF.USER_REPLY2, COLNAMES_DF.REPLY_2USER]].stack()
-    df_participants[[COLNAMES_DF.USERNAME,COLNAMES_DF.USER_REPLY2, COLNAMES_DF.REPLY_2USER]] = \
-        pd.Series(stacked.factorize()[0], index=stacked.index).unstack()
-    df_participants[[COLNAMES_DF.USERNAME,COLNAMES_DF.USER_REPLY2, COLNAMES_DF.REPLY_2USER]] = \
-        'person' + df_participants[[COLNAMES_DF.USERNAME,COLNAMES_DF.USER_REPLY2, COLNAMES_DF.REPLY_2USER]].astype(str)
+    columns = [COLNAMES_DF.USERNAME, COLNAMES_DF.USER_REPLY2, COLNAMES_DF.REPLY_2USER]
+    stacked = df_participants[columns].stack()
+    # Users without replies keep a missing value instead of becoming 'personnan'
+    pseudonyms = 'person' + pd.Series(stacked.factorize(sort=True)[0],
+                                      index=stacked.index).astype(str)
+    df_participants[columns] = pseudonyms.unstack().reindex(columns=columns)
     return df_participants
 
 
 def get_wide_to_long_participant(df):
-    """Generate one dataframe for each participant .
+    """Generate one long table with the features of all participants of all chats.
         Parameter
         ----------
         df : pandas.DataFrame
-           A DataFrame which includes participants and their features
+           A DataFrame which includes chats, participants and their features
 
-        anonymize : bool
-            Indicates if usernames should be anonymized
         Returns
         -------
-        list pandas.DataFrame
-            A list of pandas.DataFrame. Each data frame includes the description of features and their values extracted
-            from a specific participant
+        pandas.DataFrame
+            A pandas.DataFrame with the description of the features and their values per
+            participant of each chat. Chats keep their order, participants are sorted by
+            (pseudonymized) username. Missing and zero values are left out.
         """
-    results = []
-    df_melt = pd.melt(df, id_vars=[COLNAMES_DF.USERNAME], value_vars=[COLNAMES_DF.WORDS_NO, COLNAMES_DF.MESSAGE_NO,
-                                                                      COLNAMES_DF.FirstMessage, COLNAMES_DF.LastMessage,
-                                                                      COLNAMES_DF.URL_NO, COLNAMES_DF.FILE_NO,
-                                                                      COLNAMES_DF.LOCATION_NO,
-                                                                      COLNAMES_DF.REPLY_2USER,
-                                                                      COLNAMES_DF.USER_REPLY2],
-                      var_name=COLNAMES_DF.DESCRIPTION, value_name=COLNAMES_DF.VALUE)
-
-    usernames = sorted(set(df_melt[COLNAMES_DF.USERNAME]))
-    for u in usernames:
-        df_user = df_melt[(df_melt[COLNAMES_DF.USERNAME] == u) &
-                          df_melt[COLNAMES_DF.VALUE] != 0]
-
-        results.append(df_user)
+    chats = pd.Categorical(df[COLNAMES_DF.CHAT], categories=pd.unique(df[COLNAMES_DF.CHAT]))
+    df = df.assign(**{COLNAMES_DF.CHAT: chats}).sort_values(
+        [COLNAMES_DF.CHAT, COLNAMES_DF.USERNAME], kind='stable')
+
+    df_long = df.set_index([COLNAMES_DF.CHAT, COLNAMES_DF.USERNAME])[PARTICIPANT_FEATURES] \
+        .astype(object).stack(dropna=False) \
+        .rename_axis([COLNAMES_DF.CHAT, COLNAMES_DF.USERNAME, COLNAMES_DF.DESCRIPTION]) \
+        .rename(COLNAMES_DF.VALUE).reset_index()
+    df_long = df_long[df_long[COLNAMES_DF.VALUE].notna() & (df_long[COLNAMES_DF.VALUE] != 0)]
+    df_long[COLNAMES_DF.CHAT] = df_long[COLNAMES_DF.CHAT].astype(object)
+    return df_long.reset_index(drop=True)
+
+
+PARTICIPANT_AGGREGATES = {
+    COLNAMES_DF.WORDS_NO: 'sum',
+    COLNAMES_DF.URL_NO: 'sum',
+    COLNAMES_DF.LOCATION_NO: 'sum',
+    COLNAMES_DF.FILE_NO: 'sum',
+    COLNAMES_DF.MESSAGE_NO: 'sum',
+    COLNAMES_DF.FirstMessage: 'min',
+    COLNAMES_DF.LastMessage: 'max'
+}
 
-    return results
+
+def aggregate_participants(df_chat):
+    """Aggregate the message features of the given chat per participant.
+    The per message features are computed on demand and not stored on the chat.
+    Parameter
+    ----------
+    df_chat : pandas.DataFrame
+        A DataFrame including chat data, with the schema of ``add_schema``
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame indexed by sorted usernames with the columns of ``PARTICIPANT_AGGREGATES``
+    """
+    usernames = df_chat[COLNAMES_DF.USERNAME]
+    features = scan_messages(df_chat[COLNAMES_DF.MESSAGE])
+    features.index = df_chat.index
+    features[COLNAMES_DF.MESSAGE_NO] = 1
+
+    df_participants = features.groupby(usernames, observed=True).sum()
+    dates = df_chat[COLNAMES_DF.DATE].groupby(usernames, observed=True)
+    df_participants[COLNAMES_DF.FirstMessage] = dates.min()
+    df_participants[COLNAMES_DF.LastMessage] = dates.max()
+    # Grouping by observed categories keeps the order of appearance, rows are sorted by username
+    # like the streamed aggregation
+    df_participants.index = df_participants.index.astype(object)
+    return df_participants[list(PARTICIPANT_AGGREGATES)].sort_index()
+
+
+def count_emojis(df_chat):
+    """Count how often each participant uses each emoji, in one pass over the messages.
+    Parameter
+    ----------
+    df_chat : pandas.DataFrame
+        A DataFrame including chat data
+    Returns
+    -------
+    pandas.Series
+        Number of uses indexed by username and emoji
+    """
+    # Every emoji sequence has a non-ASCII character, so plain ASCII messages are skipped
+    candidates = df_chat[~df_chat[COLNAMES_DF.MESSAGE].map(str.isascii).astype(bool)]
+    df_emojis = pd.DataFrame({
+        COLNAMES_DF.USERNAME: candidates[COLNAMES_DF.USERNAME].astype(object),
+        COLNAMES_DF.EMOJI: candidates[COLNAMES_DF.MESSAGE].str.findall(compile_emoji_regex())
+    }).explode(COLNAMES_DF.EMOJI).dropna()
+    return df_emojis.groupby([COLNAMES_DF.USERNAME, COLNAMES_DF.EMOJI]).size() \
+        .rename(COLNAMES_DF.EMOJI_COUNT)
+
+
+def add_emoji_features(df_participants, emoji_counts):
+    """Add the number of emojis and the favorite emoji to the participant features.
+    Ties for the favorite emoji are broken by code point order.
+    Parameter
+    ----------
+    df_participants : pandas.DataFrame
+        A DataFrame which includes participants and their features
+    emoji_counts : pandas.Series
+        Emoji counts as returned by ``count_emojis``
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame which includes participants and their features
+    """
+    counts = emoji_counts.reset_index()
+    favorites = counts.sort_values([COLNAMES_DF.EMOJI_COUNT, COLNAMES_DF.EMOJI],
+                                   ascending=[False, True], kind='stable') \
+        .drop_duplicates(COLNAMES_DF.USERNAME).set_index(COLNAMES_DF.USERNAME)[COLNAMES_DF.EMOJI]
+    totals = counts.groupby(COLNAMES_DF.USERNAME)[COLNAMES_DF.EMOJI_COUNT].sum()
+
+    usernames = df_participants[COLNAMES_DF.USERNAME]
+    return df_participants.assign(**{
+        COLNAMES_DF.EMOJI_NO: usernames.map(totals).fillna(0).astype(np.int64),
+        COLNAMES_DF.EMOJI_Fav: usernames.map(favorites)
+    })
+
+
+def add_reply_features(df_participants, pairs):
+    """Add who replies to whom the most to the participant features.
+    Users who never reply, or are never replied to, get no value.
+    Parameter
+    ----------
+    df_participants : pandas.DataFrame
+        A DataFrame which includes participants and their features
+    pairs : pandas.DataFrame
+        Reply pairs as returned by ``get_response_pairs``
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame which includes participants and their features
+    """
+    def top_user(by, other):
+        top = get_top_responses(pairs, k=1, by=by)
+        return df_participants[COLNAMES_DF.USERNAME].map(
+            pd.Series(top[other].astype(object).to_numpy(), index=top[by].astype(object)))
+
+    return df_participants.assign(**{
+        COLNAMES_DF.USER_REPLY2: top_user(COLNAMES_DF.SENDER, COLNAMES_DF.RECEIVER),
+        COLNAMES_DF.REPLY_2USER: top_user(COLNAMES_DF.RECEIVER, COLNAMES_DF.SENDER)
+    })
 
 
 def get_participants_features(df_chat):
@@ -544,46 +1239,67 @@ def get_participants_features(df_chat):
     pandas.DataFrame
         A DataFrame which includes participants and their features
     """
-    # Calculate first message date
-    df_chat[COLNAMES_DF.FirstMessage] = df_chat[COLNAMES_DF.DATE].astype('datetime64[ns]')
-    # Calculate last message date
-    df_chat[COLNAMES_DF.LastMessage] = df_chat[COLNAMES_DF.DATE].astype('datetime64[ns]')
-    # Calculate the number of words in messages
-    df_chat[COLNAMES_DF.WORDS_NO] = df_chat['message'].apply(lambda x: len(x.split()))
-    # number of ulrs
-    df_chat[COLNAMES_DF.URL_NO] = df_chat["message"].apply(lambda x: len(re.findall(URL_PATTERN, x))).astype(int)
-    # number of locations
-    df_chat[COLNAMES_DF.LOCATION_NO] = df_chat["message"].apply(
-        lambda x: len(re.findall(LOCATION_PATTERN, x))).astype(int)
-    # number of files
-    df_chat[COLNAMES_DF.FILE_NO] = df_chat["message"].apply(lambda x: len(re.findall(ATTACH_FILE_PATTERN, x))).astype(
-        int)
-    # number of messages
-    df_chat[COLNAMES_DF.MESSAGE_NO] = 1
-
-    df_participants = df_chat.groupby(COLNAMES_DF.USERNAME).agg({
-        COLNAMES_DF.WORDS_NO: 'sum',
-        COLNAMES_DF.URL_NO: 'sum',
-        COLNAMES_DF.LOCATION_NO: 'sum',
-        COLNAMES_DF.FILE_NO: 'sum',
-        COLNAMES_DF.MESSAGE_NO: 'sum',
-        COLNAMES_DF.FirstMessage: 'min',
-        COLNAMES_DF.LastMessage: 'max'
-    }).reset_index()
-
-    response_matrix = get_response_matrix(df_chat)
-    user_reply2 = response_matrix.idxmax(axis=1)
-    reply2_user = response_matrix.T.idxmax(axis=1)
-
-    response_matrix[COLNAMES_DF.USER_REPLY2] = user_reply2
-    response_matrix[COLNAMES_DF.REPLY_2USER] = reply2_user
-    response_matrix.index.name = COLNAMES_DF.USERNAME
-    response_matrix = response_matrix.loc[:,[COLNAMES_DF.USER_REPLY2, COLNAMES_DF.REPLY_2USER]]
-    response_matrix = response_matrix.reset_index()
-
-    df_participants = pd.merge(df_participants, response_matrix, how="left", on=COLNAMES_DF.USERNAME, validate="1:1")
+    df_participants = aggregate_participants(df_chat).reset_index()
+    df_participants = add_emoji_features(df_participants, count_emojis(df_chat))
+
+    return add_reply_features(df_participants, get_response_pairs(df_chat))
+
+
+def get_participants_features_from_records(records, chunk_size=RECORDS_CHUNK_SIZE):
+    """Calculate participant features from a stream of chat records.
+    Records are processed ``chunk_size`` at a time, so the whole chat is never held in memory.
+    The result is the same as ``get_participants_features`` on the complete chat.
+    Parameter
+    ----------
+    records : iterable
+        (date, username, message) records in the order of the chat
+    chunk_size : int
+        Number of records processed at once
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame which includes participants and their features, None if there are no records
+    """
+    records = iter(records)
+    partials = []
+    emoji_counts = []
+    pairs = None
+    previous = []
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        df_chunk = add_schema(pd.DataFrame.from_records(
+            chunk, columns=[COLNAMES_DF.DATE, COLNAMES_DF.USERNAME, COLNAMES_DF.MESSAGE]))
+        partials.append(aggregate_participants(df_chunk))
+        emoji_counts.append(count_emojis(df_chunk))
+
+        # The last sender of the previous chunk is replied to by the first sender of this chunk
+        usernames = previous + df_chunk[COLNAMES_DF.USERNAME].tolist()
+        chunk_pairs = get_response_pairs(pd.DataFrame({COLNAMES_DF.USERNAME: usernames}))
+        chunk_pairs = chunk_pairs.astype({COLNAMES_DF.SENDER: object, COLNAMES_DF.RECEIVER: object})
+        if pairs is not None:
+            chunk_pairs = pd.concat([pairs, chunk_pairs]).groupby(
+                [COLNAMES_DF.SENDER, COLNAMES_DF.RECEIVER], as_index=False)[COLNAMES_DF.REPLY_NO] \
+                .sum()
+        pairs = chunk_pairs
+        previous = usernames[-1:]
+
+    if not partials:
+        return None
+    df_participants = pd.concat(partials).groupby(level=0).agg(PARTICIPANT_AGGREGATES)
+    df_participants.index.name = COLNAMES_DF.USERNAME
+    df_participants = df_participants.reset_index()
+    emoji_counts = pd.concat(emoji_counts).groupby(level=[0, 1]).sum()
+    df_participants = add_emoji_features(df_participants, emoji_counts)
+
+    users = df_participants[COLNAMES_DF.USERNAME]
+    pairs = count_response_pairs(
+        pd.Categorical(pairs[COLNAMES_DF.SENDER], categories=users).codes,
+        pd.Categorical(pairs[COLNAMES_DF.RECEIVER], categories=users).codes,
+        users, pairs[COLNAMES_DF.REPLY_NO].to_numpy())
+    return add_reply_features(df_participants, pairs)
 
-    return df_participants
 
 def remove_system_messages(log_error, chat):
     """Removes system messages from chat
@@ -606,7 +1322,8 @@ def remove_system_messages(log_error, chat):
 
     return chat
 
-def extract_participants_features(chat, anonymize=True):
+
+def extract_participants_features(chat, anonymize=True, label='chat1'):
     """Parse the given zip file.
     Parameters
     ----------
@@ -614,42 +1331,174 @@ def extract_participants_features(chat, anonymize=True):
         A DataFrame that includes chat data
     anonymize : bool
         Indicates if usernames should be anonymized
+    label : str
+        Label of the chat in the results
     Returns
     -------
-    list
-        A list of DataFrames which include participant features
+    pandas.DataFrame
+        A long table which includes participant features
     """
 
     df = get_participants_features(chat)
+    df.insert(0, COLNAMES_DF.CHAT, label)
     if anonymize:
-        df= anonymize_participants(df)
+        df = anonymize_participants(df)
 
     results = get_wide_to_long_participant(df)
     return results
 
+
+def stream_participants(log_error, f):
+    """Calculate participant features from a chat file without holding the chat in memory.
+    The chat is streamed with the best ranked header format; when a header turns out to be out
+    of range for it, the chat is streamed again with the next format.
+    Parameters
+    ----------
+    log_error : list
+        List of error messages
+    f : file object
+        Seekable binary chat file, e.g. a member opened with ``zipfile.ZipFile.open``
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame which includes participants and their features, None if no format matches
+    Raises
+    ------
+    UnicodeDecodeError
+        When the file is not utf-8 encoded
+    """
+    for hformat in sniff_chat_file(f):
+        f.seek(0)
+        # Errors of an attempt are only reported when the chat is parsed with its format
+        errors = []
+        try:
+            records = remove_system_records(
+                errors.append, iter_chat_records(errors.append, f, hformat=hformat))
+            df = get_participants_features_from_records(records)
+        except UnicodeDecodeError:
+            raise
+        except ValueError:
+            # The next format is tried
+            continue
+        for error in errors:
+            log_error(error)
+        return df
+    log_error("hformats did not match the provided text. No match was found")
+    return None
+
+
+def chat_participants(log_error, zfile, name):
+    """Calculate the participant features of one chat file in the zip file.
+    Chat files larger than ``STREAMING_THRESHOLD`` are streamed.
+    Parameters
+    ----------
+    log_error : list
+        List of error messages
+    zfile : ZipFile object
+        Zip file with chat files
+    name : str
+        Name of the chat file in the zip file
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame which includes participants and their features, None if the chat is not valid
+    """
+    if zfile.getinfo(name).file_size <= STREAMING_THRESHOLD:
+        chat = decode_chat(log_error, zfile.read(name), name)
+        if chat is None:
+            return None
+        return get_participants_features(remove_system_messages(log_error, chat))
+
+    try:
+        with zfile.open(name) as f:
+            return stream_participants(log_error, f)
+    except UnicodeDecodeError:
+        log_error(f"Could not decode to utf-8: {name}")
+        return None
+
+
+def chat_participants_job(job):
+    """Run ``chat_participants`` for a (source, name) pair, in a worker.
+    Parameters
+    ----------
+    job : tuple
+        Zip file object or path of the zip file, and the name of the chat file
+    Returns
+    -------
+    tuple
+        The participant features (or None) and the list of error messages
+    """
+    source, name = job
+    errors = []
+    if isinstance(source, zipfile.ZipFile):
+        return chat_participants(errors.append, source, name), errors
+    with zipfile.ZipFile(source) as zfile:
+        return chat_participants(errors.append, zfile, name), errors
+
+
+def zipfile_participants(log_error, zfile, path=None, max_workers=None):
+    """Calculate the participant features of every chat file in the zip file concurrently.
+    Parameters
+    ----------
+    log_error : list
+        List of error messages
+    zfile : ZipFile object
+        Zip file with chat files
+    path : str or os.PathLike
+        Path of the zip file, makes it possible to parse large archives in a process pool
+    max_workers : int
+        Maximum number of workers, 1 parses the chats serially
+    Returns
+    -------
+    pandas.DataFrame
+        Participants and their features of all chats. The chat column holds a label (chat1, chat2,
+        ...) of the chat file the row is extracted from. None if no chat is valid.
+    """
+    names = chat_names(zfile)
+    chat_size = sum(zfile.getinfo(name).file_size for name in names)
+    processes = path is not None and chat_size > PROCESS_POOL_THRESHOLD
+    source = path if processes else zfile
+    results = run_concurrently(chat_participants_job, [(source, name) for name in names],
+                               max_workers=max_workers, processes=processes)
+
+    frames = []
+    for number, (df, errors) in enumerate(results, start=1):
+        label = f"chat{number}"
+        for error in errors:
+            log_error(f"{label}: {error}")
+        if df is not None:
+            df.insert(0, COLNAMES_DF.CHAT, label)
+            frames.append(df)
+
+    if not frames:
+        log_error("No valid chat file is available")
+        return None
+    return pd.concat(frames, ignore_index=True)
+
 # ***** end of analysis functions *****
 
 
-def format_results(df_list, error):
+def format_results(df_participants, error):
     """Format results to the standard format.
+    All participants are returned in one table, so it is rendered only once.
     Parameters
     ----------
-    df_list: pandas.dataframe
+    df_participants: pandas.dataframe
+        Long table with the features of all participants
+    error: list
+        Formatted errors
     Returns
     -------
-    pandas.dataframe
+    list
     """
-    results = []
-    for df in df_list:
-        user_name = pd.unique(df[COLNAMES_DF.USERNAME])[0]
-        results.append(
-            {
-                "id": user_name,
-                "title": user_name,
-                "data_frame": df[[COLNAMES_DF.DESCRIPTION,COLNAMES_DF.VALUE]].reset_index(drop=True)
-            }
-        )
-    if len(error)>0:
+    results = [
+        {
+            "id": "participants",
+            "title": "Participants",
+            "data_frame": df_participants
+        }
+    ]
+    if len(error) > 0:
         results = results+error
     return results
 
@@ -686,26 +1535,26 @@ def process(file_data):
     errors = []
     log_error = errors.append
 
+    df_participants = None
     try:
         zfile = zipfile.ZipFile(file_data)
-    except:
+    except Exception:
         if FILE_RE.match(file_data.name):
             tfile = open(file_data, encoding="utf8")
             chat = parse_chat(log_error, tfile.read())
+            if chat is not None:
+                df_participants = get_participants_features(remove_system_messages(log_error, chat))
+                df_participants.insert(0, COLNAMES_DF.CHAT, 'chat1')
 
         else:
             log_error("There is not a valid file format.")
             return format_errors(errors)
     else:
-        chat = parse_zipfile(log_error, zfile)
-
-    if chat is not None:
-        chat = remove_system_messages(log_error,chat)
-        participants = extract_participants_features(chat)
+        path = file_data if isinstance(file_data, (str, os.PathLike)) else None
+        df_participants = zipfile_participants(log_error, zfile, path)
 
-        formatted_results = format_results(participants, format_errors(errors))
-
-    else:
+    if df_participants is None:
         return format_errors(errors)
 
-    return formatted_results
+    participants = get_wide_to_long_participant(anonymize_participants(df_participants))
+    return format_results(participants, format_errors(errors))
@@ -0,0 +1,139 @@
+""" Script to benchmark the WhatsApp chat extractor on simulated chats """
+
+import argparse
+import gc
+import io
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+import whatsapp_chat
+from whatsapp_chat import hformats
+from whatsapp_chat.simulation_wac import create_zip
+
+
+# Fraction by which throughput may drop below the baseline before it is flagged
+TOLERANCE = 0.2
+
+
+def _measure(func, repeat: int):
+    """ Time a function and measure its peak memory
+    Timing and memory tracing are done in separate runs, since tracing slows down the code.
+    Args:
+        func: callable without arguments
+        repeat: int, number of timed runs, the fastest one is reported
+    Returns:
+        seconds: float, fastest wall time
+        peak_mb: float, peak of traced memory in MB
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 2**20
+
+
+def benchmark(num: int, participants: int, hformat: str = hformats[1], seed: int = 0,
+              repeat: int = 3, path=None):
+    """ Benchmark parse_chat, get_participants_features and process on one simulated chat
+    Args:
+        num: int, number of messages
+        participants: int, number of participants
+        hformat: str, simplified syntax for the header
+        seed: int, sets seed
+        repeat: int, number of timed runs per step
+        path: str, folder to write the simulated zipfile to, a temporary folder if None
+    Returns:
+        results: pd.DataFrame, seconds, messages/s, MB/s (of uncompressed chat text)
+            and peak memory (MB) per step
+    """
+    with TemporaryDirectory() as tmp:
+        zip_path, stats = create_zip(path or tmp, num, participants, hformat, seed)
+        with zipfile.ZipFile(zip_path) as zfile:
+            text = zfile.read("_chat.txt").decode("utf-8")
+        text_mb = len(text.encode("utf-8")) / 2**20
+        errors = []
+        chat = whatsapp_chat.parse_chat(errors.append, text)
+
+        steps = {
+            "parse_chat": (lambda: whatsapp_chat.parse_chat(errors.append, text), text_mb),
+            "get_participants_features": (
+                lambda: whatsapp_chat.get_participants_features(chat), text_mb),
+            "process": (lambda: whatsapp_chat.process(
+                io.BytesIO(zip_path.read_bytes())), text_mb),
+        }
+        results = []
+        for step, (func, megabytes) in steps.items():
+            seconds, peak_mb = _measure(func, repeat)
+            results.append({
+                "step": step,
+                "messages": num,
+                "participants": participants,
+                "hformat": hformat,
+                "seconds": seconds,
+                "messages/s": sum(stats["messages"].values()) / seconds,
+                "MB/s": megabytes / seconds,
+                "peak MB": peak_mb
+            })
+    return pd.DataFrame(results)
+
+
+def compare(results: pd.DataFrame, baseline: pd.DataFrame, tolerance: float = TOLERANCE):
+    """ Compare benchmark results with a baseline
+    Args:
+        results: pd.DataFrame, output of benchmark
+        baseline: pd.DataFrame, earlier output of benchmark
+        tolerance: float, allowed relative drop in throughput
+    Returns:
+        comparison: pd.DataFrame, relative throughput per step and whether it regressed
+    """
+    keys = ["step", "messages", "participants", "hformat"]
+    comparison = results.merge(baseline, on=keys, suffixes=("", " baseline"))
+    comparison["speedup"] = comparison["messages/s"] / comparison["messages/s baseline"]
+    comparison["regression"] = comparison["speedup"] < 1 - tolerance
+    return comparison[keys + ["messages/s", "messages/s baseline", "speedup", "regression"]]
+
+
+def main():
+    """ Run the benchmark from the command line """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10**3, 10**4, 10**5])
+    parser.add_argument("--participants", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--all-formats", action="store_true",
+                        help="benchmark every header format instead of only the default")
+    parser.add_argument("--baseline", type=Path, help="csv with earlier results to compare")
+    parser.add_argument("--output", type=Path, help="csv to save the results in")
+    args = parser.parse_args()
+
+    formats = hformats if args.all_formats else [hformats[1]]
+    results = pd.concat([
+        benchmark(num, args.participants, hformat, args.seed, args.repeat)
+        for num in args.messages for hformat in formats
+    ], ignore_index=True)
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if args.baseline:
+        comparison = compare(results, pd.read_csv(args.baseline))
+        print(comparison.to_string(index=False))
+        if comparison["regression"].any():
+            raise SystemExit("Throughput regressed compared to the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+""" Script to create simulated WhatsApp chat exports """
+
+import io
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from faker import Faker
+
+from whatsapp_chat import hformats
+
+
+START = datetime(2019, 1, 1, 8, 0, 0)
+# Mean number of seconds between two messages
+MEAN_GAP = 600
+EMOJIS = ("😁", "👍", "👍🏽", "❤️", "😂", "🇳🇱", "👨‍👩‍👧", "🎉", "1️⃣")
+# Probability of each kind of message
+MESSAGE_KINDS = {
+    "text": 0.70,
+    "multiline": 0.10,
+    "url": 0.06,
+    "location": 0.03,
+    "attachment": 0.05,
+    "emoji": 0.06
+}
+# Probability that a message is followed by a system alert (e.g. someone joined)
+ALERT_RATE = 0.01
+VOCABULARY_SIZE = 500
+
+
+def _header_format(hformat):
+    """ Convert a simplified header syntax to a strftime format
+    Args:
+        hformat: str, simplified syntax for the header, e.g. '%d-%m-%y %H:%M - %name:'
+    Returns:
+        header: str, strftime format with a '{name}' placeholder and the trailing space
+        alert: str, strftime format of an alert header, which has no username
+    """
+    header = hformat.replace("%name", "{name}") + " "
+    alert = hformat.split("%name")[0]
+    return header, alert
+
+
+def _create_participants(num: int, fake: Faker):
+    """ Create unique participant names
+    Args:
+        num: int, number of participants
+        fake: Faker, seeded Faker instance
+    Returns:
+        participants: list, names without colons
+    """
+    participants = []
+    seen = set()
+    while len(participants) < num:
+        name = fake.name().replace(":", "")
+        if name in seen:
+            name = f"{name} {len(participants)}"
+        seen.add(name)
+        participants.append(name)
+    return participants
+
+
+def _create_message(kind: str, rng: random.Random, vocabulary: list):
+    """ Create the text of one message
+    Args:
+        kind: str, one of MESSAGE_KINDS
+        rng: random.Random, seeded random generator
+        vocabulary: list, words to build sentences from
+    Returns:
+        message: str, message text, possibly spanning multiple lines
+    """
+    def sentence():
+        return " ".join(rng.choices(vocabulary, k=rng.randint(1, 20)))
+
+    if kind == "multiline":
+        return "\n".join(sentence() for _ in range(rng.randint(2, 4)))
+    if kind == "url":
+        return f"{sentence()} https://www.{rng.choice(vocabulary)}.nl/{rng.randint(1, 10**6)}"
+    if kind == "location":
+        return (f"Location: https://maps.google.com/?q="
+                f"{rng.uniform(50.8, 53.5):.6f},{rng.uniform(3.4, 7.2):.6f}")
+    if kind == "attachment":
+        return f"<attached: {rng.randint(1, 10**8):08d}-PHOTO.jpg>"
+    if kind == "emoji":
+        return f"{sentence()} {''.join(rng.choices(EMOJIS, k=rng.randint(1, 3)))}"
+    return sentence()
+
+
+def write_chat(file, num: int, participants: int, hformat: str = hformats[1], seed: int = 0):
+    """ Write a simulated chat, message by message, to a text file
+    Args:
+        file: text file object to write to
+        num: int, number of messages
+        participants: int, number of participants
+        hformat: str, one of whatsapp_chat.hformats (or its day/month swapped variant)
+        seed: int, sets seed
+    Returns:
+        stats: dict, number of messages per participant ('messages'), and the number of
+            'urls', 'locations', 'attachments', 'alerts' and 'lines' written
+    """
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    names = _create_participants(participants, fake)
+    vocabulary = list(dict.fromkeys(fake.words(nb=VOCABULARY_SIZE)))
+    kinds = list(MESSAGE_KINDS)
+    weights = list(MESSAGE_KINDS.values())
+    header, alert = _header_format(hformat)
+
+    stats = {"messages": Counter(), "urls": 0, "locations": 0, "attachments": 0,
+             "alerts": 0, "lines": 0}
+    date = START
+    for _ in range(num):
+        date += timedelta(seconds=int(rng.expovariate(1 / MEAN_GAP)) + 1)
+        name = rng.choice(names)
+        kind = rng.choices(kinds, weights)[0]
+        message = _create_message(kind, rng, vocabulary)
+        file.write(date.strftime(header).format(name=name) + message + "\n")
+        stats["messages"][name] += 1
+        stats["urls"] += kind in ("url", "location")
+        stats["locations"] += kind == "location"
+        stats["attachments"] += kind == "attachment"
+        stats["lines"] += message.count("\n") + 1
+        if rng.random() < ALERT_RATE:
+            file.write(date.strftime(alert) + f"{name} added {rng.choice(names)}\n")
+            stats["alerts"] += 1
+            stats["lines"] += 1
+    return stats
+
+
+def create_chat(num: int, participants: int, hformat: str = hformats[1], seed: int = 0):
+    """ Create a simulated chat as a string
+    Args:
+        num: int, number of messages
+        participants: int, number of participants
+        hformat: str, simplified syntax for the header
+        seed: int, sets seed
+    Returns:
+        chat: str, simulated chat text
+        stats: dict, see write_chat
+    """
+    buffer = io.StringIO()
+    stats = write_chat(buffer, num, participants, hformat, seed)
+    return buffer.getvalue(), stats
+
+
+def create_zip(path, num: int, participants: int, hformat: str = hformats[1], seed: int = 0):
+    """ Save a simulated chat in a zipped WhatsApp export, without holding it in memory
+    Args:
+        path: str, folder to save the zipfile in
+        num: int, number of messages
+        participants: int, number of participants
+        hformat: str, simplified syntax for the header
+        seed: int, sets seed
+    Returns:
+        zipfile: pathlib.Path, path of the created zipfile
+        stats: dict, see write_chat
+    """
+    zipfile = Path(path) / 'whatsapp_chat_simulated.zip'
+    with ZipFile(zipfile, 'w', compression=ZIP_DEFLATED) as zipped_f:
+        with zipped_f.open("_chat.txt", "w", force_zip64=True) as binary:
+            with io.TextIOWrapper(binary, encoding="utf-8", newline="\n") as file:
+                stats = write_chat(file, num, participants, hformat, seed)
+    return zipfile, stats
+
+
+if __name__ == "__main__":
+    zip_file, _ = create_zip("tests/data", num=10000, participants=25, seed=0)
+    print(f'Created simulated WhatsApp chat in {zip_file}')